@@ -392,6 +392,7 @@ const DataSetViewModel = DataSetModel.extend({
         cellsRequest.columnStart = viewport.left;
         cellsRequest.rowEnd      = viewport.bottom;
         cellsRequest.columnEnd   = viewport.right;
+        cellsRequest.packed      = true;
 
         let request = new coms.Messages.ComsMessage();
         request.payload = cellsRequest.toArrayBuffer();
@@ -402,6 +403,10 @@ const DataSetViewModel = DataSetModel.extend({
 
             let cellsResponse = coms.Messages.DataSetRR.decode(response.payload);
 
+            // superseded by a later request, which has the cells instead
+            if (cellsResponse.incData === false)
+                return null;
+
             let columns = cellsResponse.data;
 
             let rowStart    = cellsResponse.rowStart;
@@ -418,6 +423,11 @@ const DataSetViewModel = DataSetModel.extend({
 
             for (let colNo = 0; colNo < columnCount; colNo++) {
 
+                if (cellsResponse.packed) {
+                    cells[colNo] = this._unpackColumn(cellsResponse.packedData[colNo]);
+                    continue;
+                }
+
                 let column = columns[colNo];
                 let values = Array(column.values.length);
 
@@ -440,6 +450,32 @@ const DataSetViewModel = DataSetModel.extend({
 
         }).done();
     },
+    _unpackColumn(column) {
+
+        let source = column.d.length > 0 ? column.d : column.i;
+        let missing = column.missing;
+
+        // text columns come with their levels; the values are their codes
+        let labels = null;
+        if (column.levels.length > 0) {
+            labels = { };
+            for (let level of column.levels)
+                labels[level.value] = level.label;
+        }
+
+        let values = Array(source.length);
+
+        for (let i = 0; i < source.length; i++) {
+            if (missing.length > 0 && (missing[i >> 5] & (1 << (i & 31))) !== 0)
+                values[i] = null;
+            else if (labels !== null)
+                values[i] = labels[source[i]];
+            else
+                values[i] = source[i];
+        }
+
+        return values;
+    },
     changeCells(viewport, cells) {
 
         let nRows = viewport.bottom - viewport.top + 1;
@@ -560,6 +596,48 @@ const DataSetViewModel = DataSetModel.extend({
 
         this.trigger("cellsChanged", { left: left, top: top, right: right, bottom: bottom });
     },
+    insertRows(rowStart, rowEnd) {
+        return this._changeRows('insertRows', [ { rowStart: rowStart, rowEnd: rowEnd } ]);
+    },
+    deleteRows(ranges) {
+        return this._changeRows('deleteRows', ranges);
+    },
+    _changeRows(field, ranges) {
+
+        let coms = this.attributes.coms;
+
+        let rowsRequest = new coms.Messages.DataSetRR();
+        rowsRequest.op = coms.Messages.GetSet.SET;
+
+        for (let range of ranges) {
+            let rangePB = new coms.Messages.DataSetRR.RowRange();
+            rangePB.rowStart = range.rowStart;
+            rangePB.rowEnd   = range.rowEnd;
+            rowsRequest[field].push(rangePB);
+        }
+
+        let request = new coms.Messages.ComsMessage();
+        request.payload = rowsRequest.toArrayBuffer();
+        request.payloadType = "DataSetRR";
+        request.instanceId = this.attributes.instanceId;
+
+        return coms.send(request).then(response => {
+
+            let datasetPB = coms.Messages.DataSetRR.decode(response.payload);
+
+            // every column's cells have moved
+            let changed = [ ];
+            let changes = [ ];
+            for (let column of this.attributes.columns) {
+                changed.push(column.name);
+                changes.push({ id: column.id, oldName: column.name, dataChanged: true });
+            }
+
+            this.set('rowCount', datasetPB.rowCount);
+            this.set('edited', true);
+            this.trigger('columnsChanged', { changed, changes });
+        });
+    },
     _columnsChanged(event) {
 
         for (let changes of event.changes) {
@@ -53,6 +53,7 @@ const Instance = Backbone.Model.extend({
         title : '',
         resultsMode : 'rich',
         blank : false,
+        progress : null,
     },
     instanceId() {
         return this._instanceId;
@@ -127,7 +128,8 @@ const Instance = Backbone.Model.extend({
             };
 
             let onprogress = (progress) => {
-                console.log(progress);
+                let pg = coms.Messages.Progress.decode(progress.payload);
+                this.set('progress', [ pg.progress, pg.total ]);
             };
 
             let onreject = (error) => {
@@ -392,7 +394,17 @@ const Instance = Backbone.Model.extend({
             }
 
             if (analysis.isReady && _.has(response, "results") && response.results !== null) {
-                analysis.setResults(response.results, response.incAsText, response.syntax);
+                let results = response.results;
+                if (response.delta) {
+                    try {
+                        results = this._applyDelta(analysis.results, results);
+                    }
+                    catch (e) {
+                        this._resendResults(analysis);
+                        return;
+                    }
+                }
+                analysis.setResults(results, response.incAsText, response.syntax);
                 ok = true;
             }
 
@@ -402,6 +414,52 @@ const Instance = Backbone.Model.extend({
             }
         }
     },
+    _applyDelta(results, delta) {
+
+        // elements marked unchanged are as they were in the results last
+        // received. the children of groups and arrays are matched by name
+
+        if (delta.unchanged) {
+            if (results === null || results.name !== delta.name)
+                throw 'Results delta does not apply';
+            return results;
+        }
+
+        for (let type of [ 'group', 'array' ]) {
+            if (delta[type] === null)
+                continue;
+
+            let children = { };
+            if (results !== null && results[type] !== null) {
+                for (let child of results[type].elements)
+                    children[child.name] = child;
+            }
+
+            let elements = delta[type].elements;
+            for (let i = 0; i < elements.length; i++) {
+                let child = elements[i];
+                let old = _.has(children, child.name) ? children[child.name] : null;
+                elements[i] = this._applyDelta(old, child);
+            }
+        }
+
+        return delta;
+    },
+    _resendResults(analysis) {
+
+        let coms = this.attributes.coms;
+
+        let analysisRequest = new coms.Messages.AnalysisRequest();
+        analysisRequest.analysisId = analysis.id;
+        analysisRequest.resendResults = true;
+
+        let request = new coms.Messages.ComsMessage();
+        request.payload = analysisRequest.toArrayBuffer();
+        request.payloadType = 'AnalysisRequest';
+        request.instanceId = this._instanceId;
+
+        coms.sendP(request);
+    },
     _columnsChanged(event) {
 
         this._dataSetModel.set('edited', true);
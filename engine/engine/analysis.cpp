@@ -18,6 +18,7 @@ Analysis::Analysis(int id, std::string name, std::string ns, std::string options
     this->revision = revision;
     this->perform = 2;
     this->clearState = false;
+    this->aborted = false;
 
     stringstream ss;
     ss << setfill('0') << setw(2);
@@ -26,6 +26,7 @@ public:
     int perform;
     std::list<std::string> changed;
     bool clearState;
+    bool aborted;
 
     bool requiresDataset;
     std::string datasetId;
@@ -30,12 +30,15 @@ Engine::Engine()
     _exiting = false;
     _waiting = NULL;
     _running = NULL;
+    _abort = false;
 
     _R = new EngineR();
 
     _coms.analysisRequested.connect(bind(&Engine::analysisRequested, this, _1, _2));
     _coms.restartRequested.connect(bind(&Engine::terminate, this));
+    _coms.abortRequested.connect(bind(&Engine::abort, this));
     _R->resultsReceived.connect(bind(&Engine::resultsReceived, this, _1));
+    _R->columnsRead.connect(bind(&Engine::columnsRead, this, _1, _2));
 }
 
 void Engine::setSlave(bool slave)
@@ -72,6 +75,16 @@ void Engine::start()
     if (_conId < 0)
         throw runtime_error("Unable to connect : could not connect to endpoint");
 
+    // R is initialised by now, so the server can start sending analyses
+
+    ComsMessage ready;
+    ready.set_id(0);
+    ready.set_payloadtype("EngineReady");
+
+    string data;
+    ready.SerializeToString(&data);
+    nn_send(_socket, data.data(), data.size(), 0);
+
     // start the message loop thread
     thread t(&Engine::messageLoop, this);
 
@@ -82,6 +95,10 @@ void Engine::start()
     checkForNew = std::bind(&Engine::waiting, this);
     _R->setCheckForNewCB(checkForNew);
 
+    std::function<bool()> checkForAbort;
+    checkForAbort = std::bind(&Engine::aborting, this);
+    _R->setCheckForAbortCB(checkForAbort);
+
     while (true)
     {
         lock.lock(); // lock to access _waiting
@@ -91,10 +108,15 @@ void Engine::start()
 
         _running = _waiting;
         _waiting = NULL;
+        _abort = false;  // aborts only apply to the run in progress
 
         lock.unlock();
 
         _R->run(_running);
+
+        if (_running->aborted)
+            analysisAborted(_running);
+
         delete _running;
         _running = NULL;
     }
@@ -107,6 +129,22 @@ void Engine::terminate()
     std::exit(0);
 }
 
+void Engine::abort()
+{
+    // this is called from the message loop thread
+
+    lock_guard<mutex> lock(_mutex);
+    _abort = true;
+}
+
+bool Engine::aborting()
+{
+    // called from the main loop, at checkpoints
+
+    lock_guard<mutex> lock(_mutex);
+    return _abort;
+}
+
 Analysis *Engine::waiting()
 {
     // called from the main loop
@@ -145,6 +183,51 @@ void Engine::resultsReceived(const string &results)
     nn_send(_socket, data.data(), data.size(), 0);
 }
 
+void Engine::analysisAborted(Analysis *analysis)
+{
+    // lets the server know the engine stopped the run early
+
+    AnalysisResponse response;
+
+    response.set_datasetid(analysis->datasetId);
+    response.set_analysisid(analysis->id);
+    response.set_revision(analysis->revision);
+    response.set_status(ANALYSIS_ABORTED);
+
+    string data;
+    response.SerializeToString(&data);
+
+    resultsReceived(data);
+}
+
+void Engine::columnsRead(const vector<string> &names, const vector<int> &versions)
+{
+    // lets the server know which columns (and versions) the running
+    // analysis depends on
+
+    ColumnsRead columns;
+
+    columns.set_analysisid(_running->id);
+    columns.set_revision(_running->revision);
+
+    for (const string &name : names)
+        columns.add_names(name);
+    for (int version : versions)
+        columns.add_versions(version);
+
+    ComsMessage message;
+
+    message.set_id(_currentRequestId);
+    columns.SerializeToString(message.mutable_payload());
+    message.set_payloadtype("ColumnsRead");
+
+    string data;
+
+    message.SerializeToString(&data);
+
+    nn_send(_socket, data.data(), data.size(), 0);
+}
+
 void Engine::messageLoop()
 {
     // message loop runs in its own thread
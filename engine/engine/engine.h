@@ -8,6 +8,7 @@
 #include "engine.h"
 
 #include <string>
+#include <vector>
 #include <thread>
 #include <mutex>
 #include <condition_variable>
@@ -32,8 +33,12 @@ private:
     void messageLoop();
     void analysisRequested(int requestId, Analysis *analysis);
     void resultsReceived(const std::string &results);
+    void analysisAborted(Analysis *analysis);
+    void columnsRead(const std::vector<std::string> &names, const std::vector<int> &versions);
     void terminate();
+    void abort();
     Analysis *waiting();
+    bool aborting();
 
     EngineComs _coms;
 
@@ -53,6 +58,7 @@ private:
 
     Analysis *_waiting;
     Analysis *_running;
+    bool _abort;
 };
 
 #endif // ENGINE_H
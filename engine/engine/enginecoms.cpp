@@ -62,6 +62,12 @@ void EngineComs::parse(char *data, int len)
         return;
     }
 
+    if (analysisRequest.perform() == AnalysisRequest::ABORT)
+    {
+        abortRequested();
+        return;
+    }
+
     std::string options;
     analysisRequest.options().SerializeToString(&options);
 
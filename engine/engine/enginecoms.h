@@ -17,6 +17,7 @@ public:
 
     boost::signals2::signal<void (int requestId, Analysis *analysis)> analysisRequested;
     boost::signals2::signal<void ()> restartRequested;
+    boost::signals2::signal<void ()> abortRequested;
 
     void parse(char *data, int len);
 
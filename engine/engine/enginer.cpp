@@ -115,6 +115,9 @@ void EngineR::run(Analysis *analysis)
     }
     else
     {
+        if (stopRequested())
+            return;
+
         bool shouldSend = rInside.parseEvalNT("analysis$run(noThrow=TRUE);");
         if ( ! shouldSend)
             return;
@@ -169,11 +172,23 @@ void EngineR::setLibPaths(const std::string &moduleName)
     _rInside->parseEvalQNT(ss.str());
 }
 
-SEXP EngineR::checkpoint(SEXP results)
+bool EngineR::stopRequested()
 {
-    Analysis *analysis = _checkForNew();
+    // a new revision of the analysis is waiting, or the server has asked
+    // for the run to stop
+
+    if (_checkForNew() != NULL || _checkForAbort())
+    {
+        _current->aborted = true;
+        return true;
+    }
 
-    if (analysis != NULL)
+    return false;
+}
+
+SEXP EngineR::checkpoint(SEXP results)
+{
+    if (stopRequested())
         return Rcpp::CharacterVector("restart");
 
     if ( ! Rf_isNull(results)) {
@@ -215,6 +230,9 @@ Rcpp::DataFrame EngineR::readDataset(const string &datasetId, Rcpp::List columns
 
     int index = 0;
 
+    vector<string> namesRead;
+    vector<int> versionsRead;
+
     for (int i = 0; i < columnCount; i++)
     {
         Column column = dataset[i];
@@ -231,14 +249,18 @@ Rcpp::DataFrame EngineR::readDataset(const string &datasetId, Rcpp::List columns
         if ( ! required)
             continue;
 
+        namesRead.push_back(columnName);
+        versionsRead.push_back(column.dataVersion());
+
         columnNames[index] = columnName;
 
         if (column.measureType() == MeasureType::CONTINUOUS)
         {
             Rcpp::NumericVector v(rowCount, Rcpp::NumericVector::get_na());
 
-            for (int j = 0; j < rowCount; j++)
-                v[j] = column.value<double>(j);
+            // copied a block at a time (or all at once, if contiguous)
+            if (rowCount > 0)
+                column.values<double>(0, rowCount, v.begin());
 
             columns[index] = v;
         }
@@ -268,9 +290,12 @@ Rcpp::DataFrame EngineR::readDataset(const string &datasetId, Rcpp::List columns
 
             Rcpp::IntegerVector v(rowCount, MISSING);
 
+            if (rowCount > 0)
+                column.values<int>(0, rowCount, v.begin());
+
             for (j = 0; j < rowCount; j++)
             {
-                int value = column.value<int>(j);
+                int value = v[j];
                 if (value != MISSING)
                     v[j] = indexes[value];
             }
@@ -299,6 +324,20 @@ Rcpp::DataFrame EngineR::readDataset(const string &datasetId, Rcpp::List columns
     columns.attr("row.names") = rowNames;
     columns.attr("class") = "data.frame";
 
+    // columns asked for which don't exist are reported too, so the
+    // analysis is rerun if they're added
+
+    for (string name : columnsRequired)
+    {
+        if (std::find(namesRead.begin(), namesRead.end(), name) == namesRead.end())
+        {
+            namesRead.push_back(name);
+            versionsRead.push_back(-1);
+        }
+    }
+
+    columnsRead(namesRead, versionsRead);
+
     return columns;
 }
 
@@ -307,6 +346,11 @@ void EngineR::setCheckForNewCB(std::function<Analysis*()> check)
     _checkForNew = check;
 }
 
+void EngineR::setCheckForAbortCB(std::function<bool()> check)
+{
+    _checkForAbort = check;
+}
+
 string EngineR::analysisDirPath(const std::string &datasetId, const string &analysisId)
 {
     stringstream ss;
@@ -368,6 +412,10 @@ void EngineR::initR()
 
     // calls to methods functions on windows fail without this
     _rInside->parseEvalQNT("suppressPackageStartupMessages(library('methods'))");
+
+    // the base module is loaded up front, so the first analysis doesn't
+    // wait for it
+    _rInside->parseEvalQNT("try(suppressPackageStartupMessages(loadNamespace('jmv')), silent=TRUE)");
 }
 
 string EngineR::makeAbsolute(const string &paths)
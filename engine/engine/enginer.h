@@ -25,8 +25,10 @@ public:
     void run(Analysis *analysis);
     void setPath(const std::string &path);
     void setCheckForNewCB(std::function<Analysis*()> check);
+    void setCheckForAbortCB(std::function<bool()> check);
 
     boost::signals2::signal<void (const std::string &)> resultsReceived;
+    boost::signals2::signal<void (const std::vector<std::string> &, const std::vector<int> &)> columnsRead;
 
 private:
 
@@ -34,8 +36,10 @@ private:
 
     void initR();
     SEXP checkpoint(SEXP results = R_NilValue);
+    bool stopRequested();
 
     std::function<Analysis*()> _checkForNew;
+    std::function<bool()> _checkForAbort;
 
     Rcpp::DataFrame readDataset(const std::string &datasetId, Rcpp::List columns, bool headerOnly);
     std::string analysisDirPath(const std::string &datasetId, const std::string &analysisId);
@@ -13,11 +13,11 @@
 
 using namespace std;
 
-Column::Column(DataSet *parent, MemoryMap *mm, ColumnStruct *rel)
+Column::Column(DataSet *parent, MemoryMap *mm, int index)
 {
     _parent = parent;
     _mm = mm;
-    _rel = rel;
+    _index = index;
 }
 
 int Column::id() const {
@@ -52,9 +52,14 @@ int Column::dps() const
     return struc()->dps;
 }
 
+int Column::dataVersion() const
+{
+    return struc()->dataVersion;
+}
+
 ColumnStruct *Column::struc() const
 {
-    return _mm->resolve(_rel);
+    return _parent->strucC(_index);
 }
 
 int Column::levelCount() const
@@ -84,15 +89,9 @@ const char *Column::getLabel(int value) const
     if (value == INT_MIN)
         return "";
 
-    ColumnStruct *s = struc();
-    Level *levels = _mm->resolve(s->levels);
-
-    for (int i = 0; i < s->levelsUsed; i++)
-    {
-        Level &l = levels[i];
-        if (l.value == value)
-            return _mm->resolve(l.label);
-    }
+    Level *level = rawLevel(value);
+    if (level != NULL)
+        return _mm->resolve(level->label);
 
     stringstream ss;
     ss << "level " << value << " not found";
@@ -101,15 +100,13 @@ const char *Column::getLabel(int value) const
 
 int Column::valueForLabel(const char *label) const
 {
-    ColumnStruct *s = struc();
-    Level *levels = _mm->resolve(s->levels);
+    LevelIndex *index = levelIndex();
+    auto itr = index->byLabel.find(label);
 
-    for (int i = 0; i < s->levelsUsed; i++)
+    if (itr != index->byLabel.end())
     {
-        Level &level = levels[i];
-        const char *l = _mm->resolve(level.label);
-        if (strcmp(l, label) == 0)
-            return level.value;
+        Level *levels = _mm->resolve(struc()->levels);
+        return levels[itr->second].value;
     }
 
     stringstream ss;
@@ -119,18 +116,8 @@ int Column::valueForLabel(const char *label) const
 
 bool Column::hasLevel(const char *label) const
 {
-    ColumnStruct *s = struc();
-    Level *levels = _mm->resolve(s->levels);
-
-    for (int i = 0; i < s->levelsUsed; i++)
-    {
-        Level &level = levels[i];
-        const char *l = _mm->resolve(level.label);
-        if (strcmp(l, label) == 0)
-            return true;
-    }
-
-    return false;
+    LevelIndex *index = levelIndex();
+    return index->byLabel.find(label) != index->byLabel.end();
 }
 
 bool Column::hasLevel(int value) const
@@ -139,16 +126,40 @@ bool Column::hasLevel(int value) const
 }
 
 Level *Column::rawLevel(int value) const
+{
+    LevelIndex *index = levelIndex();
+    auto itr = index->byValue.find(value);
+
+    if (itr == index->byValue.end())
+        return NULL;
+
+    Level *levels = _mm->resolve(struc()->levels);
+    return &levels[itr->second];
+}
+
+Column::LevelIndex *Column::levelIndex() const
 {
     ColumnStruct *s = struc();
+
+    if (_levelIndex && _levelIndex->changes == s->levelsChanges)
+        return _levelIndex.get();
+
+    _levelIndex = make_shared<LevelIndex>();
+    _levelIndex->changes = s->levelsChanges;
+    _levelIndex->byValue.reserve(s->levelsUsed);
+    _levelIndex->byLabel.reserve(s->levelsUsed);
+
     Level *levels = _mm->resolve(s->levels);
 
+    // where levels share a value or a label, the first is found, as
+    // with a scan of the levels
+
     for (int i = 0; i < s->levelsUsed; i++)
     {
         Level &level = levels[i];
-        if (level.value == value)
-            return &level;
+        _levelIndex->byValue.emplace(level.value, i);
+        _levelIndex->byLabel.emplace(_mm->resolve(level.label), i);
     }
 
-    return NULL;
+    return _levelIndex.get();
 }
@@ -10,21 +10,26 @@
 #include <string>
 #include <vector>
 #include <utility>
+#include <memory>
+#include <unordered_map>
+#include <stdexcept>
+#include <algorithm>
+#include <cstring>
 
 class DataSet;
 
 typedef struct
 {
-    int start;
-    int length;
+    int start;     // the row of the first value
+    int length;    // the number of values
     int capacity;
 
     char values[8];
 
 } Block;
 
-#define BLOCK_SIZE 32768
-#define VALUES_SPACE (BLOCK_SIZE - sizeof(Block) + 8)
+#define BLOCK_SIZE 32768  // the default
+#define VALUES_SPACE(blockSize) ((blockSize) - sizeof(Block) + 8)
 
 typedef struct
 {
@@ -35,6 +40,28 @@ typedef struct
 
 } Level;
 
+typedef struct
+{
+    // a summary of the column's values, kept up to date as values are
+    // written (see ColumnW). when valid is false (or rangeValid, for min
+    // and max) it's recalculated the next time it's needed. minCount and
+    // maxCount are the number of values equal to the min and the max, so
+    // the range is only lost when the last of these is overwritten
+
+    char valid;
+    char rangeValid;
+
+    int missing;
+    int nonIntegers;  // values with a fractional part (to 6 dps)
+    int dps[4];       // values requiring 0, 1, 2 and 3 dps
+
+    double min;
+    double max;
+    int minCount;
+    int maxCount;
+
+} ColumnStats;
+
 typedef struct
 {
     int id;
@@ -45,10 +72,19 @@ typedef struct
     int rowCount;
     int capacity;
 
+    // the values are stored in blocks of blockSize bytes or, if blockSize
+    // is 0, in one contiguous extent, reallocated as the column grows.
+    // blocks in use are never empty, and hold the rows in order
+
+    int blockSize;
+
     int blocksUsed;
     int blockCapacity;
     Block **blocks;
 
+    char *extent;
+    size_t extentSize;
+
     int levelsUsed;
     int levelsCapacity;
     Level *levels;
@@ -57,6 +93,14 @@ typedef struct
 
     char changes;
 
+    int levelsChanges;
+
+    // incremented whenever anything an analysis reads from the column
+    // (values, levels, name, measure type) changes
+    int dataVersion;
+
+    ColumnStats stats;
+
 } ColumnStruct;
 
 namespace MeasureType
@@ -75,13 +119,14 @@ class Column
 {
 public:
 
-    Column(DataSet *parent = 0, MemoryMap *mm = 0, ColumnStruct *rel = 0);
+    Column(DataSet *parent = 0, MemoryMap *mm = 0, int index = -1);
 
     int id() const;
     const char *name() const;
     const char *importName() const;
     int rowCount() const;
     int dps() const;
+    int dataVersion() const;
 
     MeasureType::Type measureType() const;
     bool autoMeasure() const;
@@ -97,29 +142,122 @@ public:
         return cellAt<T>(rowIndex);
     }
 
+    template<typename T> void values(int rowIndex, int count, T *dest)
+    {
+        ColumnStruct *cs = struc();
+
+        if (rowIndex < 0 || count < 0 || rowIndex + count > cs->rowCount)
+            throw std::runtime_error("index out of bounds");
+
+        int rowEnd = rowIndex + count;
+
+        // copies a block at a time (or all at once, if contiguous)
+
+        while (rowIndex < rowEnd)
+        {
+            int run;
+            T *cells = cellPtr<T>(cs, rowIndex, &run);
+            int n = std::min(run, rowEnd - rowIndex);
+
+            std::memcpy(dest, cells, n * sizeof(T));
+
+            dest += n;
+            rowIndex += n;
+        }
+    }
+
 protected:
 
     ColumnStruct *struc() const;
 
+    // columns are identified by their index, rather than by where their
+    // ColumnStruct is, as the data set's table of them is reallocated as
+    // it grows (and by DataSetW::vacuum())
+
     DataSet *_parent;
-    ColumnStruct *_rel;
+    int _index;
 
     Level *rawLevel(int value) const;
 
+    // an index of the levels, by value and by label, into the levels
+    // array. it's not kept in the memory map, so is (re)built on first
+    // use, and whenever the levels have been changed through another
+    // column object (levelsChanges no longer matches)
+
+    typedef struct
+    {
+        int changes;
+        std::unordered_map<int, int> byValue;
+        std::unordered_map<std::string, int> byLabel;
+
+    } LevelIndex;
+
+    LevelIndex *levelIndex() const;
+
+    mutable std::shared_ptr<LevelIndex> _levelIndex;
+
     template<typename T> T& cellAt(int rowIndex)
     {
-        ColumnStruct *cs = _mm->resolve<ColumnStruct>(_rel);
+        ColumnStruct *cs = struc();
 
         if (rowIndex >= cs->rowCount)
             throw std::runtime_error("index out of bounds");
 
-        int blockIndex = rowIndex * sizeof(T) / VALUES_SPACE;
+        return *cellPtr<T>(cs, rowIndex);
+    }
+
+    // where the value of a row is stored, and (in run) how many values
+    // are stored contiguously from there; to the end of the block, or
+    // of the column
+
+    template<typename T> T *cellPtr(ColumnStruct *cs, int rowIndex, int *run = 0)
+    {
+        if (cs->blockSize == 0)
+        {
+            if (run != 0)
+                *run = cs->rowCount - rowIndex;
+            return _mm->resolve<T>((T*)cs->extent) + rowIndex;
+        }
+
+        int perBlock = VALUES_SPACE(cs->blockSize) / sizeof(T);
         Block **blocks = _mm->resolve<Block*>(cs->blocks);
-        Block *currentBlock = _mm->resolve<Block>(blocks[blockIndex]);
+        Block *currentBlock = _mm->resolve<Block>(blocks[blockIndex(cs, rowIndex, perBlock)]);
+        int index = rowIndex - currentBlock->start;
 
-        int index = rowIndex % (VALUES_SPACE / sizeof(T));
+        if (run != 0)
+            *run = currentBlock->length - index;
+        return (T*) &currentBlock->values[index * sizeof(T)];
+    }
+
+    // the block holding a row. blocks are filled in turn, so the row is
+    // usually in block rowIndex / perBlock, but inserting and deleting
+    // rows leaves blocks partly filled, so otherwise it's searched for
+
+    int blockIndex(ColumnStruct *cs, int rowIndex, int perBlock)
+    {
+        Block **blocks = _mm->resolve<Block*>(cs->blocks);
 
-        return *((T*) &currentBlock->values[index * sizeof(T)]);
+        int index = rowIndex / perBlock;
+        if (index < cs->blocksUsed)
+        {
+            Block *block = _mm->resolve<Block>(blocks[index]);
+            if (block->start <= rowIndex && rowIndex < block->start + block->length)
+                return index;
+        }
+
+        int low = 0;
+        int high = cs->blocksUsed - 1;
+
+        while (low < high)
+        {
+            int middle = (low + high + 1) / 2;
+            if (_mm->resolve<Block>(blocks[middle])->start <= rowIndex)
+                low = middle;
+            else
+                high = middle - 1;
+        }
+
+        return low;
     }
 
 private:
@@ -22,6 +22,7 @@ DataSet *DataSet::retrieve(MemoryMap *mm)
 DataSet::DataSet(MemoryMap *mm)
 {
     _mm = mm;
+    _columnIndex.changes = -1;
 }
 
 DataSetStruct *DataSet::struc() const
@@ -33,35 +34,60 @@ ColumnStruct *DataSet::strucC(int index) const
 {
     DataSetStruct *dss = struc();
     ColumnStruct *columns = _mm->resolve(dss->columns);
-    ColumnStruct *column  = &columns[dss->columnCount];
+    ColumnStruct *column  = &columns[index];
 
     return column;
 }
 
-Column DataSet::getColumnById(int id)
+DataSet::ColumnIndex &DataSet::columnIndex() const
 {
-    for (int i = 0; i < columnCount(); i++)
+    DataSetStruct *dss = struc();
+    ColumnIndex &index = _columnIndex;
+
+    if (index.changes == dss->columnsChanges)
+        return index;
+
+    index.byId.clear();
+    index.byName.clear();
+
+    for (int i = 0; i < dss->columnCount; i++)
     {
-        Column column = (*this)[i];
-        if (column.id() == id)
-            return column;
+        ColumnStruct *column = strucC(i);
+        index.byId[column->id] = i;
+        index.byName.emplace(_mm->resolve(column->name), i); // the first, of columns with the same name
     }
 
-    throw runtime_error("no such column");
+    index.changes = dss->columnsChanges;
+
+    return index;
 }
 
-Column DataSet::operator[](const char *name)
+int DataSet::indexOf(int id) const
 {
-    DataSetStruct *dss = _mm->resolve<DataSetStruct>(_rel);
+    ColumnIndex &index = columnIndex();
+    auto i = index.byId.find(id);
+    if (i == index.byId.end())
+        throw runtime_error("no such column");
+    return i->second;
+}
 
-    for (int i = 0; i < columnCount(); i++)
-    {
-        Column column = (*this)[i];
-        if (strcmp(column.name(), name) == 0)
-            return column;
-    }
+int DataSet::indexOf(const char *name) const
+{
+    ColumnIndex &index = columnIndex();
+    auto i = index.byName.find(name);
+    if (i == index.byName.end())
+        throw runtime_error("no such column");
+    return i->second;
+}
+
+Column DataSet::getColumnById(int id)
+{
+    return Column(this, _mm, indexOf(id));
+}
 
-    throw runtime_error("no such column");
+Column DataSet::operator[](const char *name)
+{
+    return Column(this, _mm, indexOf(name));
 }
 
 Column DataSet::operator[](int index)
@@ -71,10 +97,7 @@ Column DataSet::operator[](int index)
     if (index >= dss->columnCount)
         throw runtime_error("index out of bounds");
 
-    ColumnStruct *columns = _mm->resolve<ColumnStruct>(dss->columns);
-    ColumnStruct *rel = _mm->base<ColumnStruct>(&columns[index]);
-
-    return Column(this, _mm, rel);
+    return Column(this, _mm, index);
 }
 
 int DataSet::rowCount() const
@@ -6,6 +6,7 @@
 #define DATASET_H
 
 #include <string>
+#include <unordered_map>
 
 #include "memorymap.h"
 #include "column.h"
@@ -17,11 +18,18 @@ typedef struct
     ColumnStruct *columns;
     int capacity;
     int nextColumnId;
+    int blockSize;  // of new columns; 0 if they're contiguous
+
+    // incremented whenever a column is added or renamed
+    int columnsChanges;
 
 } DataSetStruct;
 
 class DataSet
 {
+    friend class Column;
+    friend class ColumnW;
+
 public:
 
     static DataSet *retrieve(MemoryMap *mm);
@@ -41,8 +49,27 @@ protected:
 
     DataSetStruct *_rel;
 
+    // an index of the columns, by id and by name, into the columns array.
+    // as with a column's level index, it's not kept in the memory map, so
+    // is (re)built on first use, and whenever columnsChanges no longer
+    // matches
+
+    typedef struct
+    {
+        int changes;
+        std::unordered_map<int, int> byId;
+        std::unordered_map<std::string, int> byName;
+
+    } ColumnIndex;
+
+    ColumnIndex &columnIndex() const;
+    int indexOf(int id) const;
+    int indexOf(const char *name) const;
+
 private:
 
+    mutable ColumnIndex _columnIndex;
+
     MemoryMap *_mm;
 
 };
@@ -16,7 +16,7 @@ public:
     
     template<class T> inline T *resolve(T *p)
     {
-        return (T*)(_start - (char*)0 + (char*)p);
+        return (T*)(_start + (size_t)p);
     }
     
     template<class T> inline T *base(T *p)
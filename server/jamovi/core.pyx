@@ -6,10 +6,17 @@ from libcpp cimport bool
 from libcpp.string cimport string
 from libcpp.vector cimport vector
 from libcpp.pair cimport pair
+from libcpp.set cimport set as cset
+from libcpp.map cimport map as cmap
+from libcpp.unordered_map cimport unordered_map
+from libc.math cimport isnan, isinf, rint, trunc
+from libc.limits cimport INT_MIN, INT_MAX
 
 from cython.operator cimport dereference as deref, postincrement as inc
+from cpython cimport array
 
 import math
+import array
 import platform
 import os
 import os.path
@@ -19,13 +26,17 @@ from enum import Enum
 cdef extern from "datasetw.h":
     cdef cppclass CDataSet "DataSetW":
         @staticmethod
-        CDataSet *create(CMemoryMap *mm) except +
+        CDataSet *create(CMemoryMap *mm, int blockSize) except +
         @staticmethod
         CDataSet *retrieve(CMemoryMap *mm) except +
         int rowCount() const
         int columnCount() const
         CColumn appendColumn(const char *name, const char *importName) except +
         void setRowCount(size_t count) except +
+        void insertRows(int rowIndex, int count) except +
+        void deleteRows(vector[pair[int, int]] ranges) except +
+        void reserve(size_t rowCount) except +
+        void vacuum() except +
         void appendRow() except +
         CColumn operator[](int index) except +
         CColumn operator[](const char *name) except +
@@ -51,9 +62,11 @@ cdef class DataSet:
     cdef CDataSet *_this
 
     @staticmethod
-    def create(MemoryMap memoryMap):
+    def create(MemoryMap memoryMap, block_size=32768, contiguous=False):
+        # contiguous columns are each stored in one piece, rather than
+        # in blocks of block_size bytes
         ds = DataSet()
-        ds._this = CDataSet.create(memoryMap._this)
+        ds._this = CDataSet.create(memoryMap._this, 0 if contiguous else block_size)
         return ds
 
     @staticmethod
@@ -98,6 +111,20 @@ cdef class DataSet:
     def set_row_count(self, count):
         self._this.setRowCount(count)
 
+    def insert_rows(self, index, count):
+        # the rows inserted (before index) are missing values
+        self._this.insertRows(index, count)
+
+    def delete_rows(self, ranges):
+        # ranges are of (first, last) rows
+        self._this.deleteRows(ranges)
+
+    def reserve(self, row_count):
+        self._this.reserve(row_count)
+
+    def vacuum(self):
+        self._this.vacuum()
+
     def append_row(self):
         self._this.appendRow()
 
@@ -136,6 +163,8 @@ cdef extern from "columnw.h":
         void append[T](const T &value)
         void setValue[T](int index, T value)
         T value[T](int index)
+        void values[T](int index, int count, T *dest) except +
+        void setValues[T](int index, int count, const T *values, bool initing) except +
         const char *getLabel(int value) const
         int valueForLabel(const char *label) const
         void appendLevel(int value, const char *label)
@@ -149,6 +178,12 @@ cdef extern from "columnw.h":
         int dps() const
         int rowCount() const;
         int changes() const;
+        int dataVersion() const
+        int requiredDPs()
+        bool integersOnly()
+        int missingCount()
+        double minValue()
+        double maxValue()
 
 cdef extern from "column.h":
     ctypedef enum CMeasureType  "MeasureType::Type":
@@ -211,15 +246,28 @@ cdef class Column:
         def __set__(self, dps):
             self._this.setDPs(dps)
 
+    # summary stats are maintained as values are written, so these
+    # don't need to read through the column
+
+    property missing_count:
+        def __get__(self):
+            return self._this.missingCount()
+
+    property integers_only:
+        def __get__(self):
+            return self._this.integersOnly()
+
+    property min_value:
+        def __get__(self):
+            return self._this.minValue()
+
+    property max_value:
+        def __get__(self):
+            return self._this.maxValue()
+
     def determine_dps(self):
         if self.measure_type == MeasureType.CONTINUOUS:
-            ceiling_dps = 3
-            max_dps = 0
-            for value in self:
-                max_dps = max(max_dps, Column.how_many_dps(value, ceiling_dps))
-                if max_dps == ceiling_dps:
-                    break
-            self.dps = max_dps
+            self.dps = self._this.requiredDPs()
 
     @staticmethod
     def how_many_dps(value, max_dp=3):
@@ -293,6 +341,10 @@ cdef class Column:
     def changes(self):
         return self._this.changes();
 
+    @property
+    def data_version(self):
+        return self._this.dataVersion()
+
     def clear_at(self, index):
         if self.measure_type is MeasureType.CONTINUOUS:
             self._this.setValue[double](index, float('nan'))
@@ -323,6 +375,89 @@ cdef class Column:
         else:
             return self._this.value[int](index)
 
+    def read_range(self, start, stop):
+        # returns the raw values from start to stop as an array.array,
+        # of doubles ('d') for CONTINUOUS columns, otherwise of int32s ('i')
+        cdef array.array values
+        cdef int count
+
+        if start < 0 or stop > self.row_count or start > stop:
+            raise IndexError('index out of bounds')
+
+        count = stop - start
+
+        if self._this.measureType() == CMeasureTypeContinuous:
+            values = array.clone(_double_array, count, zero=False)
+            if count > 0:
+                self._this.values[double](start, count, values.data.as_doubles)
+        else:
+            values = array.clone(_int_array, count, zero=False)
+            if count > 0:
+                self._this.values[int](start, count, values.data.as_ints)
+
+        return values
+
+    def missing_bitmap(self, values):
+        # which of values (as from read_range()) are missing, as an array
+        # of uint32s ('I'); 32 values to each word, lowest bit first
+        cdef const double[::1] doubles
+        cdef const int[::1] ints
+        cdef unsigned int[::1] words
+        cdef int i
+        cdef int n = len(values)
+
+        bitmap = array.clone(_uint_array, (n + 31) // 32, zero=True)
+        if n == 0:
+            return bitmap
+        words = bitmap
+
+        if self._this.measureType() == CMeasureTypeContinuous:
+            doubles = values
+            for i in range(n):
+                if isnan(doubles[i]):
+                    words[i >> 5] |= (<unsigned int>1) << (i & 31)
+        else:
+            ints = values
+            for i in range(n):
+                if ints[i] == INT_MIN:
+                    words[i >> 5] |= (<unsigned int>1) << (i & 31)
+
+        return bitmap
+
+    def levels_used(self, values):
+        # the levels, (value, label), of the codes in values (as from
+        # read_range()), in order of value
+        cdef const int[::1] ints
+        cdef cset[int] used
+        cdef int i
+        cdef int n = len(values)
+
+        if n == 0:
+            return [ ]
+        ints = values
+
+        for i in range(n):
+            if ints[i] != INT_MIN:
+                used.insert(ints[i])
+
+        return [ (value, self._this.getLabel(value).decode()) for value in used ]
+
+    def write_range(self, start, values):
+        # writes raw values starting at start. values can be any buffer
+        # (array.array, memoryview, numpy array, read-only or not) of
+        # doubles for CONTINUOUS columns, otherwise of int32s
+        cdef const double[::1] doubles
+        cdef const int[::1] ints
+
+        if self._this.measureType() == CMeasureTypeContinuous:
+            doubles = values
+            if doubles.shape[0] > 0:
+                self._this.setValues[double](start, doubles.shape[0], &doubles[0], False)
+        else:
+            ints = values
+            if ints.shape[0] > 0:
+                self._this.setValues[int](start, ints.shape[0], &ints[0], False)
+
     def change(self, measure_type, name=None, levels=None, dps=None, auto_measure=None):
 
         if name is not None:
@@ -340,22 +475,12 @@ cdef class Column:
         new_type = measure_type
         old_type = self.measure_type
 
-        if new_type == MeasureType.CONTINUOUS:
-            values = list(self)
-            nan = float('nan')
-            for i in range(len(values)):
-                try:
-                    if values[i] != -2147483648:
-                        values[i] = float(values[i])
-                    else:
-                        values[i] = nan
-                except:
-                    values[i] = nan
+        # the values are read out of the column a whole column at a time,
+        # converted with typed loops, and written back without adjusting
+        # the level counts value by value (the levels are replaced)
 
-            self.clear_levels()
-            self.measure_type = MeasureType.CONTINUOUS
-            for i in range(len(values)):
-                self[i] = values[i]
+        if new_type == MeasureType.CONTINUOUS:
+            self._change_to_continuous()
 
             if self.auto_measure:
                 self.determine_dps()
@@ -366,127 +491,234 @@ cdef class Column:
                 self.measure_type = new_type
 
                 if levels is not None:
-                    old_levels = self.levels
-                    recode = { }
-                    for old_level in old_levels:
-                        for new_level in levels:
-                            if old_level[1] == new_level[1]:
-                                recode[old_level[0]] = new_level[0]
-                                break
-
-                    self.clear_levels()
-                    for level in levels:
-                        self.append_level(level[0], level[1])
-
-                    for row_no in range(self.row_count):
-                        value = self._this.value[int](row_no)
-                        value = recode.get(value, -2147483648)
-                        self._this.setValue[int](row_no, value, True)
+                    self._recode(levels)
 
             elif old_type == MeasureType.NOMINAL_TEXT or old_type == MeasureType.CONTINUOUS:
-
-                if old_type == MeasureType.NOMINAL_TEXT:
-                    nan = ''
-                else:
-                    nan = float('nan')
-
-                values = list(self)
-                self.clear_levels()
-
-                self.measure_type = new_type
-
-                for i in range(len(values)):
-                    try:
-                        value = values[i]
-                        if value != nan:
-                            value = round(float(value))
-                            if not self.has_level(value):
-                                self.insert_level(value, str(value))
-                        else:
-                            value = -2147483648
-                        self._this.setValue[int](i, value, True)
-                    except ValueError:
-                        self._this.setValue[int](i, -2147483648, True)
-
+                self._change_to_integer(new_type)
                 self.dps = 0
 
         elif new_type == MeasureType.NOMINAL_TEXT:
             if old_type == MeasureType.NOMINAL_TEXT:
                 if levels is not None:
-                    old_levels = self.levels
-                    recode = { }
-                    for old_level in old_levels:
-                        for new_level in levels:
-                            if old_level[1] == new_level[1]:
-                                recode[old_level[0]] = new_level[0]
-                                break
-
-                    self.clear_levels()
-                    for level in levels:
-                        self.append_level(level[0], level[1])
-
-                    for row_no in range(self.row_count):
-                        value = self._this.value[int](row_no)
-                        value = recode.get(value, -2147483648)
-                        self._this.setValue[int](row_no, value, True)
+                    self._recode(levels)
 
                 self.measure_type = MeasureType.NOMINAL_TEXT
 
             elif old_type == MeasureType.CONTINUOUS:
-                nan = float('nan')
-
-                multip = math.pow(10, self.dps)
-
-                uniques = set()
-                for value in self:
-                    if math.isnan(value) == False:
-                        uniques.add(int(value * multip))
-                uniques = list(uniques)
-                uniques.sort()
-
-                self.measure_type = MeasureType.NOMINAL_TEXT
+                self._change_continuous_to_text()
 
-                self.clear_levels()
-                for i in range(len(uniques)):
-                    v = float(uniques[i]) / multip
-                    label = '{:.{}f}'.format(v, self.dps)
-                    self.append_level(i, label)
-
-                v2i = { }
-                for i in range(len(uniques)):
-                    v2i[uniques[i]] = i
-                for i in range(self.row_count):
-                    value = self._this.value[double](i)
-                    if math.isnan(value):
-                        self._this.setValue[int](i, -2147483648, True)
-                    else:
-                        self._this.setValue[int](i, v2i[int(value * multip)], True)
+            else: # ordinal or nominal
+                self._change_integer_to_text()
+
+    cdef _write_all(self, values):
+        # writes a whole column of values, where the column's levels have
+        # just been replaced (the values' levels exist, with counts of 0)
+        cdef const double[::1] doubles
+        cdef const int[::1] ints
+
+        if self._this.measureType() == CMeasureTypeContinuous:
+            doubles = values
+            if doubles.shape[0] > 0:
+                self._this.setValues[double](0, doubles.shape[0], &doubles[0], True)
+        else:
+            ints = values
+            if ints.shape[0] > 0:
+                self._this.setValues[int](0, ints.shape[0], &ints[0], True)
+
+    cdef _recode(self, levels):
+        # replaces the levels, with values mapped to the new levels by label
+        cdef unordered_map[int, int] recode
+        cdef int[::1] ints
+        cdef int i
+        cdef int n = self.row_count
+
+        new_values = { }
+        for new_level in levels:
+            new_values.setdefault(new_level[1], new_level[0])
+        for old_level in self.levels:
+            if old_level[1] in new_values:
+                recode[old_level[0]] = new_values[old_level[1]]
+
+        values = self.read_range(0, n)
+        ints = values
+
+        for i in range(n):
+            if recode.count(ints[i]) > 0:
+                ints[i] = recode[ints[i]]
+            else:
+                ints[i] = INT_MIN
+
+        self.clear_levels()
+        for level in levels:
+            self.append_level(level[0], level[1])
 
-                self.determine_dps()
+        self._write_all(values)
 
-            else: # ordinal or nominal
-                nan = -2147483648
+    cdef _change_to_continuous(self):
+        cdef unordered_map[int, double] as_double
+        cdef int[::1] ints
+        cdef double[::1] doubles
+        cdef int i
+        cdef int n = self.row_count
+        cdef double nan = float('nan')
 
-                uniques = set()
-                for value in self:
-                    if value != -2147483648:
-                        uniques.add(value)
-                uniques = list(uniques)
-                uniques.sort()
+        if self._this.measureType() == CMeasureTypeContinuous:
+            self.clear_levels()
+            return
 
-                self.measure_type = MeasureType.NOMINAL_TEXT
+        ints = self.read_range(0, n)
+        values = array.clone(_double_array, n, zero=False)
+        doubles = values
 
-                self.clear_levels()
-                for i in range(len(uniques)):
-                    self.append_level(i, str(uniques[i]))
+        if self._this.measureType() == CMeasureTypeNominalText:
+            for value, label in self.levels:
+                try:
+                    as_double[value] = float(label)
+                except ValueError:
+                    as_double[value] = nan
 
-                v2i = { }
-                for i in range(len(uniques)):
-                    v2i[uniques[i]] = i
-                for i in range(self.row_count):
-                    value = self._this.value[int](i)
-                    if value != nan:
-                        self._this.setValue[int](i, v2i[value], True)
+            for i in range(n):
+                if as_double.count(ints[i]) > 0:
+                    doubles[i] = as_double[ints[i]]
+                else:
+                    doubles[i] = nan
+        else:
+            for i in range(n):
+                if ints[i] != INT_MIN:
+                    doubles[i] = ints[i]
+                else:
+                    doubles[i] = nan
+
+        self.clear_levels()
+        self.measure_type = MeasureType.CONTINUOUS
+        self._write_all(values)
+
+    cdef _change_to_integer(self, measure_type):
+        # from NOMINAL_TEXT or CONTINUOUS; values are rounded to integers,
+        # and become the levels. values which aren't numbers, are infinite,
+        # or are out of range become missing
+        cdef unordered_map[int, int] as_int
+        cdef cset[int] uniques
+        cdef int[::1] ints
+        cdef double[::1] doubles
+        cdef double value
+        cdef int i
+        cdef int n = self.row_count
+
+        if self._this.measureType() == CMeasureTypeNominalText:
+            for level_value, label in self.levels:
+                try:
+                    rounded = round(float(label))
+                except (ValueError, OverflowError):
+                    continue
+                if rounded > INT_MIN and rounded <= INT_MAX:
+                    as_int[level_value] = rounded
+
+            values = self.read_range(0, n)
+            ints = values
+
+            for i in range(n):
+                if as_int.count(ints[i]) > 0:
+                    ints[i] = as_int[ints[i]]
+                    uniques.insert(ints[i])
+                else:
+                    ints[i] = INT_MIN
+        else:
+            doubles = self.read_range(0, n)
+            values = array.clone(_int_array, n, zero=False)
+            ints = values
+
+            for i in range(n):
+                value = doubles[i]
+                if isnan(value) or isinf(value):
+                    ints[i] = INT_MIN
+                    continue
+                value = rint(value)  # rounds half to even, as round() does
+                if value > INT_MIN and value <= INT_MAX:
+                    ints[i] = <int>value
+                    uniques.insert(ints[i])
+                else:
+                    ints[i] = INT_MIN
+
+        self.clear_levels()
+        self.measure_type = measure_type
+
+        for unique in uniques:
+            self.append_level(unique, str(unique))
+
+        self._write_all(values)
+
+    cdef _change_continuous_to_text(self):
+        # the levels are the unique values, to the column's dps
+        cdef cset[double] uniques
+        cdef cmap[double, int] index
+        cdef double[::1] doubles
+        cdef int[::1] ints
+        cdef double multip = math.pow(10, self.dps)
+        cdef double key
+        cdef int i
+        cdef int n = self.row_count
+
+        doubles = self.read_range(0, n)
+        values = array.clone(_int_array, n, zero=False)
+        ints = values
+
+        for i in range(n):
+            if not isnan(doubles[i]):
+                uniques.insert(trunc(doubles[i] * multip) + 0.0)  # + 0.0 makes -0.0 0.0
+
+        self.measure_type = MeasureType.NOMINAL_TEXT
+        self.clear_levels()
+
+        i = 0
+        for key in uniques:
+            index[key] = i
+            label = '{:.{}f}'.format(key / multip, self.dps)
+            self.append_level(i, label)
+            i += 1
+
+        for i in range(n):
+            if isnan(doubles[i]):
+                ints[i] = INT_MIN
+            else:
+                ints[i] = index[trunc(doubles[i] * multip) + 0.0]
+
+        self._write_all(values)
+
+    cdef _change_integer_to_text(self):
+        # the levels are the unique values, in ascending order
+        cdef cset[int] uniques
+        cdef unordered_map[int, int] index
+        cdef int[::1] ints
+        cdef int unique
+        cdef int i
+        cdef int n = self.row_count
+
+        values = self.read_range(0, n)
+        ints = values
+
+        for i in range(n):
+            if ints[i] != INT_MIN:
+                uniques.insert(ints[i])
+
+        self.measure_type = MeasureType.NOMINAL_TEXT
+        self.clear_levels()
+
+        i = 0
+        for unique in uniques:
+            index[unique] = i
+            self.append_level(i, str(unique))
+            i += 1
+
+        for i in range(n):
+            if ints[i] != INT_MIN:
+                ints[i] = index[ints[i]]
+
+        self._write_all(values)
+
+cdef array.array _double_array = array.array('d')
+cdef array.array _int_array = array.array('i')
+cdef array.array _uint_array = array.array('I')
 
 cdef extern from "dirs.h":
     cdef cppclass CDirs "Dirs":
@@ -542,6 +774,9 @@ cdef extern from "memorymapw.h":
         @staticmethod
         CMemoryMap *create(string path, unsigned long long size) except +
         void close() except +
+        unsigned long long size() const
+        size_t used() const
+        size_t freeBytes() const
 
 cdef class MemoryMap:
     cdef CMemoryMap *_this
@@ -558,6 +793,18 @@ cdef class MemoryMap:
     def close(self):
         self._this.close()
 
+    @property
+    def size(self):
+        return self._this.size()
+
+    @property
+    def live_bytes(self):
+        return self._this.used() - self._this.freeBytes()
+
+    @property
+    def wasted_bytes(self):
+        return self._this.freeBytes()
+
 
 def decode(string str):
     return str.c_str().decode('utf-8')
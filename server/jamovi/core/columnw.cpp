@@ -6,13 +6,15 @@
 
 #include <stdexcept>
 #include <climits>
+#include <cstdio>
+#include <cstdlib>
 
 #include "dataset.h"
 
 using namespace std;
 
-ColumnW::ColumnW(DataSetW *parent, MemoryMapW *mm, ColumnStruct *rel)
-    : Column(parent, mm, rel)
+ColumnW::ColumnW(DataSetW *parent, MemoryMapW *mm, int index)
+    : Column(parent, mm, index)
 {
     _mm = mm;
 }
@@ -26,18 +28,38 @@ void ColumnW::setName(const char *name)
     std::memcpy(chars, name, length);
 
     ColumnStruct *s = struc();
+    char *old = _mm->resolve(s->name);
+    _mm->release<char>(old, strlen(old) + 1);
     s->name = _mm->base(chars);
     s->changes++;
+    s->dataVersion++;
+
+    _parent->struc()->columnsChanges++;
 }
 
 void ColumnW::setMeasureType(MeasureType::Type measureType)
 {
     ColumnStruct *s = struc();
+    bool resized = (s->measureType == MeasureType::CONTINUOUS) != (measureType == MeasureType::CONTINUOUS);
+
     s->measureType = (char)measureType;
     s->changes++;
+    s->dataVersion++;
+
+    invalidateStats();
 
-    if (measureType == MeasureType::CONTINUOUS)
-        setRowCount<double>(rowCount()); // keeps the row count the same, but allocates space for doubles
+    // continuous values take twice the space of the others. the values
+    // aren't converted here; they're rewritten by the caller
+
+    if ( ! resized)
+        return;
+
+    if (s->blockSize == 0)
+        reserve<double>(rowCount());
+    else if (measureType == MeasureType::CONTINUOUS)
+        relayoutBlocks(sizeof(double));
+    else
+        relayoutBlocks(sizeof(int));
 }
 
 void ColumnW::setAutoMeasure(bool yes)
@@ -76,6 +98,8 @@ void ColumnW::appendLevel(int value, const char *label)
                 Level &newLevel = newLevels[i];
                 newLevel = oldLevel;
             }
+
+            _mm->release<Level>(oldLevels, oldCapacity);
         }
 
         s->levels = _mm->base(newLevels);
@@ -99,6 +123,9 @@ void ColumnW::appendLevel(int value, const char *label)
 
     s->levelsUsed++;
     s->changes++;
+    s->dataVersion++;
+
+    levelsChanged(s->levelsUsed - 1);
 }
 
 void ColumnW::insertLevel(int value, const char *label)
@@ -109,6 +136,7 @@ void ColumnW::insertLevel(int value, const char *label)
     Level *levels = _mm->resolve(s->levels);
     int lastIndex = s->levelsUsed - 1;
     char *baseLabel = levels[lastIndex].label;
+    int baseCapacity = levels[lastIndex].capacity;
 
     bool ascending = true;
     bool descending = true;
@@ -124,6 +152,8 @@ void ColumnW::insertLevel(int value, const char *label)
     if (ascending && descending)
         descending = false;
 
+    int index = lastIndex;
+
     if (ascending == false && descending == false)
     {
         // if the levels are neither ascending nor descending
@@ -132,6 +162,7 @@ void ColumnW::insertLevel(int value, const char *label)
         Level &level = levels[lastIndex];
         level.value = value;
         level.label = baseLabel;
+        level.capacity = baseCapacity;
         level.count = 0;
     }
     else
@@ -154,6 +185,9 @@ void ColumnW::insertLevel(int value, const char *label)
             {
                 nextLevel.value = value;
                 nextLevel.label = baseLabel;
+                nextLevel.capacity = baseCapacity;
+                nextLevel.count = 0;
+                index = i + 1;
                 inserted = true;
                 break;
             }
@@ -164,11 +198,16 @@ void ColumnW::insertLevel(int value, const char *label)
             Level &level = levels[0];
             level.value = value;
             level.label = baseLabel;
+            level.capacity = baseCapacity;
             level.count = 0;
+            index = 0;
         }
     }
 
     s->changes++;
+    s->dataVersion++;
+
+    levelsChanged(index);
 }
 
 void ColumnW::removeLevel(int value)
@@ -188,6 +227,8 @@ void ColumnW::removeLevel(int value)
 
     int index = i;
 
+    _mm->releaseSizeBase<char>(levels[i].label, levels[i].capacity);
+
     for (; i < s->levelsUsed - 1; i++)
         levels[i] = levels[i+1];
 
@@ -205,19 +246,397 @@ void ColumnW::removeLevel(int value)
             if (v > value)
                 v--;
         }
+
+        s->stats.rangeValid = false;
     }
 
     s->changes++;
+    s->dataVersion++;
+
+    levelsChanged();
 }
 
 void ColumnW::clearLevels()
 {
     ColumnStruct *s = struc();
+    Level *levels = _mm->resolve(s->levels);
+    for (int i = 0; i < s->levelsUsed; i++)
+        _mm->releaseSizeBase<char>(levels[i].label, levels[i].capacity);
+
     s->levelsUsed = 0;
     s->changes++;
+    s->dataVersion++;
+
+    levelsChanged();
+}
+
+void ColumnW::resizeExtent(size_t size)
+{
+    // the values are moved to a new extent of (at least) size bytes
+
+    size_t allocated;
+    char *extent = _mm->allocateSize<char>(size, &allocated);
+
+    ColumnStruct *s = struc();
+    if (s->extentSize > 0)
+    {
+        std::memcpy(extent, _mm->resolve(s->extent), std::min(s->extentSize, allocated));
+        _mm->releaseSizeBase<char>(s->extent, s->extentSize);
+    }
+
+    s->extent = _mm->base(extent);
+    s->extentSize = allocated;
+}
+
+void ColumnW::growBlocks(int required)
+{
+    // the table of blocks doubles in size (or more, if required)
+
+    ColumnStruct *s = struc();
+    int capacity = std::max(required, 2 * s->blockCapacity);
+
+    Block **blocks = _mm->allocate<Block*>(capacity);
+    s = struc();
+    std::memcpy(blocks, _mm->resolve(s->blocks), s->blocksUsed * sizeof(Block*));
+    _mm->releaseBase<Block*>(s->blocks, s->blockCapacity);
+
+    s->blocks = _mm->base(blocks);
+    s->blockCapacity = capacity;
+}
+
+void ColumnW::insertBlocks(int index, int count)
+{
+    // inserts count empty blocks into the table of blocks, at index
+
+    if (count <= 0)
+        return;
+
+    ColumnStruct *s = struc();
+    if (s->blocksUsed + count > s->blockCapacity)
+        growBlocks(s->blocksUsed + count);
+
+    std::vector<Block*> added(count);
+
+    for (int i = 0; i < count; i++)
+    {
+        Block *block = _mm->allocateSize<Block>(struc()->blockSize);
+        block->start = 0;
+        block->length = 0;
+        block->capacity = 0;
+        added[i] = _mm->base(block);
+    }
+
+    s = struc();
+    Block **blocks = _mm->resolve(s->blocks);
+    std::memmove(blocks + index + count, blocks + index, (s->blocksUsed - index) * sizeof(Block*));
+    std::memcpy(blocks + index, &added[0], count * sizeof(Block*));
+    s->blocksUsed += count;
+}
+
+void ColumnW::removeBlocks(int index, int count)
+{
+    // frees count blocks from index, and removes them from the table
+
+    if (count <= 0)
+        return;
+
+    ColumnStruct *s = struc();
+    Block **blocks = _mm->resolve(s->blocks);
+
+    for (int i = index; i < index + count; i++)
+        _mm->releaseSizeBase<Block>(blocks[i], s->blockSize);
+
+    std::memmove(blocks + index, blocks + index + count, (s->blocksUsed - index - count) * sizeof(Block*));
+    s->blocksUsed -= count;
+}
+
+void ColumnW::renumberBlocks(int from)
+{
+    // sets the starts of the blocks from 'from', from their lengths
+
+    ColumnStruct *s = struc();
+    Block **blocks = _mm->resolve(s->blocks);
+
+    int start = 0;
+    if (from > 0)
+    {
+        Block *previous = _mm->resolve(blocks[from - 1]);
+        start = previous->start + previous->length;
+    }
+
+    for (int i = from; i < s->blocksUsed; i++)
+    {
+        Block *block = _mm->resolve(blocks[i]);
+        block->start = start;
+        start += block->length;
+    }
+}
+
+void ColumnW::tidyBlocks(int from, int to, size_t size)
+{
+    // of the blocks from 'from' to 'to', those left empty are removed,
+    // and each is merged with the next where their values fit in one
+
+    ColumnStruct *s = struc();
+    int perBlock = VALUES_SPACE(s->blockSize) / size;
+    int i = std::max(from, 0);
+
+    while (i <= to && i < s->blocksUsed)
+    {
+        Block **blocks = _mm->resolve(s->blocks);
+        Block *block = _mm->resolve(blocks[i]);
+
+        if (block->length == 0)
+        {
+            removeBlocks(i, 1);
+            to--;
+            continue;
+        }
+
+        if (i + 1 < s->blocksUsed)
+        {
+            Block *next = _mm->resolve(blocks[i + 1]);
+            if (block->length + next->length <= perBlock)
+            {
+                std::memcpy(&block->values[block->length * size], next->values, next->length * size);
+                block->length += next->length;
+                removeBlocks(i + 1, 1);
+                to--;
+                continue;
+            }
+        }
+
+        i++;
+    }
+}
+
+void ColumnW::relayoutBlocks(size_t size)
+{
+    // lays out the blocks afresh for values of size bytes, each filled
+    // in turn. the values aren't moved, so they're left meaningless
+
+    ColumnStruct *s = struc();
+    int required = blocksRequired(s->blockSize, s->rowCount, size);
+
+    if (required > s->blocksUsed)
+        insertBlocks(s->blocksUsed, required - s->blocksUsed);
+    else
+        removeBlocks(required, s->blocksUsed - required);
+
+    s = struc();
+    Block **blocks = _mm->resolve(s->blocks);
+    int perBlock = VALUES_SPACE(s->blockSize) / size;
+    int remaining = s->rowCount;
+
+    for (int i = 0; i < s->blocksUsed; i++)
+    {
+        Block *block = _mm->resolve(blocks[i]);
+        block->length = std::min(remaining, perBlock);
+        remaining -= block->length;
+    }
+
+    renumberBlocks(0);
+}
+
+void ColumnW::removeUnusedLevels(std::vector<int> &values)
+{
+    // removing a NOMINAL_TEXT level renumbers the levels above it, so
+    // they're removed highest first
+
+    std::sort(values.rbegin(), values.rend());
+    values.erase(std::unique(values.begin(), values.end()), values.end());
+
+    for (int value : values)
+    {
+        Level *level = rawLevel(value);
+        if (level != NULL && level->count == 0)
+            removeLevel(value);
+    }
+}
+
+void ColumnW::levelsChanged(int from)
+{
+    // the levels from index 'from' onwards have been added or moved. if
+    // this column's level index is current, just those are re-indexed,
+    // otherwise (or if from is -1) it's rebuilt on its next use
+
+    ColumnStruct *s = struc();
+
+    bool current = _levelIndex && _levelIndex->changes == s->levelsChanges;
+    s->levelsChanges++;
+
+    if ( ! current || from < 0)
+        return;
+
+    LevelIndex *index = _levelIndex.get();
+    Level *levels = _mm->resolve(s->levels);
+
+    // entries pointing at or past 'from' are stale. they're removed
+    // first, so entries before 'from' keep precedence over duplicates
+
+    for (int i = from; i < s->levelsUsed; i++)
+    {
+        Level &level = levels[i];
+        const char *label = _mm->resolve(level.label);
+
+        auto v = index->byValue.find(level.value);
+        if (v != index->byValue.end() && v->second >= from)
+            index->byValue.erase(v);
+
+        auto l = index->byLabel.find(label);
+        if (l != index->byLabel.end() && l->second >= from)
+            index->byLabel.erase(l);
+    }
+
+    for (int i = from; i < s->levelsUsed; i++)
+    {
+        Level &level = levels[i];
+        index->byValue.emplace(level.value, i);
+        index->byLabel.emplace(_mm->resolve(level.label), i);
+    }
+
+    index->changes = s->levelsChanges;
 }
 
 int ColumnW::changes() const
 {
     return struc()->changes;
 }
+
+int ColumnW::requiredDPs()
+{
+    ColumnStats &s = stats();
+
+    for (int dps = 3; dps > 0; dps--)
+    {
+        if (s.dps[dps] > 0)
+            return dps;
+    }
+
+    return 0;
+}
+
+bool ColumnW::integersOnly()
+{
+    return stats().nonIntegers == 0;
+}
+
+int ColumnW::missingCount()
+{
+    return stats().missing;
+}
+
+double ColumnW::minValue()
+{
+    ColumnStats &s = stats(true);
+    return (s.min <= s.max) ? s.min : NAN;
+}
+
+double ColumnW::maxValue()
+{
+    ColumnStats &s = stats(true);
+    return (s.min <= s.max) ? s.max : NAN;
+}
+
+void ColumnW::invalidateStats()
+{
+    ColumnStruct *s = struc();
+    s->stats.valid = false;
+    s->stats.rangeValid = false;
+}
+
+ColumnStats &ColumnW::stats(bool range)
+{
+    ColumnStruct *s = struc();
+    ColumnStats &stats = s->stats;
+
+    // the counts are kept while the range is invalid, so only asking for
+    // the range needs it to be valid
+
+    if (stats.valid && (stats.rangeValid || ! range))
+        return stats;
+
+    // recalculated from scratch; this happens after the measure type
+    // changes, or the last value at the min or max is overwritten
+
+    stats.valid = true;
+    stats.rangeValid = true;
+    stats.missing = 0;
+    stats.nonIntegers = 0;
+    for (int i = 0; i < 4; i++)
+        stats.dps[i] = 0;
+    stats.min = INFINITY;
+    stats.max = -INFINITY;
+    stats.minCount = 0;
+    stats.maxCount = 0;
+
+    if (measureType() == MeasureType::CONTINUOUS)
+    {
+        for (int i = 0; i < s->rowCount; i++)
+            updateStats(this->value<double>(i), 1);
+    }
+    else
+    {
+        for (int i = 0; i < s->rowCount; i++)
+            updateStats(this->value<int>(i), 1);
+    }
+
+    return stats;
+}
+
+int ColumnW::requiredDPs(double value)
+{
+    // the dps (up to 3) required to display value, the same as formatting
+    // value % 1 to 3 dps, and finding the last digit which isn't zero
+
+    if ( ! std::isfinite(value))
+        return 0;
+
+    double fraction = std::fmod(value, 1.0);
+    if (fraction < 0)
+        fraction += 1.0;
+
+    double scaled = fraction * 1000;
+    int digits;
+
+    if (std::fabs(scaled - std::floor(scaled) - 0.5) < 1e-6)
+    {
+        // too close to half way to round it here
+        char buffer[32];
+        snprintf(buffer, sizeof(buffer), "%.3f", fraction);
+        digits = (buffer[0] == '1') ? 0 : atoi(&buffer[2]);
+    }
+    else
+    {
+        digits = (int)std::rint(scaled) % 1000;
+    }
+
+    if (digits == 0)
+        return 0;
+    else if (digits % 10 != 0)
+        return 3;
+    else if (digits % 100 != 0)
+        return 2;
+    else
+        return 1;
+}
+
+bool ColumnW::isInteger(double value)
+{
+    // the same as round(value) == round(value, 6)
+
+    if ( ! std::isfinite(value))
+        return false;
+
+    double rounded = std::rint(value);
+    double difference = std::fabs(value - rounded);
+
+    if (difference == 0)
+        return true;
+    else if (difference > 1e-5)
+        return false;
+
+    char buffer[512];
+    snprintf(buffer, sizeof(buffer), "%.6f", value);
+    return strtod(buffer, NULL) == rounded;
+}
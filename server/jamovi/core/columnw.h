@@ -9,6 +9,11 @@
 #include "memorymapw.h"
 
 #include <string>
+#include <vector>
+#include <utility>
+#include <unordered_map>
+#include <algorithm>
+#include <stdexcept>
 #include <cmath>
 #include <climits>
 
@@ -20,7 +25,7 @@ class ColumnW : public Column
 {
 public:
 
-    ColumnW(DataSetW *parent = 0, MemoryMapW *mm = 0, ColumnStruct *rel = 0);
+    ColumnW(DataSetW *parent = 0, MemoryMapW *mm = 0, int index = -1);
 
     void setName(const char *name);
     void setMeasureType(MeasureType::Type measureType);
@@ -33,10 +38,14 @@ public:
 
     int changes() const;
 
+    int requiredDPs();
+    bool integersOnly();
+    int missingCount();
+    double minValue();
+    double maxValue();
+
     template<typename T> void setValue(int rowIndex, T value, bool initing = false)
     {
-        ColumnStruct *cs = _mm->resolve<ColumnStruct>(_rel);
-
         if (measureType() != MeasureType::CONTINUOUS)
         {
             assert(sizeof(T) == 4);
@@ -49,6 +58,8 @@ public:
                 if (oldValue == newValue)
                     return;
 
+                updateStats(oldValue, -1);
+
                 if (oldValue != INT_MIN)
                 {
                     Level *level = rawLevel(oldValue);
@@ -66,53 +77,521 @@ public:
                 level->count++;
             }
         }
+        else if (initing == false)
+        {
+            updateStats(this->value<T>(rowIndex), -1);
+        }
+
+        if (initing)
+            invalidateStats();
+        else
+            updateStats(value, 1);
 
+        struc()->dataVersion++;
         cellAt<T>(rowIndex) = value;
     }
 
+    template<typename T> void setValues(int rowIndex, int count, const T *values, bool initing = false)
+    {
+        ColumnStruct *cs = struc();
+
+        if (rowIndex < 0 || count < 0 || rowIndex + count > cs->rowCount)
+            throw std::runtime_error("index out of bounds");
+
+        std::vector<int> emptied;
+
+        // the levels are all checked before anything changes, so a
+        // rejected write leaves the column (and its stats) as it was
+
+        if (measureType() != MeasureType::CONTINUOUS)
+        {
+            for (int i = 0; i < count; i++)
+            {
+                int newValue = (int)values[i];
+                if (newValue != INT_MIN && rawLevel(newValue) == NULL)
+                    throw std::runtime_error("level not found");
+            }
+        }
+
+        cs->dataVersion++;
+
+        if (initing)
+            invalidateStats();
+        else
+            updateStats(rowIndex, count, values);
+
+        if (measureType() != MeasureType::CONTINUOUS)
+        {
+            assert(sizeof(T) == 4);
+
+            for (int i = 0; i < count; i++)
+            {
+                int newValue = (int)values[i];
+
+                if (initing == false)
+                {
+                    int oldValue = this->value<int>(rowIndex + i);
+                    if (oldValue == newValue)
+                        continue;
+
+                    if (oldValue != INT_MIN)
+                    {
+                        Level *level = rawLevel(oldValue);
+                        assert(level != NULL);
+                        level->count--;
+                        if (level->count == 0)
+                            emptied.push_back(oldValue);
+                    }
+                }
+
+                if (newValue != INT_MIN)
+                    rawLevel(newValue)->count++;
+            }
+        }
+
+        // copies a block at a time (or all at once, if contiguous)
+
+        int rowEnd = rowIndex + count;
+
+        while (rowIndex < rowEnd)
+        {
+            int run;
+            T *cells = cellPtr<T>(cs, rowIndex, &run);
+            int n = std::min(run, rowEnd - rowIndex);
+
+            std::memcpy(cells, values, n * sizeof(T));
+
+            values += n;
+            rowIndex += n;
+        }
+
+        // levels no longer used are removed, as with setValue()
+        removeUnusedLevels(emptied);
+    }
+
+    // the blocks needed to hold count values of size bytes
+    static int blocksRequired(int blockSize, size_t count, size_t size)
+    {
+        size_t perBlock = VALUES_SPACE(blockSize) / size;
+        return (count + perBlock - 1) / perBlock;
+    }
+
+    // makes room for count rows, without changing the row count. blocks
+    // are allocated as they're needed, so this is for contiguous columns
+    template<typename T> void reserve(size_t count)
+    {
+        ColumnStruct *cs = struc();
+        if (cs->blockSize == 0 && count * sizeof(T) > cs->extentSize)
+            resizeExtent(count * sizeof(T));
+    }
+
     template<typename T> void setRowCount(size_t count)
     {
-        ColumnStruct *cs = _mm->resolve<ColumnStruct>(_rel);
-        int blocksRequired = count * sizeof(T) / VALUES_SPACE + 1;
+        ColumnStruct *cs = struc();
+        int oldCount = cs->rowCount;
 
-        for (int i = cs->blocksUsed; i < blocksRequired; i++)
+        if (cs->blockSize == 0)
         {
-            Block *block = _mm->allocateSize<Block>(BLOCK_SIZE);
-            cs = _mm->resolve<ColumnStruct>(_rel);
+            // grown by half (or to what's required), so rows appended one
+            // at a time don't copy the column each time
+            size_t required = count * sizeof(T);
+            if (required > cs->extentSize)
+                resizeExtent(std::max(required, cs->extentSize + cs->extentSize / 2));
+            cs = struc();
+
+            if ((int)count > oldCount)
+                fillMissing(_mm->resolve<T>((T*)cs->extent) + oldCount, count - oldCount);
+        }
+        else if ((int)count > oldCount)
+        {
+            // the last block is filled, and then new blocks
+            int perBlock = VALUES_SPACE(cs->blockSize) / sizeof(T);
+            int remaining = count - oldCount;
+            int first = cs->blocksUsed - 1;
+
+            if (first >= 0)
+            {
+                Block *last = _mm->resolve<Block>(_mm->resolve<Block*>(cs->blocks)[first]);
+                int room = std::max(perBlock - last->length, 0);
+                insertBlocks(cs->blocksUsed, blocksRequired(cs->blockSize, std::max(remaining - room, 0), sizeof(T)));
+            }
+            else
+            {
+                first = 0;
+                insertBlocks(0, blocksRequired(cs->blockSize, remaining, sizeof(T)));
+            }
+
+            cs = struc();
             Block **blocks = _mm->resolve<Block*>(cs->blocks);
-            blocks[i] = _mm->base(block);
-            cs->blocksUsed++;
+
+            for (int i = first; i < cs->blocksUsed; i++)
+            {
+                Block *block = _mm->resolve<Block>(blocks[i]);
+                int n = std::min(remaining, perBlock - block->length);
+                if (n <= 0)
+                    continue;
+                fillMissing((T*)block->values + block->length, n);
+                block->length += n;
+                remaining -= n;
+            }
+
+            renumberBlocks(first);
+        }
+        else if ((int)count < oldCount)
+        {
+            // blocks no longer needed are freed, and the last trimmed
+            int perBlock = VALUES_SPACE(cs->blockSize) / sizeof(T);
+            int used = (count == 0) ? 0 : blockIndex(cs, count - 1, perBlock) + 1;
+
+            removeBlocks(used, cs->blocksUsed - used);
+            cs = struc();
+
+            if (used > 0)
+            {
+                Block *last = _mm->resolve<Block>(_mm->resolve<Block*>(cs->blocks)[used - 1]);
+                last->length = count - last->start;
+            }
         }
 
-        int oldCount = cs->rowCount;
         cs->rowCount = count;
 
-        for (size_t i = oldCount; i < count; i++) {
-            if (sizeof(T) == 8)
-                cellAt<double>(i) = NAN;
-            else
-                cellAt<int>(i) = INT_MIN;
+        if ((int)count != oldCount)
+            cs->dataVersion++;
+
+        // new rows are missing values
+        if ((int)count < oldCount)
+            invalidateStats();
+        else if (cs->stats.valid)
+            cs->stats.missing += count - oldCount;
+    }
+
+    // inserts count rows of missing values before rowIndex. the block
+    // holding rowIndex is split there, so only the values after rowIndex
+    // in that block are moved, rather than every value after it
+
+    template<typename T> void insertRows(int rowIndex, int count)
+    {
+        ColumnStruct *cs = struc();
+        int oldCount = cs->rowCount;
+
+        if (rowIndex < 0 || rowIndex > oldCount || count < 0)
+            throw std::runtime_error("index out of bounds");
+
+        if (rowIndex == oldCount)
+        {
+            setRowCount<T>(oldCount + count);
+            return;
+        }
+
+        if (count == 0)
+            return;
+
+        if (cs->blockSize == 0)
+        {
+            setRowCount<T>(oldCount + count);
+            cs = struc();
+            T *cells = _mm->resolve<T>((T*)cs->extent);
+            std::memmove(cells + rowIndex + count, cells + rowIndex, (oldCount - rowIndex) * sizeof(T));
+            fillMissing(cells + rowIndex, count);
+            return;
+        }
+
+        int perBlock = VALUES_SPACE(cs->blockSize) / sizeof(T);
+        int index = blockIndex(cs, rowIndex, perBlock);
+        Block *block = _mm->resolve<Block>(_mm->resolve<Block*>(cs->blocks)[index]);
+        int offset = rowIndex - block->start;
+        int tail = block->length - offset;
+
+        if (block->length + count <= perBlock)
+        {
+            // there's room in the block
+            T *cells = (T*)block->values;
+            std::memmove(cells + offset + count, cells + offset, tail * sizeof(T));
+            fillMissing(cells + offset, count);
+            block->length += count;
+        }
+        else
+        {
+            // the new rows fill the rest of the block, and then new
+            // blocks, with the values from after rowIndex at the end
+
+            int head = std::min(count, perBlock - offset);
+            int missing = count - head;
+            int added = blocksRequired(cs->blockSize, missing + tail, sizeof(T));
+
+            insertBlocks(index + 1, added);
+            cs = struc();
+            Block **blocks = _mm->resolve<Block*>(cs->blocks);
+            block = _mm->resolve<Block>(blocks[index]);
+            T *from = (T*)block->values + offset;
+
+            for (int i = 0; i < added; i++)
+            {
+                Block *newBlock = _mm->resolve<Block>(blocks[index + 1 + i]);
+                int position = i * perBlock;  // in the new rows and the tail
+                newBlock->length = std::min(perBlock, missing + tail - position);
+
+                T *cells = (T*)newBlock->values;
+                int n = std::max(std::min(missing - position, newBlock->length), 0);
+                fillMissing(cells, n);
+                std::memcpy(cells + n, from + position + n - missing, (newBlock->length - n) * sizeof(T));
+            }
+
+            fillMissing(from, head);
+            block->length = offset + head;
+
+            tidyBlocks(index + added, index + added + 1, sizeof(T));
         }
+
+        renumberBlocks(index);
+
+        cs = struc();
+        cs->rowCount += count;
+        cs->dataVersion++;
+        if (cs->stats.valid)
+            cs->stats.missing += count;
+    }
+
+    // deletes the rows in ranges, of (first, last) rows, in ascending
+    // order and not overlapping. the level counts are adjusted in bulk,
+    // and the blocks left partly filled are merged where they fit in one
+
+    template<typename T> void deleteRows(const std::vector<std::pair<int, int> > &ranges)
+    {
+        ColumnStruct *cs = struc();
+
+        if (ranges.empty())
+            return;
+
+        std::vector<int> emptied;
+
+        if (measureType() != MeasureType::CONTINUOUS)
+        {
+            assert(sizeof(T) == 4);
+
+            std::unordered_map<int, int> counts;
+
+            for (auto &range : ranges)
+            {
+                int rowIndex = range.first;
+                while (rowIndex <= range.second)
+                {
+                    int run;
+                    int *cells = cellPtr<int>(cs, rowIndex, &run);
+                    int n = std::min(run, range.second - rowIndex + 1);
+                    for (int i = 0; i < n; i++)
+                    {
+                        if (cells[i] != INT_MIN)
+                            counts[cells[i]]++;
+                    }
+                    rowIndex += n;
+                }
+            }
+
+            for (auto &count : counts)
+            {
+                Level *level = rawLevel(count.first);
+                assert(level != NULL);
+                level->count -= count.second;
+                if (level->count == 0)
+                    emptied.push_back(count.first);
+            }
+        }
+
+        int deleted = 0;
+        for (auto &range : ranges)
+            deleted += range.second - range.first + 1;
+
+        if (cs->blockSize == 0)
+        {
+            // the rows kept are moved down over those deleted
+            T *cells = _mm->resolve<T>((T*)cs->extent);
+            int to = ranges[0].first;
+
+            for (size_t i = 0; i < ranges.size(); i++)
+            {
+                int from = ranges[i].second + 1;
+                int end = (i + 1 < ranges.size()) ? ranges[i + 1].first : cs->rowCount;
+                std::memmove(cells + to, cells + from, (end - from) * sizeof(T));
+                to += end - from;
+            }
+        }
+        else
+        {
+            // the ranges are deleted last first, so the blocks before
+            // each still have the right starts. those after are
+            // renumbered once, at the end
+
+            int perBlock = VALUES_SPACE(cs->blockSize) / sizeof(T);
+            int renumberFrom = 0;
+
+            for (auto range = ranges.rbegin(); range != ranges.rend(); range++)
+            {
+                cs = struc();
+                int first = blockIndex(cs, range->first, perBlock);
+                int last = blockIndex(cs, range->second, perBlock);
+                Block **blocks = _mm->resolve<Block*>(cs->blocks);
+                Block *block = _mm->resolve<Block>(blocks[first]);
+                int offset = range->first - block->start;
+
+                if (first == last)
+                {
+                    T *cells = (T*)block->values;
+                    int end = range->second + 1 - block->start;
+                    std::memmove(cells + offset, cells + end, (block->length - end) * sizeof(T));
+                    block->length -= end - offset;
+                }
+                else
+                {
+                    Block *lastBlock = _mm->resolve<Block>(blocks[last]);
+                    T *cells = (T*)lastBlock->values;
+                    int end = range->second + 1 - lastBlock->start;
+                    std::memmove(cells, cells + end, (lastBlock->length - end) * sizeof(T));
+                    lastBlock->length -= end;
+                    block->length = offset;
+
+                    removeBlocks(first + 1, last - first - 1);
+                }
+
+                tidyBlocks(first - 1, first + 1, sizeof(T));
+                renumberFrom = std::max(first - 1, 0);
+            }
+
+            renumberBlocks(renumberFrom);
+        }
+
+        cs = struc();
+        cs->rowCount -= deleted;
+        cs->dataVersion++;
+
+        invalidateStats();
+
+        removeUnusedLevels(emptied);
     }
 
     template<typename T> void append(const T &value)
     {
-        ColumnStruct *cs = _mm->resolve<ColumnStruct>(_rel);
+        ColumnStruct *cs = struc();
 
         setRowCount<T>(cs->rowCount + 1);
 
-        cs = _mm->resolve<ColumnStruct>(_rel);
-        int blockIndex = cs->rowCount * sizeof(T) / VALUES_SPACE;
-        Block **blocks = _mm->resolve<Block*>(cs->blocks);
-        Block *currentBlock = _mm->resolve<Block>(blocks[blockIndex]);
+        cs = struc();
+        int rowIndex = cs->rowCount - 1;
+        *cellPtr<T>(cs, rowIndex) = value;
 
-        int index = cs->rowCount % (VALUES_SPACE / sizeof(T));
-
-        T* p = (T*) &currentBlock->values[index * sizeof(T)];
-        *p = value;
+        if (cs->stats.valid)
+        {
+            cs->stats.missing--;  // counted by setRowCount()
+            updateStats(value, 1);
+        }
     }
 
 private:
+    void levelsChanged(int from = -1);
+    void removeUnusedLevels(std::vector<int> &values);
+    void resizeExtent(size_t size);
+    void growBlocks(int required);
+    void insertBlocks(int index, int count);
+    void removeBlocks(int index, int count);
+    void renumberBlocks(int from);
+    void tidyBlocks(int from, int to, size_t size);
+    void relayoutBlocks(size_t size);
+
+    template<typename T> static void fillMissing(T *cells, int count)
+    {
+        for (int i = 0; i < count; i++)
+        {
+            if (sizeof(T) == 8)
+                ((double*)cells)[i] = NAN;
+            else
+                ((int*)cells)[i] = INT_MIN;
+        }
+    }
+
+    // the stats are updated with each value written (delta 1) and each
+    // value overwritten (delta -1)
+
+    template<typename T> void updateStats(T value, int delta)
+    {
+        ColumnStats &stats = struc()->stats;
+
+        if ( ! stats.valid)
+            return;
+
+        double v;
+
+        if (sizeof(T) == 4)
+        {
+            if ((int)value == INT_MIN)
+            {
+                stats.missing += delta;
+                return;
+            }
+            v = (int)value;
+            stats.dps[0] += delta;
+        }
+        else
+        {
+            v = (double)value;
+            if (std::isnan(v))
+            {
+                stats.missing += delta;
+                return;
+            }
+            if ( ! isInteger(v))
+                stats.nonIntegers += delta;
+            stats.dps[requiredDPs(v)] += delta;
+        }
+
+        if ( ! stats.rangeValid)
+            return;
+
+        if (delta > 0)
+        {
+            if (v < stats.min)
+            {
+                stats.min = v;
+                stats.minCount = 0;
+            }
+            if (v > stats.max)
+            {
+                stats.max = v;
+                stats.maxCount = 0;
+            }
+            if (v == stats.min)
+                stats.minCount++;
+            if (v == stats.max)
+                stats.maxCount++;
+        }
+        else
+        {
+            // when the last value at the min or max is removed, the next
+            // one along isn't known, and the range has to be rescanned
+            if (v == stats.min && --stats.minCount == 0)
+                stats.rangeValid = false;
+            if (v == stats.max && --stats.maxCount == 0)
+                stats.rangeValid = false;
+        }
+    }
+
+    template<typename T> void updateStats(int rowIndex, int count, const T *values)
+    {
+        if ( ! struc()->stats.valid)
+            return;
+
+        for (int i = 0; i < count; i++)
+        {
+            updateStats(this->value<T>(rowIndex + i), -1);
+            updateStats(values[i], 1);
+        }
+    }
+
+    void invalidateStats();
+    ColumnStats &stats(bool range = false);
+
+    static int requiredDPs(double value);
+    static bool isInteger(double value);
+
     MemoryMapW *_mm;
 
 };
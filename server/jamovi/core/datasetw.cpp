@@ -5,25 +5,48 @@
 #include "datasetw.h"
 
 #include <cstring>
+#include <algorithm>
 #include <climits>
 #include <stdexcept>
 #include <cmath>
 
 using namespace std;
 
-DataSetW *DataSetW::create(MemoryMapW *mm)
+static char *copyString(MemoryMapW *mm, const char *str, size_t *allocated = 0)
 {
+    size_t length = strlen(str) + 1;
+    char *chars = mm->allocate<char>(length, allocated);
+    memcpy(chars, str, length);
+    return mm->base(chars);
+}
+
+static size_t valueSize(const ColumnStruct *column)
+{
+    return (column->measureType == MeasureType::CONTINUOUS) ? sizeof(double) : sizeof(int);
+}
+
+DataSetW *DataSetW::create(MemoryMapW *mm, int blockSize)
+{
+    // columns are stored in blocks of blockSize bytes, or contiguously if
+    // blockSize is 0
+
+    if (blockSize != 0 && (blockSize < 1024 || blockSize % 8 != 0))
+        throw runtime_error("Invalid block size");
+
     DataSetW *ds = new DataSetW(mm);
     DataSetStruct *rel = mm->allocateBase<DataSetStruct>();
     ds->_rel = rel;
 
-    ColumnStruct *columns = mm->allocateBase<ColumnStruct>(1024);
+    // the columns array grows (doubling) as columns are added
+    ColumnStruct *columns = mm->allocateBase<ColumnStruct>(64);
     DataSetStruct *dss = mm->resolve(rel);
 
     dss->columns = columns;
-    dss->capacity = 1024;
+    dss->capacity = 64;
     dss->columnCount = 0;
     dss->nextColumnId = 0;
+    dss->blockSize = blockSize;
+    dss->columnsChanges = 0;
 
     return ds;
 }
@@ -67,14 +90,7 @@ bool DataSetW::isBlank() const
 
 ColumnW DataSetW::operator[](const char *name)
 {
-    for (int i = 0; i < columnCount(); i++)
-    {
-        ColumnW column = (*this)[i];
-        if (strcmp(column.name(), name) == 0)
-            return column;
-    }
-
-    throw runtime_error("no such column");
+    return ColumnW(this, _mm, indexOf(name));
 }
 
 ColumnW DataSetW::operator[](int index)
@@ -84,22 +100,12 @@ ColumnW DataSetW::operator[](int index)
     if (index >= dss->columnCount)
         throw runtime_error("index out of bounds");
 
-    ColumnStruct *columns = _mm->resolve<ColumnStruct>(dss->columns);
-    ColumnStruct *rel = _mm->base<ColumnStruct>(&columns[index]);
-
-    return ColumnW(this, _mm, rel);
+    return ColumnW(this, _mm, index);
 }
 
 ColumnW DataSetW::getColumnById(int id)
 {
-    for (int i = 0; i < columnCount(); i++)
-    {
-        ColumnW column = (*this)[i];
-        if (column.id() == id)
-            return column;
-    }
-
-    throw runtime_error("no such column");
+    return ColumnW(this, _mm, indexOf(id));
 }
 
 ColumnW DataSetW::appendColumn(const char *name, const char *importName)
@@ -111,14 +117,22 @@ ColumnW DataSetW::appendColumn(const char *name, const char *importName)
     int columnCount = struc()->columnCount;
 
     if (columnCount >= struc()->capacity)
-        throw runtime_error("Too many columns");
+    {
+        int capacity = 2 * struc()->capacity;
+        ColumnStruct *columns = _mm->allocate<ColumnStruct>(capacity);
+        dss = struc();
+        memcpy(columns, _mm->resolve(dss->columns), dss->columnCount * sizeof(ColumnStruct));
+        _mm->releaseBase<ColumnStruct>(dss->columns, dss->capacity);
+        dss->columns = _mm->base(columns);
+        dss->capacity = capacity;
+    }
 
     int n = strlen(name);
     char *chars = _mm->allocate<char>(n + 1);  // +1 for null terminator
     memcpy(chars, name, n + 1);
 
     int n2 = strlen(importName);
-    char *chars2 = _mm->allocate<char>(n + 1);  // +1 for null terminator
+    char *chars2 = _mm->allocate<char>(n2 + 1);  // +1 for null terminator
     memcpy(chars2, importName, n2 + 1);
 
     ColumnStruct *column;
@@ -132,64 +146,319 @@ ColumnW DataSetW::appendColumn(const char *name, const char *importName)
     column->autoMeasure = false;
     column->rowCount = 0;
 
+    column->blockSize = struc()->blockSize;
     column->blocksUsed = 0;
-    column->blockCapacity = 1024;
+    column->extent = NULL;
+    column->extentSize = 0;
 
-    Block** blocks = _mm->allocateBase<Block*>(column->blockCapacity);
-    column = strucC(columnCount);
-    column->blocks = blocks;
+    if (column->blockSize != 0)
+    {
+        column->blockCapacity = 16;  // grows as needed
+        Block** blocks = _mm->allocateBase<Block*>(column->blockCapacity);
+        column = strucC(columnCount);
+        column->blocks = blocks;
+    }
+    else
+    {
+        column->blockCapacity = 0;
+        column->blocks = NULL;
+    }
 
     column->levelsUsed = 0;
     column->levelsCapacity = 0;
 
     column->dps = 0;
     column->changes = 0;
+    column->levelsChanges = 0;
+    column->dataVersion = 0;
+
+    ColumnStats &stats = column->stats;
+    stats.valid = true;
+    stats.rangeValid = true;
+    stats.missing = 0;
+    stats.nonIntegers = 0;
+    for (int i = 0; i < 4; i++)
+        stats.dps[i] = 0;
+    stats.min = INFINITY;
+    stats.max = -INFINITY;
+    stats.minCount = 0;
+    stats.maxCount = 0;
 
     struc()->columnCount++;
+    struc()->columnsChanges++;
 
-    return ColumnW(this, _mm, _mm->base<ColumnStruct>(column));
+    return ColumnW(this, _mm, columnCount);
 }
 
 void DataSetW::setRowCount(size_t count)
 {
+    reserve(count);
+
     DataSetStruct *dss = _mm->resolve<DataSetStruct>(_rel);
-    ColumnStruct *columns = _mm->resolve<ColumnStruct>(dss->columns);
 
     for (int i = 0; i < dss->columnCount; i++)
     {
-        ColumnStruct *c = _mm->base(&columns[i]);
-        ColumnW column(this, _mm, c);
+        ColumnW column(this, _mm, i);
 
         if (column.measureType() == MeasureType::CONTINUOUS)
             column.setRowCount<double>(count);
         else
             column.setRowCount<int>(count);
 
-        dss     = _mm->resolve(_rel);
-        columns = _mm->resolve(dss->columns);
+        dss = _mm->resolve(_rel);
     }
 
     dss->rowCount = count;
 }
 
+void DataSetW::insertRows(int rowIndex, int count)
+{
+    if (rowIndex < 0 || rowIndex > rowCount() || count < 0)
+        throw runtime_error("index out of bounds");
+
+    reserve(rowCount() + count);
+
+    DataSetStruct *dss = _mm->resolve<DataSetStruct>(_rel);
+
+    for (int i = 0; i < dss->columnCount; i++)
+    {
+        ColumnW column(this, _mm, i);
+
+        if (column.measureType() == MeasureType::CONTINUOUS)
+            column.insertRows<double>(rowIndex, count);
+        else
+            column.insertRows<int>(rowIndex, count);
+
+        dss = _mm->resolve(_rel);
+    }
+
+    dss->rowCount += count;
+}
+
+void DataSetW::deleteRows(vector<pair<int, int> > ranges)
+{
+    // ranges are of (first, last) rows. they're sorted, and those which
+    // overlap or are adjacent are combined
+
+    sort(ranges.begin(), ranges.end());
+
+    vector<pair<int, int> > combined;
+
+    for (auto &range : ranges)
+    {
+        if (range.first < 0 || range.first > range.second || range.second >= rowCount())
+            throw runtime_error("index out of bounds");
+
+        if ( ! combined.empty() && range.first <= combined.back().second + 1)
+            combined.back().second = max(combined.back().second, range.second);
+        else
+            combined.push_back(range);
+    }
+
+    if (combined.empty())
+        return;
+
+    int deleted = 0;
+    for (auto &range : combined)
+        deleted += range.second - range.first + 1;
+
+    DataSetStruct *dss = _mm->resolve<DataSetStruct>(_rel);
+
+    for (int i = 0; i < dss->columnCount; i++)
+    {
+        ColumnW column(this, _mm, i);
+
+        if (column.measureType() == MeasureType::CONTINUOUS)
+            column.deleteRows<double>(combined);
+        else
+            column.deleteRows<int>(combined);
+
+        dss = _mm->resolve(_rel);
+    }
+
+    dss->rowCount -= deleted;
+}
+
+void DataSetW::reserve(size_t rowCount)
+{
+    // makes room for the columns to hold rowCount rows, so the memory map
+    // grows (at most) once, rather than in steps as blocks are allocated
+
+    size_t required = 0;
+
+    for (int i = 0; i < columnCount(); i++)
+    {
+        ColumnStruct *column = strucC(i);
+        size_t size = valueSize(column);
+
+        if (column->blockSize == 0)
+        {
+            if (rowCount * size > column->extentSize)
+                required += rowCount * size;
+        }
+        else
+        {
+            int blocks = ColumnW::blocksRequired(column->blockSize, rowCount, size);
+            if (blocks > column->blocksUsed)
+                required += (blocks - column->blocksUsed) * column->blockSize;
+        }
+    }
+
+    if (required == 0)
+        return;
+
+    _mm->reserve(_mm->used() + required + 8);
+
+    // contiguous columns are given their space now, rather than being
+    // reallocated as they grow
+
+    for (int i = 0; i < columnCount(); i++)
+    {
+        ColumnW column = (*this)[i];
+        if (column.measureType() == MeasureType::CONTINUOUS)
+            column.reserve<double>(rowCount);
+        else
+            column.reserve<int>(rowCount);
+    }
+}
+
 void DataSetW::appendRow()
 {
     DataSetStruct *dss = _mm->resolve<DataSetStruct>(_rel);
-    ColumnStruct *columns = _mm->resolve<ColumnStruct>(dss->columns);
 
     for (int i = 0; i < dss->columnCount; i++)
     {
-        ColumnStruct *c = _mm->base(&columns[i]);
-        ColumnW column(this, _mm, c);
+        ColumnW column(this, _mm, i);
 
         if (column.measureType() == MeasureType::CONTINUOUS)
             column.append<double>(NAN);
         else
             column.append<int>(INT_MIN);
 
-        dss     = _mm->resolve(_rel);
-        columns = _mm->resolve(dss->columns);
+        dss = _mm->resolve(_rel);
     }
 
     dss->rowCount++;
 }
+
+void DataSetW::vacuum()
+{
+    // compacts the memory map; the live data is copied into a fresh map,
+    // leaving behind the freed space, and then copied back over this
+    // one. the data set is allocated first, as in create(), so it's still
+    // the root
+
+    DataSetStruct *dss = struc();
+    size_t live = _mm->used() - _mm->freeBytes();
+
+    MemoryMapW *fresh = MemoryMapW::create(_mm->path() + ".vacuum", live + BLOCK_SIZE);
+
+    try
+    {
+        DataSetStruct *freshRel = fresh->allocateBase<DataSetStruct>();
+        ColumnStruct *columns = fresh->allocateBase<ColumnStruct>(dss->capacity);
+        DataSetStruct *freshDss = fresh->resolve(freshRel);
+
+        *freshDss = *dss;
+        freshDss->columns = columns;
+
+        for (int i = 0; i < dss->columnCount; i++)
+        {
+            ColumnStruct column = *strucC(i);
+
+            column.name = copyString(fresh, _mm->resolve(column.name));
+            column.importName = copyString(fresh, _mm->resolve(column.importName));
+
+            if (column.blockSize == 0)
+            {
+                // extents are trimmed to the values in use
+                size_t size = column.rowCount * valueSize(&column);
+                if (size > 0)
+                {
+                    char *extent = fresh->allocateSize<char>(size, &column.extentSize);
+                    memcpy(extent, _mm->resolve(column.extent), size);
+                    column.extent = fresh->base(extent);
+                }
+                else
+                {
+                    column.extent = NULL;
+                    column.extentSize = 0;
+                }
+            }
+            else
+            {
+                // the blocks are repacked, each filled in turn, so those
+                // left partly filled by inserting and deleting rows are
+                // merged, and rows are found in the first block tried
+
+                size_t size = valueSize(&column);
+                int perBlock = VALUES_SPACE(column.blockSize) / size;
+                int required = ColumnW::blocksRequired(column.blockSize, column.rowCount, size);
+
+                Block **blocks = _mm->resolve(column.blocks);
+                Block **freshBlocks = fresh->allocateBase<Block*>(column.blockCapacity);
+
+                int from = 0;    // the block being copied from
+                int offset = 0;  // and the position in it
+
+                for (int j = 0; j < required; j++)
+                {
+                    Block *block = fresh->allocateSize<Block>(column.blockSize);
+                    block->start = j * perBlock;
+                    block->length = min(perBlock, column.rowCount - block->start);
+                    block->capacity = 0;
+
+                    int filled = 0;
+                    while (filled < block->length)
+                    {
+                        Block *source = _mm->resolve(blocks[from]);
+                        int n = min(block->length - filled, source->length - offset);
+                        memcpy(&block->values[filled * size], &source->values[offset * size], n * size);
+                        filled += n;
+                        offset += n;
+                        if (offset == source->length)
+                        {
+                            from++;
+                            offset = 0;
+                        }
+                    }
+
+                    fresh->resolve(freshBlocks)[j] = fresh->base(block);
+                }
+
+                column.blocks = freshBlocks;
+                column.blocksUsed = required;
+            }
+
+            if (column.levelsCapacity > 0)
+            {
+                Level *levels = _mm->resolve(column.levels);
+                Level *freshLevels = fresh->allocateBase<Level>(column.levelsCapacity);
+
+                for (int j = 0; j < column.levelsUsed; j++)
+                {
+                    Level level = levels[j];
+                    size_t allocated;
+                    level.label = copyString(fresh, _mm->resolve(level.label), &allocated);
+                    level.capacity = allocated;
+                    fresh->resolve(freshLevels)[j] = level;
+                }
+
+                column.levels = freshLevels;
+            }
+
+            fresh->resolve(columns)[i] = column;
+        }
+
+        _mm->copyFrom(fresh);
+    }
+    catch (...)
+    {
+        fresh->remove();
+        delete fresh;
+        throw;
+    }
+
+    fresh->remove();
+    delete fresh;
+}
@@ -6,6 +6,8 @@
 #define DATASETW_H
 
 #include <string>
+#include <vector>
+#include <utility>
 
 #include "dataset.h"
 #include "memorymapw.h"
@@ -17,12 +19,16 @@ class DataSetW : public DataSet
 {
 public:
 
-    static DataSetW *create(MemoryMapW *mm);
+    static DataSetW *create(MemoryMapW *mm, int blockSize = BLOCK_SIZE);
     static DataSetW *retrieve(MemoryMapW *mm);
 
     ColumnW appendColumn(const char *name, const char *importName);
     void appendRow();
     void setRowCount(size_t count);
+    void insertRows(int rowIndex, int count);
+    void deleteRows(std::vector<std::pair<int, int> > ranges);
+    void reserve(size_t rowCount);
+    void vacuum();
 
     ColumnW operator[](int index);
     ColumnW operator[](const char *name);
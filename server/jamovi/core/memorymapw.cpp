@@ -4,7 +4,10 @@
 
 #include "memorymapw.h"
 
+#include <cstring>
+
 #include <boost/nowide/fstream.hpp>
+#include <boost/nowide/cstdio.hpp>
 
 using namespace std;
 using namespace boost;
@@ -14,6 +17,7 @@ MemoryMapW::MemoryMapW(const string &path, interprocess::file_mapping *file, int
 {
     _cursor = _start;
     _end   = _start + _region->get_size();
+    _freeBytes = 0;
 }
 
 MemoryMapW *MemoryMapW::create(const string &path, unsigned long long size)
@@ -33,17 +37,41 @@ MemoryMapW *MemoryMapW::create(const string &path, unsigned long long size)
     return mm;
 }
 
-void MemoryMapW::enlarge(int percent)
+void MemoryMapW::reserve(size_t size)
 {
-    flush();
-    
-    delete _region;
-    delete _file;
-    
-    size_t newSize = (_size * (100 + percent)) / 100;
+    // readers which know (or can estimate) how much they'll need can
+    // reserve it up front, rather than the map growing in steps
+
+    if (size > _size)
+        resize(size);
+}
+
+void MemoryMapW::enlarge(size_t required)
+{
+    // grows by half, or to what's required if that's more
+
+    size_t newSize = (_size * 3) / 2;
+    if (newSize < required)
+        newSize = required;
+
+    resize(newSize);
+}
+
+void MemoryMapW::resize(size_t newSize)
+{
+    // the file is extended by writing its new last byte, leaving a hole
+    // (on file systems which support them) rather than writing zeros.
+    // there's no need to flush before unmapping; the pages are shared,
+    // and stay in the file
+
     if ((newSize % 8) != 0)
         newSize += 8 - (newSize % 8);
-        
+
+    size_t cursorOffset = used();
+
+    delete _region;
+    delete _file;
+
     //cout << "enlarging memory map to " << newSize << "\n";
     //cout.flush();
     
@@ -55,13 +83,11 @@ void MemoryMapW::enlarge(int percent)
 
     _file   = new interprocess::file_mapping(_path.c_str(), interprocess::read_write);
     _region = new interprocess::mapped_region(*_file,       interprocess::read_write, 0, newSize);
-    
-    char *cursorOffset = base<char>(_cursor);
 
     _size = newSize;
     
     _start = (char*)_region->get_address();
-    _cursor = resolve<char>(cursorOffset);
+    _cursor = _start + cursorOffset;
     _end = _start + _region->get_size();
 }
 
@@ -76,3 +102,24 @@ void MemoryMapW::close()
     delete _file;
 }
 
+
+void MemoryMapW::remove()
+{
+    close();
+    nowide::remove(_path.c_str());
+}
+
+void MemoryMapW::copyFrom(MemoryMapW *other)
+{
+    // replaces the contents with those of other, which has the same
+    // layout; the free space is discarded
+
+    size_t used = other->used();
+    if (_start + used >= _end)
+        enlarge(used + 1);
+
+    memcpy(_start, other->_start, used);
+    _cursor = _start + used;
+    _free.clear();
+    _freeBytes = 0;
+}
@@ -5,6 +5,9 @@
 #ifndef MEMORYMAPW_H
 #define MEMORYMAPW_H
 
+#include <map>
+#include <vector>
+
 #include "memorymap.h"
 
 class MemoryMapW : public MemoryMap {
@@ -12,24 +15,41 @@ class MemoryMapW : public MemoryMap {
 public:
     static MemoryMapW *create(const std::string &path, unsigned long long size);
     
-    void enlarge(int percent = 50);
+    void reserve(size_t size);
+    void enlarge(size_t required = 0);
     void flush();
     void close();
+    void remove();
+
+    void copyFrom(MemoryMapW *other);
+
+    const std::string &path() const { return _path; }
+    unsigned long long size() const { return _size; }
+    size_t used() const { return _cursor - _start; }
+    size_t freeBytes() const { return _freeBytes; }
     
     template<class T> T *allocateSize(size_t size, size_t *allocated = 0)
     {   
-        size_t padding = 8 - (size % 8);   // align at 8 bytes
-        if (padding > 0 && padding < 8)
-            size += padding;
+        size = align(size);
         
         if (allocated != NULL)
             *allocated = size;
+
+        // reuse space released earlier, of exactly this size
+        std::map<size_t, std::vector<size_t> >::iterator free = _free.find(size);
+        if (free != _free.end() && ! free->second.empty())
+        {
+            size_t offset = free->second.back();
+            free->second.pop_back();
+            _freeBytes -= size;
+            return (T*)(_start + offset);
+        }
         
         //std::cout << "allocating " << size << " bytes at " << (unsigned long long)(_cursor - _start) << "\n";
         //std::cout.flush();
         
-        while (_cursor + size >= _end)
-            enlarge();
+        if (_cursor + size >= _end)
+            enlarge(used() + size + 1);
 
         void *pos = _cursor;
         _cursor += size;
@@ -50,12 +70,50 @@ public:
     {
         return base<T>(allocateSize<T>(size, allocated));
     }
+
+    // space no longer used, for reuse by later allocations of the same
+    // size. size is as allocated, or as requested when allocated
+    
+    template<class T> void releaseSize(T *p, size_t size)
+    {
+        size = align(size);
+        _free[size].push_back((char*)p - _start);
+        _freeBytes += size;
+    }
+
+    template<class T> void release(T *p, int count = 1)
+    {
+        releaseSize<T>(p, count * sizeof(T));
+    }
+
+    template<class T> void releaseBase(T *p, int count = 1)
+    {
+        release<T>(resolve<T>(p), count);
+    }
+
+    template<class T> void releaseSizeBase(T *p, size_t size)
+    {
+        releaseSize<T>(resolve<T>(p), size);
+    }
     
 private:
     MemoryMapW(const std::string &path, boost::interprocess::file_mapping *file, boost::interprocess::mapped_region *region);
 
+    void resize(size_t size);
+
+    static size_t align(size_t size)
+    {
+        size_t padding = 8 - (size % 8);   // align at 8 bytes
+        if (padding > 0 && padding < 8)
+            size += padding;
+        return size;
+    }
+
     char *_cursor;
     char *_end;
+
+    std::map<size_t, std::vector<size_t> > _free; // size -> offsets
+    size_t _freeBytes;
 };
 
 #endif // MEMORYMAPW_H
\ No newline at end of file
@@ -29,6 +29,7 @@ class Analysis:
         self.changes = set()
         self.status = Analysis.Status.NONE
         self.clear_state = False
+        self.columns_read = None  # column name -> data version, of the last run
 
     @property
     def has_results(self):
@@ -183,5 +184,9 @@ class Analyses:
         else:
             raise KeyError(id)
 
+        # lets the engines stop running it
+        analysis.status = Analysis.Status.DELETED
+        self._notify_options_changed(analysis)
+
     def __iter__(self):
         return self._analyses.__iter__()
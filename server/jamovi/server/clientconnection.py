@@ -2,15 +2,23 @@
 # Copyright (C) 2016 Jonathon Love
 #
 
+import time
+from collections import OrderedDict
+
 from tornado.websocket import WebSocketHandler
+from tornado.ioloop import IOLoop
 
 from . import jamovi_pb2 as jcoms
 from .instance import Instance
+from .utils import conf
 
 import logging
 
 log = logging.getLogger('jamovi')
 
+RESULTS_INTERVAL = 50  # ms between results updates, JAMOVI_RESULTS_INTERVAL
+MAX_UNSENT = 1024 * 1024  # bytes written but not yet sent, before results wait
+
 
 class ClientConnection(WebSocketHandler):
 
@@ -22,6 +30,19 @@ class ClientConnection(WebSocketHandler):
         self._transactions = { }
         self._close_listeners = [ ]
 
+        self._results_interval = ClientConnection._interval()
+        self._pending_results = OrderedDict()  # (instance id, analysis id) -> results
+        self._flush_timeout = None
+        self._last_flush = 0
+        self._unsent = 0  # bytes
+
+    @staticmethod
+    def _interval():
+        interval = conf.get('results_interval')
+        if interval is None or interval == '':
+            interval = RESULTS_INTERVAL
+        return max(0, float(interval)) / 1000
+
     def check_origin(self, origin):
         return True
 
@@ -31,6 +52,10 @@ class ClientConnection(WebSocketHandler):
 
     def on_close(self):
         ClientConnection.number_of_connections -= 1
+        self._pending_results.clear()
+        if self._flush_timeout is not None:
+            IOLoop.current().remove_timeout(self._flush_timeout)
+            self._flush_timeout = None
         for listener in self._close_listeners:
             listener()
 
@@ -87,7 +112,47 @@ class ClientConnection(WebSocketHandler):
         else:
             m.status = jcoms.Status.Value('IN_PROGRESS')
 
-        self.write_message(m.SerializeToString(), binary=True)
+        self._write(m.SerializeToString())
+
+    def send_results(self, results, instance_id, analysis_id):
+
+        # results updates are sent at most once an interval. an analysis's
+        # updates replace any of its updates still waiting, so only the
+        # newest is sent. results is a function returning the message, or
+        # None if there's nothing to send, and is called as it's sent
+
+        self._pending_results.pop((instance_id, analysis_id), None)
+        self._pending_results[(instance_id, analysis_id)] = results
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_timeout is not None or len(self._pending_results) == 0:
+            return
+        if self._unsent > MAX_UNSENT:
+            return  # a slow client; the flush waits until the writes drain
+        delay = max(0, self._last_flush + self._results_interval - time.monotonic())
+        self._flush_timeout = IOLoop.current().call_later(delay, self._flush)
+
+    def _flush(self):
+        self._flush_timeout = None
+        self._last_flush = time.monotonic()
+
+        while len(self._pending_results) > 0 and self._unsent <= MAX_UNSENT:
+            key, results = self._pending_results.popitem(last=False)
+            message = results()
+            if message is not None:
+                self.send(message, key[0])
+
+        self._schedule_flush()
+
+    def _write(self, data):
+        self._unsent += len(data)
+        future = self.write_message(data, binary=True)
+        future.add_done_callback(lambda f: self._written(len(data)))
+
+    def _written(self, size):
+        self._unsent -= size
+        self._schedule_flush()
 
     def send_error(self, message=None, cause=None, instance_id=None, response_to=None):
 
@@ -116,7 +181,7 @@ class ClientConnection(WebSocketHandler):
 
         m.status = jcoms.Status.Value('ERROR')
 
-        self.write_message(m.SerializeToString(), binary=True)
+        self._write(m.SerializeToString())
 
     def add_close_listener(self, listener):
         self._close_listeners.append(listener)
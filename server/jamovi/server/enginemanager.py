@@ -1,15 +1,20 @@
 
 import sys
+import os
 import os.path as path
 import platform
 
 import threading
 import tempfile
 import subprocess
+import time
 from enum import Enum
 
 import nanomsg
 
+from tornado.ioloop import IOLoop
+from tornado.ioloop import PeriodicCallback
+
 from .utils import conf
 from . import jamovi_pb2 as jcoms
 from .analyses import Analysis
@@ -18,6 +23,9 @@ import logging
 
 log = logging.getLogger('jamovi')
 
+MEMORY_PER_ENGINE = 512 * 1024 * 1024  # allowed for when sizing the pool
+IDLE_TIMEOUT = 60  # seconds before idle engines beyond the reserve stop
+
 
 class Engine:
 
@@ -25,20 +33,31 @@ class Engine:
         WAITING = 0
         INITING = 1
         RUNNING = 2
+        STARTING = 3
+        STOPPING = 4
+        STOPPED = 5
 
-    def __init__(self, parent, instance_id, index, session_path, conn_root):
+    def __init__(self, parent, index, session_path, conn_root):
         self._parent = parent
-        self._instance_id = instance_id
         self._index = index
         self._session_path = session_path
         self._conn_root = conn_root
 
         self.analysis = None
-        self.status = Engine.Status.WAITING
+        self.manager = None  # the EngineManager the analysis belongs to
+        self.status = Engine.Status.STOPPED
+        self.idle_since = None
+
+        self._revision = None      # of the analysis being run
+        self._results_key = None   # the results cache key of the run
+        self._run_started = None
+        self._cancelled = False    # the run was aborted, with none to follow
+        self._columns_read = { }   # column name -> data version, of the run
+        self._aborts = { }         # revision -> (requested, run time, expected)
 
         self._process = None
         self._socket = None
-        self._thread = None
+        self._ioloop = None
         self._message_id = 0
         self._restarting = False
         self._stopping = False
@@ -48,8 +67,22 @@ class Engine:
     def is_waiting(self):
         return self.status is Engine.Status.WAITING
 
+    @property
+    def is_busy(self):
+        return self.status is Engine.Status.INITING or self.status is Engine.Status.RUNNING
+
+    @property
+    def is_stopped(self):
+        return self.status is Engine.Status.STOPPED
+
     def start(self):
 
+        self.status = Engine.Status.STARTING
+        self._stopping = False
+        self._stopped = False
+        self._cancelled = False
+        self._aborts = { }
+
         exe_dir = path.join(conf.get('home'), 'bin')
         exe_path = path.join(exe_dir, 'jamovi-engine')
 
@@ -75,17 +108,29 @@ class Engine:
             stderr=stderr)
 
         self._socket = nanomsg.Socket(nanomsg.PAIR)
-        self._socket._set_recv_timeout(500)
         self._socket.bind(address)
 
-        self._thread = threading.Thread(target=self._run)
-        self._thread.start()
+        # messages are received on the IOLoop as they arrive, and the
+        # process is waited on by a thread, so everything else (sends,
+        # results to the clients) happens on the IOLoop too
+
+        self._ioloop = IOLoop.current()
+        self._ioloop.add_handler(self._socket.recv_fd, self._on_readable, IOLoop.READ)
+
+        thread = threading.Thread(target=self._wait, args=(self._process,))
+        thread.daemon = True
+        thread.start()
+
+        if self._restarting:
+            self._restarting = False
+            self._parent._notify_engine_restarted(self)
 
     def stop(self):
         if self._stopped:
             return
 
         self._stopping = True
+        self.status = Engine.Status.STOPPING
         self._message_id += 1
 
         request = jcoms.AnalysisRequest()
@@ -102,30 +147,61 @@ class Engine:
         self._restarting = True
         self.stop()
 
-    def _run(self):
-        parent = threading.main_thread()
+    def abort(self):
+        # the engine stops the run at its next checkpoint, and lets us know
+        # when it has. the engine is then free for other analyses
 
-        if self._restarting:
-            self._parent._notify_engine_restarted(self)
-            self._restarting = False
+        self._cancelled = True
+        self._abort_requested()
+        self._message_id += 1
 
-        while parent.is_alive():
-            try:
-                bytes = self._socket.recv()
-                message = jcoms.ComsMessage()
-                message.ParseFromString(bytes)
-                self._receive(message)
+        request = jcoms.AnalysisRequest()
+        request.datasetId = self.manager.instance_id
+        request.analysisId = self.analysis.id
+        request.revision = self._revision
+        request.perform = jcoms.AnalysisRequest.Perform.Value('ABORT')
+
+        message = jcoms.ComsMessage()
+        message.id = self._message_id
+        message.payload = request.SerializeToString()
+        message.payloadType = 'AnalysisRequest'
+
+        self._socket.send(message.SerializeToString())
 
+    def _abort_requested(self):
+        now = time.time()
+        expected = self.manager.run_times.get(self.analysis.id)
+        if self.status is not Engine.Status.RUNNING:
+            expected = None  # run times are only known for runs, not inits
+        self._aborts[self._revision] = (now, now - self._run_started, expected)
+
+    def _wait(self, process):
+        process.wait()
+        self._ioloop.add_callback(self._on_exit, process)
+
+    def _on_readable(self, fd, events):
+        while True:
+            try:
+                bytes = self._socket.recv(flags=nanomsg.DONTWAIT)
             except nanomsg.NanoMsgAPIError as e:
-                if e.errno != nanomsg.ETIMEDOUT and e.errno != nanomsg.EAGAIN:
+                if e.errno != nanomsg.EAGAIN:
                     raise e
-
-            self._process.poll()
-            if self._process.returncode is not None:
-                if self._restarting is False and self._stopping is False:
-                    log.error('Engine process terminated with exit code {}\n'.format(self._process.returncode))
                 break
+            message = jcoms.ComsMessage()
+            message.ParseFromString(bytes)
+            self._receive(message)
+
+    def _on_exit(self, process):
+        if process is not self._process:
+            return
 
+        # anything sent before it exited is still received
+        self._on_readable(None, None)
+
+        if self._restarting is False and self._stopping is False:
+            log.error('Engine process terminated with exit code {}\n'.format(process.returncode))
+
+        self._ioloop.remove_handler(self._socket.recv_fd)
         self._socket.close()
         if self._restarting:
             log.info('Restarting engine')
@@ -133,20 +209,33 @@ class Engine:
             self.start()
         else:
             self._stopped = True
-            self._parent._notify_engine_event({ 'type': 'terminated' })
+            self.status = Engine.Status.STOPPED
+            if self._stopping is False:
+                self._parent._notify_engine_terminated(self)
 
     def __del__(self):
         if self._process is not None:
             self._process.terminate()
 
-    def send(self, analysis, run=True):
+    def send(self, manager, analysis, run=True):
+
+        if analysis is self.analysis and self.status is not Engine.Status.WAITING:
+            # a new revision of the analysis being run; the engine stops
+            # the old run at its next checkpoint
+            self._abort_requested()
 
         self._message_id += 1
+        self._revision = analysis.revision
+        self._run_started = time.time()
+        self._cancelled = False
+        self._results_key = manager.results_key(analysis) if run else None
+        self._columns_read = { }
+        self.manager = manager
         self.analysis = analysis
         analysis.status = Analysis.Status.RUNNING
 
         request = jcoms.AnalysisRequest()
-        request.datasetId = self._instance_id
+        request.datasetId = manager.instance_id
         request.analysisId = analysis.id
         request.name = analysis.name
         request.ns = analysis.ns
@@ -171,71 +260,399 @@ class Engine:
 
     def _receive(self, message):
 
-        if self.status is Engine.Status.WAITING:
+        if message.payloadType == 'EngineReady':
+            self.status = Engine.Status.WAITING
+            self.idle_since = time.time()
+            self._parent._send_next()
+        elif message.payloadType == 'ColumnsRead':
+            columns = jcoms.ColumnsRead()
+            columns.ParseFromString(message.payload)
+            analysis = self.analysis
+            if analysis is not None and (columns.analysisId, columns.revision) == (analysis.id, self._revision):
+                self._columns_read.update(zip(columns.names, columns.versions))
+        elif self.status is Engine.Status.STOPPING:
+            pass
+        elif self.status is Engine.Status.WAITING:
             log.info('id : {}, response received when not running'.format(message.id))
         else:
             results = jcoms.AnalysisResponse()
             results.ParseFromString(message.payload)
 
-            if results.revision == self.analysis.revision:
+            if results.status == jcoms.AnalysisStatus.Value('ANALYSIS_ABORTED'):
+                abort = self._aborts.pop(results.revision, None)
+                if abort is not None:
+                    requested, run_time, expected = abort
+                    self._parent._notify_run_aborted(
+                        time.time() - requested, run_time, expected)
+                if self._cancelled and results.revision == self._revision:
+                    self._run_complete()
+
+            elif results.revision == self.analysis.revision:
                 complete = False
                 if results.incAsText and results.status == jcoms.AnalysisStatus.Value('ANALYSIS_COMPLETE'):
                     complete = True
                 elif self.status == Engine.Status.INITING and results.status == jcoms.AnalysisStatus.Value('ANALYSIS_INITED'):
                     complete = True
 
-                self.analysis.set_results(results)
+                if self._cancelled:
+                    # the run finished before the abort arrived
+                    self._aborts.pop(results.revision, None)
+                else:
+                    self.analysis.set_results(results)
 
                 if complete:
-                    self.status = Engine.Status.WAITING
-                    self.analysis = None
-                    self._parent._send_next()
-
-
-class EngineManager:
-
-    def __init__(self, instance_id, analyses, session_path):
-
-        self._instance_id = instance_id
-        self._analyses = analyses
-        self._analyses.add_options_changed_listener(self._send_next)
+                    if not self._cancelled:
+                        self.analysis.columns_read = self._columns_read
+                    if self.status is Engine.Status.RUNNING and not self._cancelled:
+                        self.manager.run_times[self.analysis.id] = time.time() - self._run_started
+                        if results.status == jcoms.AnalysisStatus.Value('ANALYSIS_COMPLETE'):
+                            self.manager.store_results(self._results_key, results)
+                    self._run_complete()
+
+    def _run_complete(self):
+        self.status = Engine.Status.WAITING
+        self.idle_since = time.time()
+        self.analysis = None
+        self.manager = None
+        self._cancelled = False
+        self._parent._send_next()
+
+
+class EnginePool:
+
+    # the engines are shared by all the instances, rather than each
+    # instance having its own. waiting engines are given to the instances
+    # with analyses to run in turn, so a busy instance can use every
+    # engine, but can't hold up the others
+    #
+    # engines are either all started with the pool, or with
+    # JAMOVI_ENGINE_SPAWN=lazy, started as analyses need them. lazily,
+    # JAMOVI_ENGINE_RESERVE (default 1) engines are kept started but idle,
+    # so analyses don't wait for R to start, and other idle engines are
+    # stopped after a time
+
+    _instance = None
+
+    @classmethod
+    def instance(cls, session_path):
+        if cls._instance is None:
+            lazy = conf.get('engine_spawn') == 'lazy'
+            reserve = conf.get('engine_reserve')
+            if reserve is None or reserve == '':
+                reserve = 1
+            cls._instance = EnginePool(
+                session_path,
+                EnginePool._default_size(),
+                lazy=lazy,
+                reserve=int(reserve))
+            cls._instance.start()
+        return cls._instance
+
+    @classmethod
+    def current(cls):
+        # the pool, if one has been started, without starting one
+        return cls._instance
+
+    @staticmethod
+    def _default_size():
+        # JAMOVI_ENGINE_COUNT; otherwise an engine per core, as many as
+        # there is memory for
+        count = conf.get('engine_count')
+        if count is not None and count != '':
+            return max(1, int(count))
+
+        count = os.cpu_count() or 1
+        try:
+            memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+            count = min(count, memory // MEMORY_PER_ENGINE)
+        except (AttributeError, ValueError, OSError):
+            pass  # not available on windows
+
+        return max(1, count)
+
+    def __init__(self, session_path, size, lazy=False, reserve=1):
 
         if platform.uname().system == 'Windows':
-            self._conn_root = "ipc://{}".format(instance_id)
+            self._conn_root = "ipc://{}".format(os.getpid())
         else:
             self._dir = tempfile.TemporaryDirectory()  # assigned to self so it doesn't get cleaned up
             self._conn_root = "ipc://{}/conn".format(self._dir.name)
 
-        self._engine_listeners  = [ ]
+        self._lock = threading.RLock()
+        self._managers = [ ]
+        self._next_manager = 0
+
+        self._lazy = lazy
+        self._reserve = max(0, reserve)
+        self._stop_idle_callback = None
+
+        self._aborts = 0
+        self._abort_latency = 0.0  # total, in seconds
+        self._aborted_run_time = 0.0
+        self._run_time_saved = 0.0
+
+        self._restarting = False
+        self._engines_restarting = 0
+        self._engines_restarted = 0
+        self._rerun_managers = set()
+        self._interrupted = [ ]
 
         self._engines = [ ]
-        for index in range(3):
+        for index in range(size):
             engine = Engine(
                 parent=self,
-                instance_id=instance_id,
                 index=index,
                 session_path=session_path,
                 conn_root=self._conn_root)
             self._engines.append(engine)
 
     def start(self):
-        for index in range(len(self._engines)):
-            self._engines[index].start()
+        if self._lazy:
+            log.info('Starting up to {} engines as required'.format(len(self._engines)))
+            with self._lock:
+                self._spawn(0)
+            self._stop_idle_callback = PeriodicCallback(self._stop_idle, 10000)
+            self._stop_idle_callback.start()
+        else:
+            log.info('Starting {} engines'.format(len(self._engines)))
+            for engine in self._engines:
+                engine.start()
+
+    def _spawn(self, required):
+        # starts engines so there are enough for the analyses waiting
+        # to run, plus the reserve
+        idle = [ e for e in self._engines
+                 if e.status is Engine.Status.STARTING or e.is_waiting ]
+        stopped = [ e for e in self._engines if e.is_stopped ]
+        count = required + self._reserve - len(idle)
+        for engine in stopped[:max(0, count)]:
+            engine.start()
+
+    def _stop_idle(self):
+        with self._lock:
+            if self._restarting:
+                return
+            now = time.time()
+            idle = [ e for e in self._engines
+                     if e.status is Engine.Status.STARTING or e.is_waiting ]
+            for engine in idle[self._reserve:]:
+                if engine.is_waiting and now - engine.idle_since > IDLE_TIMEOUT:
+                    engine.stop()
+
+    def add(self, manager):
+        with self._lock:
+            self._managers.append(manager)
+        self._send_next()
+
+    def remove(self, manager):
+        with self._lock:
+            self._managers.remove(manager)
+            self._rerun_managers.discard(manager)
+            for engine in self._engines:
+                if engine.manager is manager and engine.is_busy:
+                    engine.abort()
+
+    def is_running(self, manager):
+        with self._lock:
+            return any(e.manager is manager for e in self._engines)
+
+    def restart(self, manager):
+        # the engines are restarted once, however many instances ask,
+        # and the analyses of those that asked are rerun
+        with self._lock:
+            self._rerun_managers.add(manager)
+            if self._restarting:
+                return
+            self._interrupted = [ (engine.manager, engine.analysis)
+                                  for engine in self._engines
+                                  if engine.analysis is not None ]
+            started = [ e for e in self._engines if not e.is_stopped ]
+            if len(started) > 0:
+                self._restarting = True
+                self._engines_restarting = len(started)
+                self._engines_restarted = 0
+                for engine in started:
+                    engine.restart()
+                return
+
+        self._rerun()
+
+    def _notify_engine_restarted(self, engine):
+        with self._lock:
+            self._engines_restarted += 1
+            if self._engines_restarted < self._engines_restarting:
+                return
+        self._rerun()
+
+    def _rerun(self):
+        with self._lock:
+            for engine in self._engines:
+                engine.analysis = None
+                engine.manager = None
+
+            managers = self._rerun_managers
+            interrupted = self._interrupted
+            self._rerun_managers = set()
+            self._interrupted = [ ]
+            self._restarting = False
+
+        for manager in managers:
+            for analysis in manager.analyses:
+                analysis.rerun()
+
+        # analyses of other instances which were running are run again
+        for manager, analysis in interrupted:
+            if manager not in managers:
+                analysis.rerun()
+
+    def _notify_engine_terminated(self, engine):
+        if not threading.main_thread().is_alive():
+            return
+
+        log.error('Engine {} terminated; starting a new one'.format(engine._index))
+
+        with self._lock:
+            manager = engine.manager
+            engine.analysis = None
+            engine.manager = None
+            engine.start()
+
+        if manager is not None:
+            manager._notify_engine_event({ 'type': 'terminated' })
+
+        self._send_next()
+
+    def _next_request(self):
+        # the instances are taken in turn, starting after the last one
+        # given an engine
+        count = len(self._managers)
+        for i in range(count):
+            index = (self._next_manager + i) % count
+            manager = self._managers[index]
+            analysis, run = manager.next_request()
+            if analysis is not None:
+                self._next_manager = (index + 1) % count
+                return manager, analysis, run
+        return None, None, None
+
+    def _send_next(self, analysis=None):
+        with self._lock:
+            if self._restarting:
+                return
+
+            if analysis is not None:
+                for engine in self._engines:
+                    if analysis is engine.analysis:
+                        if analysis.status is Analysis.Status.DELETED:
+                            engine.abort()
+                        elif engine.manager.results_from_cache(analysis):
+                            engine.abort()
+                        else:
+                            engine.send(engine.manager, analysis)
+
+            for engine in self._engines:
+                if not engine.is_waiting:
+                    continue
+                manager, analysis, run = self._next_request()
+                if analysis is None:
+                    break
+                manager.runs += 1
+                engine.send(manager, analysis, run)
+
+            if self._lazy:
+                required = sum([ manager.queued for manager in self._managers ])
+                self._spawn(required)
+
+    def _notify_run_aborted(self, latency, run_time, expected):
+        # expected is how long the analysis's last run took; what remained
+        # of that when the run stopped is an estimate of the time saved
+        with self._lock:
+            self._aborts += 1
+            self._abort_latency += latency
+            run_time += latency
+            self._aborted_run_time += run_time
+            if expected is not None:
+                self._run_time_saved += max(0.0, expected - run_time)
+
+    @property
+    def stats(self):
+        # the instances' figures are totals; instance ids act as access
+        # tokens for the instances' resources, so aren't given out here
+        with self._lock:
+            cache = { 'hits': 0, 'misses': 0, 'entries': 0, 'size': 0 }
+            for manager in self._managers:
+                manager_cache = manager.cache_stats
+                if manager_cache is not None:
+                    for key in cache:
+                        cache[key] += manager_cache[key]
+
+            instances = {
+                'count': len(self._managers),
+                'running': len([ e for e in self._engines if e.manager is not None ]),
+                'queued': sum([ m.queued for m in self._managers ]),
+                'runs': sum([ m.runs for m in self._managers ]),
+                'cache': cache,
+            }
+
+            statuses = [ e.status for e in self._engines ]
+            busy = [ e for e in self._engines if e.is_busy ]
+
+            return {
+                'size': len(self._engines),
+                'lazy': self._lazy,
+                'reserve': self._reserve,
+                'busy': len(busy),
+                'waiting': statuses.count(Engine.Status.WAITING),
+                'starting': statuses.count(Engine.Status.STARTING),
+                'stopped': statuses.count(Engine.Status.STOPPED),
+                'restarting': self._restarting,
+                'aborts': {
+                    'count': self._aborts,
+                    'mean_latency': self._abort_latency / max(1, self._aborts),
+                    'run_time': self._aborted_run_time,
+                    'run_time_saved': self._run_time_saved,
+                },
+                'instances': instances,
+            }
+
+
+class EngineManager:
+
+    # an instance's view of the engine pool
+
+    def __init__(self, instance_id, analyses, session_path):
+
+        self.instance_id = instance_id
+        self.analyses = analyses
+        self.runs = 0  # analyses sent to engines
+        self.run_times = { }  # analysis id -> duration of its last run
+
+        self._session_path = session_path
+        self._pool = None
+        self._engine_listeners = [ ]
+
+        self._results_cache = None
+        self._results_key = None
+        self._keys = { }       # analysis id -> (revision, results key)
+        self._missed = set()   # keys of results not in the cache
+
+    def start(self):
+        self._pool = EnginePool.instance(self._session_path)
+        self.analyses.add_options_changed_listener(self._on_options_changed)
+        self._pool.add(self)
 
     def stop(self):
-        for index in range(len(self._engines)):
-            self._engines[index].stop()
+        self.analyses.remove_options_changed_listener(self._on_options_changed)
+        self._pool.remove(self)
 
     def restart_engines(self):
-        self._engines_restarted = 0
-        for index in range(len(self._engines)):
-            self._engines[index].restart()
+        self._pool.restart(self)
 
-    def _notify_engine_restarted(self, engine):
-        self._engines_restarted += 1
-        if self._engines_restarted == len(self._engines):
-            for analysis in self._analyses:
-                analysis.rerun()
+    @property
+    def is_running(self):
+        # whether engines are running (or initing) any of the analyses, and
+        # so may be reading the data set
+        return self._pool is not None and self._pool.is_running(self)
 
     def add_engine_listener(self, listener):
         self._engine_listeners.append(listener)
@@ -244,17 +661,100 @@ class EngineManager:
         for listener in self._engine_listeners:
             listener(event)
 
+    def set_results_cache(self, cache, key):
+        # key(analysis) is the cache key for the analysis's results
+        self._results_cache = cache
+        self._results_key = key
+
+    def data_changed(self):
+        # the keys depend on the data, so are worked out again
+        self._keys.clear()
+        self._missed.clear()
+
+    def results_key(self, analysis):
+        # a key is worked out once for each revision of an analysis (and
+        # of the data), rather than each time the queue is looked through
+        if self._results_cache is None:
+            return None
+        entry = self._keys.get(analysis.id)
+        if entry is None or entry[0] != analysis.revision:
+            entry = (analysis.revision, self._results_key(analysis))
+            self._keys[analysis.id] = entry
+        return entry[1]
+
+    def results_from_cache(self, analysis):
+        # gives the analysis its results from the cache, if they're there.
+        # a miss is remembered, so isn't looked up (and counted) again
+        if self._results_cache is None:
+            return False
+
+        key = self.results_key(analysis)
+        if key in self._missed:
+            return False
+
+        content = self._results_cache.get(key)
+        if content is None:
+            self._missed.add(key)
+            return False
+
+        results = jcoms.AnalysisResponse()
+        results.ParseFromString(content)
+
+        # images are files, and may have since been removed
+        instance_path = path.join(self._session_path, self.instance_id)
+        for resource in Analysis._get_resources(results.results):
+            if not path.exists(path.join(instance_path, resource)):
+                self._results_cache.discard(key)
+                self._missed.add(key)
+                return False
+
+        results.datasetId = self.instance_id
+        results.revision = analysis.revision
+        analysis.set_results(results)
+        analysis.columns_read = None  # not known, the options are used instead
+
+        return True
+
+    def store_results(self, key, results):
+        if self._results_cache is not None and key is not None:
+            self._results_cache.put(key, results.SerializeToString())
+            self._missed.discard(key)
+
+    @property
+    def cache_stats(self):
+        cache = self._results_cache
+        if cache is None:
+            return None
+        return {
+            'hits': cache.hits,
+            'misses': cache.misses,
+            'entries': len(cache),
+            'size': cache.size,
+        }
+
+    def next_request(self):
+        # analyses are inited before any are run, and neither happens for
+        # analyses with results in the cache
+        for analysis in self.analyses.need_init:
+            if not self.results_from_cache(analysis):
+                return analysis, False
+        for analysis in self.analyses.need_run:
+            if not self.results_from_cache(analysis):
+                return analysis, True
+        return None, False
+
+    @property
+    def queued(self):
+        return len(list(self.analyses.need_run))
+
+    def _on_options_changed(self, analysis):
+        # the key is worked out as the analysis is queued, from the data
+        # as it is now, rather than when it's sent to an engine
+        if analysis.status is Analysis.Status.DELETED:
+            self._keys.pop(analysis.id, None)
+        elif analysis.status is Analysis.Status.NONE:
+            self.results_key(analysis)
+        self._send_next(analysis)
+
     def _send_next(self, analysis=None):
-        if analysis is not None:
-            for engine in self._engines:
-                if analysis is engine.analysis:
-                    engine.send(analysis)
-        for engine in self._engines:
-            if engine.is_waiting:
-                for analysis in self._analyses.need_init:
-                    engine.send(analysis, False)
-                    break
-            if engine.is_waiting:
-                for analysis in self._analyses.need_run:
-                    engine.send(analysis, True)
-                    break
+        self._pool._send_next(analysis)
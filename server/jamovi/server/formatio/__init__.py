@@ -7,7 +7,7 @@ from . import blank
 from . import jasp
 
 
-def read(data, path, is_example=False):
+def read(data, path, is_example=False, prog_cb=None):
 
     if is_example:
         data.title = os.path.splitext(os.path.basename(path))[0]
@@ -17,15 +17,15 @@ def read(data, path, is_example=False):
     if path == '':
         blank.read(data)
     elif path.endswith('.csv') or path.endswith('.txt'):
-        csv.read(data, path)
+        csv.read(data, path, prog_cb)
     elif path.endswith('.jasp'):
-        jasp.read(data, path)
+        jasp.read(data, path, prog_cb)
     else:
-        omv.read(data, path, is_example)
+        omv.read(data, path, is_example, prog_cb)
 
 
-def write(data, path):
-    omv.write(data, path)
+def write(data, path, compress_level=None, prog_cb=None):
+    omv.write(data, path, compress_level, prog_cb)
 
 
 def is_supported(filename):
@@ -3,22 +3,18 @@
 #
 
 import csv
-from ...core import MeasureType
-
+import os.path
+from itertools import islice
+from functools import partial
+from array import array
 
-def calc_dps(value, max_dp=3):
-    max_dp_required = 0
-    value %= 1
-    as_string = '{v:.{dp}f}'.format(v=value, dp=max_dp)
-    as_string = as_string[2:]
+from ...core import MeasureType
 
-    for dp in range(max_dp, 0, -1):
-        index = dp - 1
-        if as_string[index] != '0':
-            max_dp_required = dp
-            break
+CHUNK_SIZE = 10000   # rows read and written at a time
+MANY_UNIQUES = 49    # integer columns with this many levels are continuous
 
-    return max_dp_required
+MISSING_INT = -2147483648
+MISSING_FLOAT = float('nan')
 
 
 def fix_names(names):
@@ -36,7 +32,9 @@ def fix_names(names):
     return names
 
 
-def read(data, path):
+def read(data, path, prog_cb=None):
+
+    file_size = os.path.getsize(path)
 
     with open(path, encoding='utf-8-sig') as csvfile:
         try:
@@ -49,167 +47,261 @@ def read(data, path):
         csvfile.seek(0)
         reader = csv.reader(csvfile, dialect)
 
-        itr = reader.__iter__()
-        column_names = itr.__next__()
-
-        column_count = 0
-        column_writers = [ ]
-
+        column_names = reader.__next__()
         column_names = fix_names(column_names)
+        column_count = len(column_names)
 
-        for i in range(len(column_names)):
-            column_name = column_names[i]
-            data.dataset.append_column(column_name)
-            column = data.dataset[i]
-            column_writers.append(ColumnWriter(column, i))
-            column_count += 1
+        column_builders = [ ]
+
+        for index, column_name in enumerate(column_names):
+            column = data.dataset.append_column(column_name)
+            reread = partial(read_cells, path, dialect, index)
+            column_builders.append(ColumnBuilder(column, reread))
 
         row_count = 0
 
-        csvfile.seek(0)
-        reader = csv.reader(csvfile, dialect)
-        first = True
+        # the file is read a single time, a chunk of rows at a time. each
+        # chunk is examined (retyping a column if the chunk doesn't fit the
+        # type inferred so far) and then written to the data set
 
-        for row in reader:
-            if first:
-                first = False
-            else:
-                for i in range(column_count):
-                    column_writers[i].examine_row(row)
+        while True:
+            rows = list(islice(reader, CHUNK_SIZE))
+            if len(rows) == 0:
+                break
 
-                row_count += 1
+            cells = transpose(rows, column_count)
 
-        for column_writer in column_writers:
-            column_writer.ruminate()
+            for i in range(column_count):
+                column_builders[i].examine(cells[i], row_count)
 
-        data.dataset.set_row_count(row_count)
+            if row_count == 0:
+                # the columns' types are known now, so room for the rows
+                # (estimated from the bytes read for the first chunk) is
+                # reserved up front
+                position = csvfile.buffer.tell()
+                if position < file_size:
+                    data.dataset.reserve(len(rows) * file_size // position)
 
-        csvfile.seek(0)
+            data.dataset.set_row_count(row_count + len(rows))
+
+            for column_builder in column_builders:
+                column_builder.write(row_count)
+
+            row_count += len(rows)
+
+            if prog_cb is not None:
+                # the position of the underlying binary file, which is
+                # read ahead of the rows parsed so far
+                prog_cb(min(csvfile.buffer.tell(), file_size), file_size)
+
+        for column_builder in column_builders:
+            column_builder.finalise()
+
+
+def read_cells(path, dialect, index, row_count):
+
+    # the cells of a single column for the first row_count rows, read
+    # again from the file a chunk at a time. this is for columns which
+    # turn out to be text, after rows have been written as numbers
+
+    with open(path, encoding='utf-8-sig') as csvfile:
         reader = csv.reader(csvfile, dialect)
-        first = True
+        reader.__next__()
 
-        row_no = 0
+        while row_count > 0:
+            rows = list(islice(reader, min(CHUNK_SIZE, row_count)))
+            if len(rows) == 0:
+                break
+            row_count -= len(rows)
+            yield [ row[index] if index < len(row) else '' for row in rows ]
 
-        for row in reader:
-            if first:
-                first = False
-            else:
-                for i in range(column_count):
-                    column_writers[i].parse_row(row, row_no)
-                row_no += 1
 
+def transpose(rows, column_count):
+    for i in range(len(rows)):
+        row = rows[i]
+        if len(row) < column_count:
+            rows[i] = row + [ '' ] * (column_count - len(row))
+    return list(zip(*rows))[:column_count]
 
-class ColumnWriter:
-    def __init__(self, column, column_index):
+
+class ColumnBuilder:
+
+    # columns start out as (empty) NOMINAL columns, and are widened to
+    # CONTINUOUS, then to NOMINAL_TEXT as values are encountered which
+    # can't be represented by the current type
+
+    def __init__(self, column, reread):
         self._column = column
-        self._column_index = column_index
+        self._reread = reread   # the cells of the rows so far, as text
 
-        self._only_integers = True
-        self._only_floats = True
-        self._is_empty = True
-        self._unique_values = set()
-        self._measure_type = None
-        self._ruminated = False
-        self._includes_na = False
-        self._dps = 0
+        self._measure_type = MeasureType.NOMINAL
+        self._levels = set()    # the integer levels of a NOMINAL column
+        self._codes = { }       # label -> code for a NOMINAL_TEXT column
+        self._pending = None    # codes not yet written to the column
 
-    def examine_row(self, row):
+        self._values = None
 
-        if self._column_index >= len(row):
-            return
+    def examine(self, cells, row_offset):
 
-        value = row[self._column_index]
+        measure_type = self._measure_type
+        values = None
 
-        if value == 'NA':
-            self._includes_na = True
-            return
+        if measure_type is MeasureType.NOMINAL:
+            values = self._parse_ints(cells)
+            if values is None:
+                measure_type = MeasureType.CONTINUOUS
+            else:
+                new_levels = set(values)
+                new_levels.discard(MISSING_INT)
+                new_levels -= self._levels
+                if len(self._levels) + len(new_levels) >= MANY_UNIQUES:
+                    measure_type = MeasureType.CONTINUOUS
+                    values = [ MISSING_FLOAT if v == MISSING_INT else float(v) for v in values ]
+                else:
+                    for level in sorted(new_levels):
+                        self._column.insert_level(level, str(level))
+                    self._levels |= new_levels
+
+        if measure_type is MeasureType.CONTINUOUS and values is None:
+            values = self._parse_floats(cells)
+            if values is None:
+                measure_type = MeasureType.NOMINAL_TEXT
+
+        if measure_type is not self._measure_type:
+            self._retype(measure_type, row_offset)
+
+        if measure_type is MeasureType.NOMINAL_TEXT:
+            values = self._parse_labels(cells)
+
+        self._values = values
+
+    def write(self, row_offset):
+        if self._measure_type is MeasureType.CONTINUOUS:
+            values = array('d', self._values)
+        else:
+            values = array('i', self._values)
 
-        if value == '' or value == ' ':
-            return
+        if self._pending is not None:
+            self._pending.extend(values)
         else:
-            self._is_empty = False
+            self._column.write_range(row_offset, values)
 
-        self._unique_values.add(value)
+        self._values = None
 
-        if self._only_integers:
-            try:
-                i = int(value)
-                if i > 2147483647 or i < -2147483648:
-                    self._only_integers = False
-            except ValueError:
-                self._only_integers = False
+    def finalise(self):
 
-        try:
-            f = float(value)
-            self._dps = max(self._dps, calc_dps(f))
-        except ValueError:
-            self._only_floats = False
-
-    def ruminate(self):
-
-        many_uniques = False
-        if len(self._unique_values) >= 49:
-            many_uniques = True
-
-        if self._only_integers and many_uniques is False:
-            self._measure_type = MeasureType.NOMINAL
-            self._unique_values = list(self._unique_values)
-            self._unique_values = list(map(lambda x: int(x), self._unique_values))
-            self._unique_values.sort()
-            for level in self._unique_values:
-                self._column.append_level(level, str(level))
-        elif self._only_floats:
-            self._measure_type = MeasureType.CONTINUOUS
-        else:
-            self._measure_type = MeasureType.NOMINAL_TEXT
-            self._unique_values = list(self._unique_values)
-            if self._includes_na:
-                self._unique_values.append('NA')
-            self._unique_values.sort()
-            for i in range(0, len(self._unique_values)):
-                label = self._unique_values[i]
-                self._column.append_level(i, label)
-
-        self._ruminated = True
-        self._column.measure_type = self._measure_type
-        self._column.dps = self._dps
-
-    def parse_row(self, row, row_no):
-
-        if self._ruminated is False:
-            self.ruminate()
-
-        if self._column_index >= len(row):
-            value = None
-        else:
-            value = row[self._column_index]
+        if self._pending is not None:
+            self._write_pending()
 
-            # we treat NAs as missings, unless it's a text column
-            # NA could be an actual value so we play it safe
+        self._column.determine_dps()
 
-            if value == 'NA' and self._measure_type != MeasureType.NOMINAL_TEXT:
-                value = None
-            elif value == '' or value == ' ':
-                value = None
+    def _write_pending(self):
 
-        if self._measure_type == MeasureType.NOMINAL or self._measure_type == MeasureType.ORDINAL:
-            if value is None:
-                self._column[row_no] = -2147483648
-            else:
-                self._column[row_no] = int(value)
+        # the column's levels are added once, sorted, and the codes
+        # (which were assigned in the order encountered) are mapped onto
+        # them as they're written
 
-        elif self._measure_type == MeasureType.CONTINUOUS:
-            if value is None:
-                self._column[row_no] = float('nan')
-            else:
-                self._column[row_no] = float(value)
+        recode = [ 0 ] * len(self._codes)
+        for value, label in enumerate(sorted(self._codes)):
+            recode[self._codes[label]] = value
+            self._column.append_level(value, label)
+        recode = dict(enumerate(recode))
+        recode[MISSING_INT] = MISSING_INT
 
-        elif self._measure_type == MeasureType.NOMINAL_TEXT:
+        pending = self._pending
+        self._pending = None
 
-            if value is None:
-                self._column[row_no] = -2147483648
-            else:
-                self._column[row_no] = self._unique_values.index(value)
+        for row_no in range(0, len(pending), CHUNK_SIZE):
+            codes = pending[row_no:row_no + CHUNK_SIZE]
+            codes = array('i', [ recode[code] for code in codes ])
+            self._column.write_range(row_no, codes)
+
+    def _retype(self, measure_type, row_count):
+
+        column = self._column
 
+        if row_count == 0:
+            column.clear_levels()
+            column.measure_type = measure_type
+        elif measure_type is MeasureType.NOMINAL_TEXT:
+            # the numbers written so far are blanked, rather than
+            # converted; the rows are read again as text below
+            if self._measure_type is MeasureType.CONTINUOUS:
+                blank = array('d', [ MISSING_FLOAT ]) * row_count
+            else:
+                blank = array('i', [ MISSING_INT ]) * row_count
+            column.write_range(0, blank)
+            column.change(measure_type)
         else:
-            self._column[row_no] = -2147483648
+            # integers become floats, the same as when the user changes
+            # the measure type
+            column.determine_dps()
+            column.change(measure_type)
+
+        self._measure_type = measure_type
+        self._levels = None
+
+        if measure_type is MeasureType.NOMINAL_TEXT:
+            # the codes are kept until the end, and the levels added in
+            # sorted order. rows already read are parsed again from their
+            # text, so their labels are as they appear in the file ('007'
+            # stays '007', not '7.0') whichever chunk the column turned
+            # out to be text in. NAs are only missing in numeric columns,
+            # so here they become 'NA' labels
+            self._codes = { }
+            self._pending = array('i')
+            if row_count > 0:
+                for cells in self._reread(row_count):
+                    self._pending.extend(self._parse_labels(cells))
+
+    def _parse_ints(self, cells):
+        values = [ ]
+        for value in cells:
+            if value == '' or value == ' ' or value == 'NA':
+                values.append(MISSING_INT)
+            else:
+                try:
+                    value = int(value)
+                except ValueError:
+                    return None
+                if value > 2147483647 or value < -2147483648:
+                    return None
+                values.append(value)
+
+        return values
+
+    def _parse_floats(self, cells):
+        values = [ ]
+        for value in cells:
+            if value == '' or value == ' ' or value == 'NA':
+                values.append(MISSING_FLOAT)
+            else:
+                try:
+                    value = float(value)
+                except ValueError:
+                    return None
+                values.append(value)
+
+        return values
+
+    def _parse_labels(self, cells):
+        values = [ ]
+        codes = self._codes
+
+        for value in cells:
+            if value == '' or value == ' ':
+                values.append(MISSING_INT)
+            else:
+                code = codes.get(value)
+                if code is None:
+                    code = self._code_for_label(value)
+                values.append(code)
+
+        return values
+
+    def _code_for_label(self, label):
+        # codes are assigned in the order labels are encountered, and
+        # mapped onto the sorted levels at the end (see _write_pending())
+        code = len(self._codes)
+        self._codes[label] = code
+        return code
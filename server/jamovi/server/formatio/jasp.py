@@ -3,17 +3,25 @@ import zipfile
 from zipfile import ZipFile
 import io
 import json
-from tempfile import NamedTemporaryFile, TemporaryDirectory
-import struct
-import os
-import os.path
 
 from ...core import MeasureType
+from .omv import read_data
+from .omv import write_data
+from .omv import create_zip
 
 
-def write(data, path):
+def write(data, path, compress_level=None):
 
-    with ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip:
+    # a compress_level of 0 stores the file uncompressed, otherwise
+    # 1 (fastest) to 9 (smallest), or None for zlib's default
+
+    if compress_level == 0:
+        compression = zipfile.ZIP_STORED
+        compress_level = None
+    else:
+        compression = zipfile.ZIP_DEFLATED
+
+    with create_zip(path, compression, compress_level) as zip:
         content = io.StringIO()
         content.write('Manifest-Version: 1.0\n')
         content.write('Created-By: JASP 0.7.5 Beta 2\n')
@@ -54,36 +62,10 @@ def write(data, path):
         zip.writestr('xdata.json', json.dumps(xdata), zipfile.ZIP_DEFLATED)
         xdata = None
 
-        row_count = data.dataset.row_count
-        required_bytes = 0
-        for column in data.dataset:
-            if column.measure_type == MeasureType.CONTINUOUS:
-                required_bytes += (8 * row_count)
-            else:
-                required_bytes += (4 * row_count)
-
-        temp_file = NamedTemporaryFile(delete=False)
-        temp_file.truncate(required_bytes)
-
-        for column in data.dataset:
-            if column.measure_type == MeasureType.CONTINUOUS:
-                for i in range(0, row_count):
-                    value = column.raw(i)
-                    byts = struct.pack('<d', value)
-                    temp_file.write(byts)
-            else:
-                for i in range(0, row_count):
-                    value = column.raw(i)
-                    byts = struct.pack('<i', value)
-                    temp_file.write(byts)
-
-        temp_file.close()
+        write_data(zip, data.dataset)
 
-        zip.write(temp_file.name, 'data.bin')
-        os.remove(temp_file.name)
 
-
-def read(data, path):
+def read(data, path, prog_cb=None):
 
     with ZipFile(path, 'r') as zip:
         # manifest = zip.read('META-INF/MANIFEST.MF')
@@ -114,23 +96,8 @@ def read(data, path):
         except:
             pass
 
-        with TemporaryDirectory() as dir:
-            zip.extract('data.bin', dir)
-            data_path = os.path.join(dir, 'data.bin')
-            data_file = open(data_path, 'rb')
-
-            for column in data.dataset:
-                if column.measure_type == MeasureType.CONTINUOUS:
-                    for i in range(row_count):
-                        byts = data_file.read(8)
-                        value = struct.unpack('<d', byts)
-                        column[i] = value[0]
-                else:
-                    for i in range(row_count):
-                        byts = data_file.read(4)
-                        value = struct.unpack('<i', byts)
-                        column[i] = value[0]
-            data_file.close()
+        with zip.open('data.bin') as data_file:
+            read_data(data_file, data.dataset, row_count, prog_cb)
 
         for column in data.dataset:
             column.determine_dps()
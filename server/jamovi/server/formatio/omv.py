@@ -2,19 +2,47 @@
 import zipfile
 from zipfile import ZipFile
 import io
+import sys
 import json
-from tempfile import NamedTemporaryFile, TemporaryDirectory
-import struct
+from array import array
 import os
 import os.path
 import re
+from tempfile import NamedTemporaryFile
 
 from ...core import MeasureType
 
+SLAB_SIZE = 1024 * 1024  # bytes of data.bin read or written at a time
 
-def write(data, path):
 
-    with ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip:
+# ZipFile takes a compresslevel from python 3.7, and ZipFile.open() can
+# write entries from 3.6. before then, deflate uses zlib's default level,
+# and data.bin is written to a temporary file first
+
+ZIP_COMPRESSLEVEL = sys.version_info >= (3, 7)
+ZIP_OPEN_WRITE = sys.version_info >= (3, 6)
+
+
+def create_zip(path, compression, compress_level):
+    if ZIP_COMPRESSLEVEL:
+        return ZipFile(path, 'w', compression, compresslevel=compress_level)
+    else:
+        return ZipFile(path, 'w', compression)
+
+
+def write(data, path, compress_level=None, prog_cb=None):
+
+    # a compress_level of 0 stores the file uncompressed, otherwise
+    # 1 (fastest) to 9 (smallest), or None for zlib's default. prog_cb
+    # is called with (progress, total) as data.bin is written, in bytes
+
+    if compress_level == 0:
+        compression = zipfile.ZIP_STORED
+        compress_level = None
+    else:
+        compression = zipfile.ZIP_DEFLATED
+
+    with create_zip(path, compression, compress_level) as zip:
         content = io.StringIO()
         content.write('Manifest-Version: 1.0\n')
         content.write('Created-By: jamovi\n')
@@ -56,33 +84,7 @@ def write(data, path):
         zip.writestr('xdata.json', json.dumps(xdata), zipfile.ZIP_DEFLATED)
         xdata = None
 
-        row_count = data.dataset.row_count
-        required_bytes = 0
-        for column in data.dataset:
-            if column.measure_type == MeasureType.CONTINUOUS:
-                required_bytes += (8 * row_count)
-            else:
-                required_bytes += (4 * row_count)
-
-        temp_file = NamedTemporaryFile(delete=False)
-        temp_file.truncate(required_bytes)
-
-        for column in data.dataset:
-            if column.measure_type == MeasureType.CONTINUOUS:
-                for i in range(0, row_count):
-                    value = column.raw(i)
-                    byts = struct.pack('<d', value)
-                    temp_file.write(byts)
-            else:
-                for i in range(0, row_count):
-                    value = column.raw(i)
-                    byts = struct.pack('<i', value)
-                    temp_file.write(byts)
-
-        temp_file.close()
-
-        zip.write(temp_file.name, 'data.bin')
-        os.remove(temp_file.name)
+        write_data(zip, data.dataset, prog_cb)
 
         resources = [ ]
 
@@ -101,7 +103,7 @@ def write(data, path):
     data.path = path
 
 
-def read(data, path, is_example=False):
+def read(data, path, is_example=False, prog_cb=None):
 
     data.title = os.path.splitext(os.path.basename(path))[0]
     if not is_example:
@@ -138,23 +140,8 @@ def read(data, path, is_example=False):
         except:
             pass
 
-        with TemporaryDirectory() as dir:
-            zip.extract('data.bin', dir)
-            data_path = os.path.join(dir, 'data.bin')
-            data_file = open(data_path, 'rb')
-
-            for column in data.dataset:
-                if column.measure_type == MeasureType.CONTINUOUS:
-                    for i in range(row_count):
-                        byts = data_file.read(8)
-                        value = struct.unpack('<d', byts)
-                        column[i] = value[0]
-                else:
-                    for i in range(row_count):
-                        byts = data_file.read(4)
-                        value = struct.unpack('<i', byts)
-                        column[i] = value[0]
-            data_file.close()
+        with zip.open('data.bin') as data_file:
+            read_data(data_file, data.dataset, row_count, prog_cb)
 
         for column in data.dataset:
             column.determine_dps()
@@ -168,3 +155,107 @@ def read(data, path, is_example=False):
                 data.analyses.create_from_serial(serial)
             elif is_resource.match(entry.filename) is not None:
                 zip.extract(entry, data.instance_path)
+
+
+def write_data(zip, dataset, prog_cb=None):
+
+    # columns are streamed straight into the data.bin entry, a slab at
+    # a time (see read_data() for the layout)
+
+    row_count = dataset.row_count
+    required_bytes = 0
+    for column in dataset:
+        if column.measure_type == MeasureType.CONTINUOUS:
+            required_bytes += (8 * row_count)
+        else:
+            required_bytes += (4 * row_count)
+
+    if not ZIP_OPEN_WRITE:
+        temp_file = NamedTemporaryFile(delete=False)
+        try:
+            with temp_file:
+                _write_columns(temp_file, dataset, required_bytes, prog_cb)
+            zip.write(temp_file.name, 'data.bin')
+        finally:
+            os.remove(temp_file.name)
+        return
+
+    force_zip64 = required_bytes > zipfile.ZIP64_LIMIT
+
+    with zip.open('data.bin', 'w', force_zip64=force_zip64) as data_file:
+        _write_columns(data_file, dataset, required_bytes, prog_cb)
+
+
+def _write_columns(data_file, dataset, required_bytes, prog_cb):
+    row_count = dataset.row_count
+    bytes_written = 0
+
+    for column in dataset:
+        if column.measure_type == MeasureType.CONTINUOUS:
+            slab_rows = SLAB_SIZE // 8
+        else:
+            slab_rows = SLAB_SIZE // 4
+
+        for row_no in range(0, row_count, slab_rows):
+            values = column.read_range(row_no, min(row_no + slab_rows, row_count))
+            if sys.byteorder == 'big':
+                values.byteswap()
+            data_file.write(values)
+
+            if prog_cb is not None:
+                bytes_written += len(values) * values.itemsize
+                prog_cb(bytes_written, required_bytes)
+
+
+def read_data(data_file, dataset, row_count, prog_cb=None):
+
+    # data.bin is each column one after the other, little endian doubles
+    # for CONTINUOUS columns, otherwise int32s. it's decompressed straight
+    # into a buffer, a slab at a time, and copied into the columns
+
+    buffer = bytearray(SLAB_SIZE)
+
+    required_bytes = 0
+    for column in dataset:
+        if column.measure_type == MeasureType.CONTINUOUS:
+            required_bytes += (8 * row_count)
+        else:
+            required_bytes += (4 * row_count)
+
+    bytes_read = 0
+
+    for column in dataset:
+        if column.measure_type == MeasureType.CONTINUOUS:
+            typecode = 'd'
+            cell_size = 8
+        else:
+            typecode = 'i'
+            cell_size = 4
+
+        slab_rows = SLAB_SIZE // cell_size
+        row_no = 0
+
+        while row_no < row_count:
+            n_rows = min(slab_rows, row_count - row_no)
+            view = memoryview(buffer)[:n_rows * cell_size]
+            _read_into(data_file, view)
+
+            values = view.cast(typecode)
+            if sys.byteorder == 'big':
+                values = array(typecode, values)
+                values.byteswap()
+
+            column.write_range(row_no, values)
+            row_no += n_rows
+
+            if prog_cb is not None:
+                bytes_read += n_rows * cell_size
+                prog_cb(bytes_read, required_bytes)
+
+
+def _read_into(data_file, view):
+    while len(view) > 0:
+        n_bytes = data_file.readinto(view)
+        if n_bytes == 0:
+            raise ValueError('data.bin is truncated')
+        view = view[n_bytes:]
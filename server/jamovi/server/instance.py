@@ -19,9 +19,12 @@ from .utils import conf
 from .enginemanager import EngineManager
 from .analyses import Analyses
 from .modules import Modules
+from .resultscache import ResultsCache
+from . import resultsdelta
 from . import formatio
 
 import uuid
+import hashlib
 import posixpath
 import math
 import yaml
@@ -31,6 +34,8 @@ import time
 import threading
 from threading import Thread
 
+from tornado.ioloop import IOLoop
+
 from .utils import fs
 
 log = logging.getLogger('jamovi')
@@ -49,6 +54,10 @@ class Instance:
     instances = { }
     _garbage_collector = None
 
+    # the data set's memory map is compacted once the space freed by edits
+    # exceeds both this (in bytes), and the space still in use
+    VACUUM_THRESHOLD = 4 * 1024 * 1024
+
     @staticmethod
     def get(instance_id):
         return Instance.instances.get(instance_id)
@@ -70,7 +79,7 @@ class Instance:
                 if parent.is_alive() is False:
                     break
                 for id, instance in Instance.instances.items():
-                    if instance.inactive_for > 2:
+                    if instance.inactive_for > 2 and not instance._is_busy:
                         log.info('cleaning up: ' + str(id))
                         instance.close()
                         del Instance.instances[id]
@@ -122,9 +131,20 @@ class Instance:
         self._data.analyses = Analyses()
 
         self._coms = None
+        self._saving = False
+        self._opening = False
         self._em = EngineManager(self._instance_id, self._data.analyses, session_path)
         self._inactive_since = None
 
+        self._column_digests = { }  # column id -> ((changes, data version), digest)
+        self._results_sent = { }    # analysis id -> results last sent to the client
+
+        self._cells_requests = [ ]  # data set GETs, waiting to be coalesced
+        self._cells_scheduled = False
+        self._cells_requested = 0
+        self._cells_dropped = 0
+        self._vacuums = 0
+
         self._data.analyses.add_results_changed_listener(self._on_results)
         self._em.add_engine_listener(self._on_engine_event)
 
@@ -135,6 +155,12 @@ class Instance:
         os.makedirs(self._data.instance_path, exist_ok=True)
         self._buffer_path = os.path.join(self._data.instance_path, 'buffer')
 
+        cache_size = Instance._results_cache_size()
+        if cache_size > 0:
+            cache_path = os.path.join(self._data.instance_path, 'results-cache')
+            cache = ResultsCache(cache_path, cache_size)
+            self._em.set_results_cache(cache, self._results_key)
+
         self._em.start()
 
         Instance.instances[self._instance_id] = self
@@ -149,6 +175,7 @@ class Instance:
         self._coms = coms
         self._coms.add_close_listener(self._close)
         self._inactive_since = None
+        self._results_sent = { }
 
     def close(self):
         if self._mm is not None:
@@ -159,6 +186,7 @@ class Instance:
         self._coms.remove_close_listener(self._close)
         self._coms = None
         self._inactive_since = time.time()
+        self._results_sent = { }
 
     @property
     def is_active(self):
@@ -171,6 +199,10 @@ class Instance:
         else:
             return time.time() - self._inactive_since
 
+    @property
+    def _is_busy(self):
+        return self._saving or self._opening
+
     @property
     def analyses(self):
         return self._data.analyses
@@ -179,7 +211,21 @@ class Instance:
         return os.path.join(self._data.instance_path, resourceId)
 
     def on_request(self, request):
-        if type(request) == jcoms.DataSetRR:
+        if Instance._is_cells_get(request) and not self._is_busy_for(request):
+            self._queue_cells_request(request)
+            return
+
+        # requests are handled in the order they arrive
+        self._process_cells_requests()
+
+        if self._is_busy_for(request):
+            message = 'Unable to complete request'
+            if self._opening:
+                cause = 'Please try again once the file has opened'
+            else:
+                cause = 'Please try again once the save has completed'
+            self._coms.send_error(message, cause, self._instance_id, request)
+        elif type(request) == jcoms.DataSetRR:
             self._on_dataset(request)
         elif type(request) == jcoms.OpenRequest:
             self._on_open(request)
@@ -201,9 +247,152 @@ class Instance:
             log.info('unrecognised request')
             log.info(request.payloadType)
 
+    @staticmethod
+    def _is_cells_get(request):
+        if not isinstance(request, jcoms.DataSetRR):
+            return False
+        return request.op == jcoms.GetSet.Value('GET') and request.incData and not request.incSchema
+
+    def _queue_cells_request(self, request):
+        # while the grid is scrolled, the cells requests can arrive faster
+        # than they're handled. they're queued, and handled once those
+        # already received have been read, so that requests superseded by
+        # later ones can be dropped or merged
+        self._cells_requests.append(request)
+        self._cells_requested += 1
+        if not self._cells_scheduled:
+            self._cells_scheduled = True
+            IOLoop.current().add_callback(self._process_cells_requests)
+
+    def _process_cells_requests(self):
+        requests = self._cells_requests
+        self._cells_requests = [ ]
+        self._cells_scheduled = False
+
+        if len(requests) == 0 or self._coms is None:
+            return
+
+        # each range is (row start, column start, row end, column end).
+        # the client puts the cells of a response where its range says, and
+        # the requests are all answered together, so a later request can
+        # answer for an earlier one it contains, or that it makes a
+        # rectangle with. requests contained in an earlier one are dropped
+        # too
+        ranges = [ (r.rowStart, r.columnStart, r.rowEnd, r.columnEnd) for r in requests ]
+        dropped = [ False ] * len(requests)
+        for i in range(len(requests)):
+            for j in range(i + 1, len(requests)):
+                merged = Instance._merge_ranges(ranges[i], ranges[j])
+                if merged is not None:
+                    ranges[j] = merged
+                    dropped[i] = True
+                    break
+        for j in range(len(requests)):
+            for i in range(j):
+                if not dropped[i] and Instance._merge_ranges(ranges[j], ranges[i]) == ranges[i]:
+                    dropped[j] = True
+                    break
+
+        for request, range_, drop in zip(requests, ranges, dropped):
+            if drop:
+                self._cells_dropped += 1
+                response = jcoms.DataSetRR()
+                response.op = request.op  # and no data
+                self._coms.send(response, self._instance_id, request)
+            else:
+                request.rowStart, request.columnStart, request.rowEnd, request.columnEnd = range_
+                self._on_dataset(request)
+
+    @staticmethod
+    def _merge_ranges(a, b):
+        # b if it contains a, or the union of the two if it's a rectangle
+        if a[0] >= b[0] and a[1] >= b[1] and a[2] <= b[2] and a[3] <= b[3]:
+            return b
+        if a[1] == b[1] and a[3] == b[3] and a[0] <= b[2] + 1 and b[0] <= a[2] + 1:
+            return (min(a[0], b[0]), a[1], max(a[2], b[2]), a[3])
+        if a[0] == b[0] and a[2] == b[2] and a[1] <= b[3] + 1 and b[1] <= a[3] + 1:
+            return (a[0], min(a[1], b[1]), a[2], max(a[3], b[3]))
+        return None
+
+    @property
+    def stats(self):
+        stats = {
+            'cells_requests': self._cells_requested,
+            'cells_requests_dropped': self._cells_dropped,
+            'vacuums': self._vacuums,
+        }
+        if self._mm is not None:
+            stats['live_bytes'] = self._mm.live_bytes
+            stats['wasted_bytes'] = self._mm.wasted_bytes
+        return stats
+
+    def _vacuum(self):
+        # engines running this instance's analyses may be reading the data
+        # set, so it's left until they're done
+        if self._mm is None or self._em.is_running:
+            return
+        wasted = self._mm.wasted_bytes
+        if wasted < Instance.VACUUM_THRESHOLD or wasted < self._mm.live_bytes:
+            return
+        self._data.dataset.vacuum()
+        self._vacuums += 1
+
+    def _is_busy_for(self, request):
+        if self._opening:
+            # the data set is incomplete, and the memory map may be resized
+            # from under any request which reads it
+            return isinstance(request, (
+                jcoms.DataSetRR,
+                jcoms.OpenRequest,
+                jcoms.SaveRequest,
+                jcoms.InfoRequest,
+                jcoms.AnalysisRequest))
+        elif self._saving:
+            if isinstance(request, jcoms.DataSetRR):
+                return request.op == jcoms.GetSet.Value('SET')
+            return isinstance(request, jcoms.OpenRequest)
+        return False
+
     def _on_results(self, analysis):
         if self._coms is not None:
-            self._coms.send(analysis.results, self._instance_id)
+            self._coms.send_results(
+                lambda: self._results_update(analysis),
+                self._instance_id,
+                analysis.id)
+
+    def _results_update(self, analysis):
+        # only the elements which have changed since the results last sent
+        # are sent. the whole results are sent when there's nothing to go
+        # on (the first results, or after the client asks to resend them)
+        if self._data.analyses.get(analysis.id) is not analysis:
+            return None  # deleted since
+
+        response = analysis.results
+        if not response.HasField('results'):
+            self._results_sent.pop(analysis.id, None)
+            return response
+
+        old = self._results_sent.get(analysis.id)
+        self._results_sent[analysis.id] = response.results
+        if old is None:
+            return response
+
+        delta = resultsdelta.make_delta(old, response.results)
+        if delta is None:
+            return response
+
+        update = jcoms.AnalysisResponse()
+        for field, value in response.ListFields():
+            if field.name == 'results':
+                continue
+            elif field.message_type is not None:
+                getattr(update, field.name).CopyFrom(value)
+            else:
+                setattr(update, field.name, value)
+        update.results.CopyFrom(delta)
+        update.delta = True
+
+        return update
 
     def _on_fs_request(self, request):
         path = request.path
@@ -273,71 +462,203 @@ class Instance:
         path = request.filename
         path = Instance._normalise_path(path)
 
-        try:
-            file_exists = os.path.isfile(path)
-            success = False
-            if file_exists is False or request.overwrite is True:
-                formatio.write(self._data, path)
-                success = True
-                self._data.dataset.is_edited = False
+        if self._saving:
+            base    = os.path.basename(path)
+            message = 'Unable to save {}'.format(base)
+            cause = 'A save is already in progress'
+            self._coms.send_error(message, cause, self._instance_id, request)
+            return
 
+        file_exists = os.path.isfile(path)
+        if file_exists is True and request.overwrite is False:
             response = jcoms.SaveProgress()
-            response.fileExists = file_exists
-            response.success = success
+            response.fileExists = True
+            response.success = False
             self._coms.send(response, self._instance_id, request)
+            return
 
-            if success:
-                self._add_to_recents(path)
+        # the file is written on a separate thread, so the IOLoop (and
+        # every other instance) isn't blocked for the length of the save.
+        # edits to the data set are refused until the save completes (see
+        # on_request()), so the thread sees an unchanging data set
 
-        except OSError as e:
-            base    = os.path.basename(path)
-            message = 'Unable to save {}'.format(base)
-            cause = e.strerror
-            self._coms.send_error(message, cause, self._instance_id, request)
+        self._saving = True
+        ioloop = IOLoop.current()
+        compress_level = Instance._compress_level()
 
-        except Exception as e:
+        def prog_cb(progress, total):
+            ioloop.add_callback(self._on_progress, request, progress, total)
+
+        def run():
+            try:
+                formatio.write(self._data, path, compress_level, prog_cb)
+                ioloop.add_callback(self._on_save_complete, request, path, file_exists, None)
+            except Exception as e:
+                ioloop.add_callback(self._on_save_complete, request, path, file_exists, e)
+
+        thread = Thread(target=run)
+        thread.start()
+
+    def _on_progress(self, request, progress, total):
+        if self._coms is None:
+            return
+
+        # the Progress message is limited to 32 bits
+        while total > 0xFFFFFFFF:
+            progress >>= 10
+            total >>= 10
+
+        response = jcoms.Progress()
+        response.progress = progress
+        response.total = total
+        self._coms.send(response, self._instance_id, request, complete=False)
+
+    def _on_save_complete(self, request, path, file_exists, error):
+        self._saving = False
+
+        if error is None:
+            self._data.dataset.is_edited = False
+            self._add_to_recents(path)
+
+        if self._coms is None:
+            return
+
+        if error is None:
+            response = jcoms.SaveProgress()
+            response.fileExists = file_exists
+            response.success = True
+            self._coms.send(response, self._instance_id, request)
+        else:
             base    = os.path.basename(path)
             message = 'Unable to save {}'.format(base)
-            cause = str(e)
+            if isinstance(error, OSError):
+                cause = error.strerror
+            else:
+                cause = str(error)
             self._coms.send_error(message, cause, self._instance_id, request)
 
+    @staticmethod
+    def _compress_level():
+        # JAMOVI_COMPRESS_LEVEL; 0 saves .omv files uncompressed, 1 to 9
+        # trades save time for file size
+        level = conf.get('compress_level')
+        if level is None or level == '':
+            return None
+        return int(level)
+
+    @staticmethod
+    def _results_cache_size():
+        # JAMOVI_RESULTS_CACHE_SIZE, in MB; 0 turns the cache off
+        size = conf.get('results_cache_size')
+        if size is None or size == '':
+            size = 64
+        return int(float(size) * 1024 * 1024)
+
+    @staticmethod
+    def _data_layout():
+        # JAMOVI_DATA_LAYOUT, 'blocks' (the default) or 'contiguous', and
+        # JAMOVI_BLOCK_SIZE, in bytes
+        contiguous = conf.get('data_layout') == 'contiguous'
+        block_size = conf.get('block_size')
+        if block_size is None or block_size == '':
+            block_size = 32768
+        return { 'contiguous': contiguous, 'block_size': int(block_size) }
+
+    def _results_key(self, analysis):
+        # results depend on the analysis, its options, and the data in the
+        # columns the options name
+        module = Modules.instance().get(analysis.ns)
+        version = '.'.join(map(str, module.version)) if module is not None else ''
+        parts = [ analysis.ns, analysis.name, version, analysis.options.as_bytes() ]
+
+        dataset = self._data.dataset
+        if dataset is not None:
+            parts.append(str(dataset.row_count))
+            names = Instance._option_strings(analysis.options.as_pb())
+            for column in dataset:
+                if column.name in names:
+                    parts.append(self._column_digest(column))
+
+        return ResultsCache.make_key(*parts)
+
+    @staticmethod
+    def _option_strings(options_pb, strings=None):
+        if strings is None:
+            strings = set()
+        for option_pb in options_pb.options:
+            if option_pb.HasField('s'):
+                strings.add(option_pb.s)
+            elif option_pb.HasField('c'):
+                Instance._option_strings(option_pb.c, strings)
+        return strings
+
+    def _column_digest(self, column):
+        version = (column.changes, column.data_version)
+        digest = self._column_digests.get(column.id)
+        if digest is not None and digest[0] == version:
+            return digest[1]
+
+        hasher = hashlib.sha1()
+        hasher.update(column.name.encode('utf-8'))
+        hasher.update(str((column.measure_type.value, column.dps, column.levels)).encode('utf-8'))
+        for row_no in range(0, column.row_count, 65536):
+            count = min(65536, column.row_count - row_no)
+            hasher.update(column.read_range(row_no, row_no + count))
+
+        digest = hasher.hexdigest()
+        self._column_digests[column.id] = (version, digest)
+        return digest
+
     def _on_open(self, request):
         path = request.filename
         nor_path = Instance._normalise_path(path)
+        is_example = path.startswith('{{Examples}}')
+
+        self._column_digests = { }
 
         self._mm = MemoryMap.create(self._buffer_path, 65536)
-        dataset = DataSet.create(self._mm)
+        self._data.dataset = DataSet.create(self._mm, **Instance._data_layout())
 
-        try:
-            self._data.dataset = dataset
+        # as with saving, the file is read on a separate thread. requests
+        # which would touch the data set are refused until it's complete
 
-            is_example = path.startswith('{{Examples}}')
-            formatio.read(self._data, nor_path, is_example)
-            self._coms.send(None, self._instance_id, request)
+        self._opening = True
+        ioloop = IOLoop.current()
 
-            if path != '' and not is_example:
-                self._add_to_recents(path)
+        def prog_cb(progress, total):
+            ioloop.add_callback(self._on_progress, request, progress, total)
 
-        except OSError as e:
-            base    = os.path.basename(path)
-            message = 'Unable to open {}'.format(base)
-            cause = e.strerror
-            self._coms.send_error(message, cause, self._instance_id, request)
+        def run():
+            try:
+                formatio.read(self._data, nor_path, is_example, prog_cb)
+                ioloop.add_callback(self._on_open_complete, request, path, None)
+            except Exception as e:
+                ioloop.add_callback(self._on_open_complete, request, path, e)
 
-        except Exception as e:
+        thread = Thread(target=run)
+        thread.start()
+
+    def _on_open_complete(self, request, path, error):
+        self._opening = False
+        self._em.data_changed()
+
+        if error is None and path != '' and not path.startswith('{{Examples}}'):
+            self._add_to_recents(path)
+
+        if self._coms is None:
+            return
+
+        if error is None:
+            self._coms.send(None, self._instance_id, request)
+        else:
             base    = os.path.basename(path)
             message = 'Unable to open {}'.format(base)
-            cause = str(e)
+            if isinstance(error, OSError):
+                cause = error.strerror
+            else:
+                cause = str(error)
             self._coms.send_error(message, cause, self._instance_id, request)
 
-    def _open_callback(self, task, progress):
-        response = jcoms.ComsMessage()
-        response.open.status = jcoms.Status.Value('IN_PROGRESS')
-        response.open.progress = progress
-        response.open.progress_task = task
-
-        self._coms.send(response, self._instance_id)
-
     def rerun(self):
         self._em.restart_engines()
 
@@ -347,12 +668,21 @@ class Instance:
 
             self.rerun()
 
+        elif request.resendResults:
+
+            self._results_sent.pop(request.analysisId, None)
+            analysis = self._data.analyses.get(request.analysisId)
+            if analysis is not None and analysis.has_results:
+                self._on_results(analysis)
+            self._coms.discard(request)
+
         elif request.HasField('options'):
 
             analysis = self._data.analyses.get(request.analysisId)
             if analysis is not None:
                 self._data.dataset.is_edited = True
                 if request.perform is jcoms.AnalysisRequest.Perform.Value('DELETE'):
+                    self._results_sent.pop(request.analysisId, None)
                     del self._data.analyses[request.analysisId]
                 else:
                     analysis.set_options(request.options, request.changed)
@@ -407,6 +737,8 @@ class Instance:
             if analysis.has_results:
                 analysis_pb = response.analyses.add()
                 analysis_pb.CopyFrom(analysis.results)
+                if analysis.results.HasField('results'):
+                    self._results_sent[analysis.id] = analysis.results.results
 
         self._coms.send(response, self._instance_id, request)
 
@@ -495,15 +827,57 @@ class Instance:
                 instance._on_settings()
 
     def _on_dataset_set(self, request, response):
+        versions = self._column_versions()
+
+        if len(request.deleteRows) > 0 or len(request.insertRows) > 0:
+            self._apply_rows(request, response)
         if request.incData:
             self._apply_cells(request, response)
         if request.incSchema:
             self._apply_schema(request, response)
 
+        # the names, before and after, of the columns whose data changed
+        changed = set()
+        current = self._column_versions()
+        for id, (name, version) in current.items():
+            old_name, old_version = versions.get(id, (None, None))
+            if version != old_version:
+                changed.add(name)
+                if old_name is not None:
+                    changed.add(old_name)
+
+        self._vacuum()
+        self._em.data_changed()
+        self._rerun_dependents(changed, dict(current.values()))
+
+    def _column_versions(self):
+        return { column.id: (column.name, column.data_version) for column in self._data.dataset }
+
+    def _rerun_dependents(self, names, versions):
+        # only the analyses which read the changed columns are rerun. the
+        # engines report the columns (and their versions) each run read,
+        # and the columns named in the options cover analyses not yet run
+        # (i.e. loaded from file). a run which read a column before an
+        # earlier edit to it is out of date too
+        if len(names) == 0:
+            return
+
+        for analysis in self._data.analyses:
+            read = Instance._option_strings(analysis.options.as_pb())
+            stale = False
+            if analysis.columns_read is not None:
+                read.update(analysis.columns_read)
+                for name, version in analysis.columns_read.items():
+                    if versions.get(name, -1) != version:
+                        stale = True
+            if stale or not names.isdisjoint(read):
+                analysis.rerun()
+
     def _on_dataset_get(self, request, response):
         if request.incSchema:
             self._populate_schema(request, response)
         if request.incData:
+            response.incData = True
             self._populate_cells(request, response)
 
     def _apply_schema(self, request, response):
@@ -525,6 +899,20 @@ class Instance:
 
         self._data.dataset.is_edited = True
 
+    def _apply_rows(self, request, response):
+        dataset = self._data.dataset
+
+        if len(request.deleteRows) > 0:
+            dataset.delete_rows([ (r.rowStart, r.rowEnd) for r in request.deleteRows ])
+        for r in request.insertRows:
+            dataset.insert_rows(r.rowStart, r.rowEnd - r.rowStart + 1)
+
+        response.deleteRows.extend(request.deleteRows)
+        response.insertRows.extend(request.insertRows)
+        response.rowCount = dataset.row_count
+
+        dataset.is_edited = True
+
     def _apply_cells(self, request, response):
         row_start = request.rowStart
         col_start = request.columnStart
@@ -641,12 +1029,7 @@ class Instance:
                 return
 
         elif column.measure_type == MeasureType.CONTINUOUS:
-            for value in column:
-                if math.isnan(value):
-                    continue
-                if round(value) != round(value, 6):
-                    break
-            else:
+            if column.integers_only:
                 column.change(MeasureType.NOMINAL)
                 return
 
@@ -661,36 +1044,62 @@ class Instance:
         row_count = row_end - row_start + 1
         col_count = col_end - col_start + 1
 
+        if request.packed:
+            response.packed = True
+            for c in range(col_start, col_start + col_count):
+                column = self._data.dataset[c]
+                self._populate_packed_column(column, row_start, row_count, response.packedData.add())
+            return
+
         for c in range(col_start, col_start + col_count):
             column = self._data.dataset[c]
 
             col_res = response.data.add()
 
+            values = column.read_range(row_start, row_start + row_count)
+
             if column.measure_type == MeasureType.CONTINUOUS:
-                for r in range(row_start, row_start + row_count):
+                for value in values:
                     cell = col_res.values.add()
-                    value = column[r]
                     if math.isnan(value):
                         cell.o = jcoms.SpecialValues.Value('MISSING')
                     else:
                         cell.d = value
             elif column.measure_type == MeasureType.NOMINAL_TEXT:
-                for r in range(row_start, row_start + row_count):
+                labels = dict(column.levels)
+                for value in values:
                     cell = col_res.values.add()
-                    value = column[r]
-                    if value == '':
+                    if value == -2147483648:
                         cell.o = jcoms.SpecialValues.Value('MISSING')
                     else:
-                        cell.s = value
+                        cell.s = labels[value]
             else:
-                for r in range(row_start, row_start + row_count):
+                for value in values:
                     cell = col_res.values.add()
-                    value = column[r]
                     if value == -2147483648:
                         cell.o = jcoms.SpecialValues.Value('MISSING')
                     else:
                         cell.i = value
 
+    def _populate_packed_column(self, column, row_start, row_count, col_res):
+
+        values = column.read_range(row_start, row_start + row_count)
+
+        if column.measure_type == MeasureType.CONTINUOUS:
+            col_res.d.extend(values)
+        else:
+            col_res.i.extend(values)
+
+        if column.missing_count > 0:
+            col_res.missing.extend(column.missing_bitmap(values))
+
+        # just the levels these rows use, as a text column can have many
+        if column.measure_type == MeasureType.NOMINAL_TEXT:
+            for value, label in column.levels_used(values):
+                level_pb = col_res.levels.add()
+                level_pb.value = value
+                level_pb.label = label
+
     def _populate_schema(self, request, response):
         response.incSchema = True
         for column in self._data.dataset:
@@ -0,0 +1,120 @@
+#
+# Copyright (C) 2016 Jonathon Love
+#
+
+import os
+import os.path
+import hashlib
+from collections import OrderedDict
+
+import logging
+
+log = logging.getLogger('jamovi')
+
+
+class ResultsCache:
+
+    # complete analysis results, keyed by what produced them. entries are
+    # files in the instance directory, evicted least recently used first
+    # once they exceed max_size bytes
+
+    def __init__(self, path, max_size):
+        self._path = path
+        self._max_size = max_size
+        self._entries = OrderedDict()  # key -> size, least recent first
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(path, exist_ok=True)
+
+        # entries from before, oldest first; file times are kept up to
+        # date with use
+        entries = [ ]
+        for name in os.listdir(path):
+            entry_path = os.path.join(path, name)
+            if name.endswith('.tmp'):
+                os.remove(entry_path)
+                continue
+            stat = os.stat(entry_path)
+            entries.append((stat.st_mtime, name, stat.st_size))
+
+        for mtime, key, size in sorted(entries):
+            self._entries[key] = size
+            self._size += size
+
+        self._evict()
+
+    @staticmethod
+    def make_key(*parts):
+        hasher = hashlib.sha1()
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode('utf-8')
+            hasher.update(len(part).to_bytes(8, 'little'))
+            hasher.update(part)
+        return hasher.hexdigest()
+
+    def get(self, key):
+        if key not in self._entries:
+            self.misses += 1
+            return None
+
+        entry_path = os.path.join(self._path, key)
+        try:
+            with open(entry_path, 'rb') as file:
+                content = file.read()
+            os.utime(entry_path)
+        except OSError:
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return content
+
+    def put(self, key, content):
+        if len(content) > self._max_size:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        entry_path = os.path.join(self._path, key)
+        temp_path = entry_path + '.tmp'
+        try:
+            with open(temp_path, 'wb') as file:
+                file.write(content)
+            os.replace(temp_path, entry_path)
+        except OSError as e:
+            log.error('Unable to cache results: ' + str(e))
+            return
+
+        self._entries[key] = len(content)
+        self._size += len(content)
+        self._evict()
+
+    def discard(self, key):
+        if key in self._entries:
+            self._remove(key)
+
+    @property
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self):
+        while self._size > self._max_size:
+            key = next(iter(self._entries))
+            self._remove(key)
+
+    def _remove(self, key):
+        self._size -= self._entries.pop(key)
+        try:
+            os.remove(os.path.join(self._path, key))
+        except OSError:
+            pass
@@ -0,0 +1,58 @@
+#
+# Copyright (C) 2016 Jonathon Love
+#
+
+from . import jamovi_pb2 as jcoms
+
+
+# results deltas leave out the elements which haven't changed since the
+# results last sent. these are replaced by 'stubs'; elements with just a
+# name, marked unchanged. the children of groups and arrays are matched
+# by name, and the client puts the old elements back in place of the stubs
+
+
+def make_delta(old, new):
+    # None if the results are of something else entirely
+    if old.name != new.name:
+        return None
+    delta = jcoms.ResultsElement()
+    _make_delta(old, new, delta)
+    return delta
+
+
+def _make_delta(old, new, delta):
+    if new == old:
+        delta.name = new.name
+        delta.unchanged = True
+        return
+
+    kind = new.WhichOneof('type')
+    if kind not in ('group', 'array') or old.WhichOneof('type') != kind:
+        delta.CopyFrom(new)
+        return
+
+    for field, value in new.ListFields():
+        if field.name == kind:
+            continue
+        elif field.message_type is not None:
+            getattr(delta, field.name).CopyFrom(value)
+        else:
+            setattr(delta, field.name, value)
+
+    # children with the same name as another can't be matched
+    old_children = { }
+    for child in getattr(old, kind).elements:
+        if child.name in old_children:
+            old_children[child.name] = None
+        else:
+            old_children[child.name] = child
+
+    children = getattr(delta, kind)
+    children.SetInParent()  # so the group or array is set, even if empty
+    for child in getattr(new, kind).elements:
+        old_child = old_children.get(child.name)
+        if old_child is None:
+            children.elements.add().CopyFrom(child)
+        else:
+            _make_delta(old_child, child, children.elements.add())
+
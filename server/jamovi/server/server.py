@@ -9,6 +9,7 @@ from tornado.web import StaticFileHandler
 from .clientconnection import ClientConnection
 from .instance import Instance
 from .modules import Modules
+from .enginemanager import EnginePool
 from .utils import conf
 
 import sys
@@ -98,6 +99,29 @@ class ModuleAssetHandler(RequestHandler):
             self.write(content)
 
 
+class EngineStatsHandler(RequestHandler):
+
+    def get(self):
+        # this doesn't start the pool (and its engines) if it's not running
+        pool = EnginePool.current()
+        self.set_header('Cache-Control', 'no-store')
+        self.write(pool.stats if pool is not None else { })
+
+
+class InstanceStatsHandler(RequestHandler):
+
+    def get(self):
+        # totals across the instances; instance ids act as access tokens
+        # for the instances' resources, so aren't given out here
+        stats = { 'count': 0 }
+        for instance in list(Instance.instances.values()):
+            stats['count'] += 1
+            for key, value in instance.stats.items():
+                stats[key] = stats.get(key, 0) + value
+        self.set_header('Cache-Control', 'no-store')
+        self.write(stats)
+
+
 class UploadHandler(RequestHandler):
     def post(self):
         file_info = self.request.files['file'][0]
@@ -211,6 +235,8 @@ class Server:
             (r'/login', LoginHandler),
             (r'/coms', ClientConnection, { 'session_path': session_path }),
             (r'/upload', UploadHandler),
+            (r'/engines', EngineStatsHandler),
+            (r'/instances', InstanceStatsHandler),
             (r'/proto/coms.proto',   SingleFileHandler, {
                 'path': coms_path,
                 'is_pkg_resource': True,
@@ -0,0 +1,374 @@
+#
+# Copyright (C) 2016 Jonathon Love
+#
+
+# benchmarks for the data set and the file readers/writers
+#
+# usage:
+#   python -m jamovi.server.test.benchmark csv [rows]
+#   python -m jamovi.server.test.benchmark omv [rows]
+#   python -m jamovi.server.test.benchmark levels [rows]
+#   python -m jamovi.server.test.benchmark change [rows]
+#   python -m jamovi.server.test.benchmark access [rows]
+#   python -m jamovi.server.test.benchmark wide [columns]
+#   python -m jamovi.server.test.benchmark rows [rows]
+
+import sys
+import os
+import os.path
+import time
+import random
+import tempfile
+from array import array
+
+from ...core import MemoryMap
+from ...core import DataSet
+from ...core import MeasureType
+from ..formatio import csv
+from ..formatio import omv
+
+
+class InstanceData:
+    def __init__(self):
+        self.analyses = None
+        self.dataset = None
+        self.title = None
+        self.path = ''
+
+
+def create_data(temp_dir, name='buffer', **layout):
+    buffer_path = os.path.join(temp_dir, name)
+    mm = MemoryMap.create(buffer_path, 65536)
+    data = InstanceData()
+    data.dataset = DataSet.create(mm, **layout)
+    data.analyses = [ ]
+    data.instance_path = temp_dir
+    return mm, data
+
+
+def write_csv(path, row_count):
+    random.seed(1)
+    groups = [ 'control', 'treatment', 'placebo', 'NA' ]
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('id,group,age,score,condition,comment\n')
+        for i in range(row_count):
+            file.write('{},{},{},{:.3f},{},{}\n'.format(
+                i,
+                i % 4,
+                random.randint(18, 80) if i % 50 else 'NA',
+                random.gauss(100, 15),
+                random.choice(groups),
+                'c' + str(random.randint(0, 200)) if i % 3 else ''))
+
+
+def report(name, row_count, elapsed):
+    print('{:<30} {:>10} rows {:>8.3f} s {:>12,.0f} rows/s'.format(
+        name, row_count, elapsed, row_count / elapsed))
+
+
+def bench_csv(row_count=200000):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'data.csv')
+        write_csv(path, row_count)
+
+        mm, data = create_data(temp_dir)
+
+        start = time.perf_counter()
+        csv.read(data, path)
+        elapsed = time.perf_counter() - start
+
+        mm.close()
+
+        report('csv.read', row_count, elapsed)
+
+
+def bench_omv(row_count=200000):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        csv_path = os.path.join(temp_dir, 'data.csv')
+        omv_path = os.path.join(temp_dir, 'data.omv')
+        write_csv(csv_path, row_count)
+
+        mm, data = create_data(temp_dir, 'buffer')
+        csv.read(data, csv_path)
+
+        start = time.perf_counter()
+        omv.write(data, omv_path)
+        elapsed = time.perf_counter() - start
+
+        mm.close()
+
+        report('omv.write', row_count, elapsed)
+
+        mm, data = create_data(temp_dir, 'buffer2')
+
+        start = time.perf_counter()
+        omv.read(data, omv_path)
+        elapsed = time.perf_counter() - start
+
+        mm.close()
+
+        report('omv.read', row_count, elapsed)
+
+
+def bench_levels(row_count=50000):
+
+    # a text column of ids, each appearing twice
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'data.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('id\n')
+            for i in range(row_count):
+                file.write('id{}\n'.format(i // 2))
+
+        mm, data = create_data(temp_dir)
+
+        start = time.perf_counter()
+        csv.read(data, path)
+        elapsed = time.perf_counter() - start
+        report('csv.read', row_count, elapsed)
+
+        column = data.dataset[0]
+
+        start = time.perf_counter()
+        labels = list(column)
+        elapsed = time.perf_counter() - start
+        report('column labels', row_count, elapsed)
+
+        start = time.perf_counter()
+        for i in range(row_count):
+            column.get_value_for_label(labels[i])
+        elapsed = time.perf_counter() - start
+        report('get_value_for_label', row_count, elapsed)
+
+        # moves one of each pair to the next id, so every level stays in
+        # use and none are removed
+
+        start = time.perf_counter()
+        for i in range(0, row_count - 2, 2):
+            column[i] = column.raw(i + 2)
+        elapsed = time.perf_counter() - start
+        report('set cells', row_count // 2, elapsed)
+
+        mm.close()
+
+
+def fill_column(column, measure_type, row_count):
+    random.seed(1)
+
+    if measure_type is MeasureType.CONTINUOUS:
+        column.measure_type = MeasureType.CONTINUOUS
+        column.dps = 2
+        values = [ round(random.gauss(100, 15), 2) for i in range(row_count) ]
+        values[::10] = [ float('nan') ] * len(values[::10])
+        column.write_range(0, array('d', values))
+
+    elif measure_type is MeasureType.NOMINAL_TEXT:
+        column.measure_type = MeasureType.NOMINAL_TEXT
+        labels = [ '1', '2', '2.5', '3', 'high', 'low' ]
+        for value, label in enumerate(labels):
+            column.append_level(value, label)
+        values = [ random.randint(0, 5) for i in range(row_count) ]
+        values[::10] = [ -2147483648 ] * len(values[::10])
+        column.write_range(0, array('i', values))
+
+    else:
+        column.measure_type = measure_type
+        for value in range(1, 6):
+            column.append_level(value, str(value))
+        values = [ random.randint(1, 5) for i in range(row_count) ]
+        values[::10] = [ -2147483648 ] * len(values[::10])
+        column.write_range(0, array('i', values))
+
+
+def bench_change(row_count=1000000):
+
+    # changes the measure type of a column, for every pair of types
+
+    measure_types = [
+        MeasureType.NOMINAL_TEXT,
+        MeasureType.NOMINAL,
+        MeasureType.ORDINAL,
+        MeasureType.CONTINUOUS ]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        mm, data = create_data(temp_dir)
+        dataset = data.dataset
+
+        pairs = [ (old, new) for old in measure_types for new in measure_types ]
+        for old_type, new_type in pairs:
+            dataset.append_column('{} {}'.format(old_type.name, new_type.name))
+        dataset.set_row_count(row_count)
+
+        for i, (old_type, new_type) in enumerate(pairs):
+            column = dataset[i]
+            fill_column(column, old_type, row_count)
+
+            # changing to the same type only does something when the
+            # levels are changed, so they're reversed
+            levels = None
+            if new_type is old_type and column.has_levels:
+                levels = list(enumerate(reversed([ level[1] for level in column.levels ])))
+
+            start = time.perf_counter()
+            column.change(new_type, levels=levels)
+            elapsed = time.perf_counter() - start
+
+            name = '{} -> {}'.format(old_type.name.lower(), new_type.name.lower())
+            report(name, row_count, elapsed)
+
+        mm.close()
+
+
+def bench_access(row_count=1000000):
+
+    # sequential and random access to a continuous column, stored in
+    # blocks and contiguously
+
+    layouts = [
+        ('blocks', { }),
+        ('contiguous', { 'contiguous': True }) ]
+
+    random.seed(1)
+    rows = list(range(row_count))
+    shuffled = list(rows)
+    random.shuffle(shuffled)
+    values = array('d', [ random.gauss(100, 15) for i in rows ])
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, layout in layouts:
+            mm, data = create_data(temp_dir, name, **layout)
+            dataset = data.dataset
+            column = dataset.append_column('a')
+            column.measure_type = MeasureType.CONTINUOUS
+            dataset.set_row_count(row_count)
+
+            start = time.perf_counter()
+            column.write_range(0, values)
+            elapsed = time.perf_counter() - start
+            report(name + ' write range', row_count, elapsed)
+
+            start = time.perf_counter()
+            column.read_range(0, row_count)
+            elapsed = time.perf_counter() - start
+            report(name + ' read range', row_count, elapsed)
+
+            for order, indices in [ ('sequential', rows), ('random', shuffled) ]:
+                start = time.perf_counter()
+                for i in indices:
+                    column.raw(i)
+                elapsed = time.perf_counter() - start
+                report('{} {} reads'.format(name, order), row_count, elapsed)
+
+                start = time.perf_counter()
+                for i in indices:
+                    column[i] = 1.5
+                elapsed = time.perf_counter() - start
+                report('{} {} writes'.format(name, order), row_count, elapsed)
+
+            mm.close()
+
+
+def bench_rows(row_count=1000000, operations=200):
+
+    # inserting and deleting rows in the middle of a data set, compared
+    # with moving the values after them through read/write_range()
+
+    random.seed(1)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        mm, data = create_data(temp_dir)
+        dataset = data.dataset
+        columns = [ ]
+        for i in range(5):
+            columns.append((dataset.append_column('c' + str(i)), MeasureType.CONTINUOUS))
+            columns.append((dataset.append_column('n' + str(i)), MeasureType.NOMINAL))
+        dataset.set_row_count(row_count)
+        for column, measure_type in columns:
+            fill_column(column, measure_type, row_count)
+
+        positions = [ random.randrange(row_count) for i in range(operations) ]
+
+        start = time.perf_counter()
+        for index in positions:
+            dataset.insert_rows(index, 1)
+        elapsed = time.perf_counter() - start
+        report('insert_rows', operations, elapsed)
+
+        start = time.perf_counter()
+        for index in positions:
+            dataset.delete_rows([ (index, index) ])
+        elapsed = time.perf_counter() - start
+        report('delete_rows', operations, elapsed)
+
+        ranges = [ (index, index + 10) for index in positions ]
+        start = time.perf_counter()
+        dataset.delete_rows(ranges)
+        elapsed = time.perf_counter() - start
+        report('delete_rows (together)', operations, elapsed)
+
+        # the values after each row inserted are moved down one
+        positions = positions[:operations // 10]
+        start = time.perf_counter()
+        for index in positions:
+            dataset.set_row_count(dataset.row_count + 1)
+            for column in dataset:
+                values = column.read_range(index, dataset.row_count - 1)
+                column.write_range(index + 1, values)
+        elapsed = time.perf_counter() - start
+        report('insert by moving values', len(positions), elapsed)
+
+        mm.close()
+
+
+def bench_wide(column_count=20000):
+
+    # appending columns, and looking them up by id and by name
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        mm, data = create_data(temp_dir)
+        dataset = data.dataset
+
+        start = time.perf_counter()
+        for i in range(column_count):
+            dataset.append_column('v' + str(i))
+        elapsed = time.perf_counter() - start
+        report('append columns', column_count, elapsed)
+
+        ids = list(range(column_count))
+        random.seed(1)
+        random.shuffle(ids)
+
+        start = time.perf_counter()
+        for id in ids:
+            dataset.get_column_by_id(id)
+        elapsed = time.perf_counter() - start
+        report('get_column_by_id', column_count, elapsed)
+
+        start = time.perf_counter()
+        for id in ids:
+            dataset['v' + str(id)]
+        elapsed = time.perf_counter() - start
+        report('get column by name', column_count, elapsed)
+
+        mm.close()
+
+
+benchmarks = {
+    'csv': bench_csv,
+    'omv': bench_omv,
+    'levels': bench_levels,
+    'change': bench_change,
+    'access': bench_access,
+    'wide': bench_wide,
+    'rows': bench_rows,
+}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+        print('usage: benchmark {} [rows]'.format('|'.join(benchmarks)))
+        sys.exit(1)
+
+    args = [ int(arg) for arg in sys.argv[2:] ]
+    benchmarks[sys.argv[1]](*args)
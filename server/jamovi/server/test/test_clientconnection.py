@@ -0,0 +1,65 @@
+
+import unittest
+from unittest import mock
+
+from concurrent.futures import Future
+
+from jamovi.server.clientconnection import ClientConnection
+from jamovi.server import jamovi_pb2 as jcoms
+
+
+class TestClientConnection(unittest.TestCase):
+
+    def setUp(self):
+        self._written = [ ]
+        self._connection = ClientConnection.__new__(ClientConnection)
+        with mock.patch('jamovi.server.clientconnection.conf') as conf:
+            conf.get.return_value = None  # the default interval
+            self._connection.initialize(session_path='')
+        self._connection.write_message = self._write_message
+
+    def _write_message(self, data, binary):
+        self._written.append(data)
+        future = Future()
+        future.set_result(None)
+        return future
+
+    def _results(self, analysis_id, revision, made):
+        def results():
+            made.append((analysis_id, revision))
+            response = jcoms.AnalysisResponse()
+            response.analysisId = analysis_id
+            response.revision = revision
+            return response
+        return results
+
+    def test_send_results(self):
+        made = [ ]
+        with mock.patch('jamovi.server.clientconnection.IOLoop') as ioloop:
+            # updates pile up between flushes
+            for revision in range(3):
+                self._connection.send_results(self._results(1, revision, made), 'instance', 1)
+            self._connection.send_results(self._results(2, 0, made), 'instance', 2)
+            self._connection.send_results(self._results(1, 3, made), 'instance', 1)
+
+            # a single flush is scheduled, for all of them
+            self.assertEqual(ioloop.current().call_later.call_count, 1)
+            self._connection._flush()
+
+        # just the newest of each analysis is made and sent
+        self.assertEqual(made, [ (2, 0), (1, 3) ])
+
+        sent = [ ]
+        for data in self._written:
+            message = jcoms.ComsMessage()
+            message.ParseFromString(data)
+            self.assertEqual(message.instanceId, 'instance')
+            response = jcoms.AnalysisResponse()
+            response.ParseFromString(message.payload)
+            sent.append((response.analysisId, response.revision))
+        self.assertEqual(sent, [ (2, 0), (1, 3) ])
+        self.assertEqual(self._connection._unsent, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,348 @@
+
+import unittest
+
+import os.path
+import math
+import tempfile
+from array import array
+
+from jamovi.core import MemoryMap
+from jamovi.core import DataSet
+from jamovi.core import MeasureType
+from jamovi.core import Column
+
+
+class TestColumn(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        buffer_path = os.path.join(self._temp_dir.name, 'buffer')
+        self._mm = MemoryMap.create(buffer_path, 65536)
+        self._dataset = DataSet.create(self._mm)
+
+    def tearDown(self):
+        self._mm.close()
+        self._temp_dir.cleanup()
+
+    def test_range_continuous(self):
+        column = self._dataset.append_column('a')
+        column.measure_type = MeasureType.CONTINUOUS
+        self._dataset.set_row_count(10000)
+
+        column.write_range(0, array('d', range(10000)))
+
+        values = column.read_range(0, 10000)
+        self.assertEqual(values.typecode, 'd')
+        self.assertEqual(list(values), list(range(10000)))
+
+        # spans a block boundary
+        column.write_range(4090, memoryview(array('d', [ -1.0 ] * 10)))
+        self.assertEqual(list(column.read_range(4089, 4101)), [ 4089 ] + [ -1 ] * 10 + [ 4100 ])
+        self.assertEqual(len(column.read_range(0, 0)), 0)
+
+        # read-only buffers are fine too
+        column.write_range(0, memoryview(array('d', [ 5.0, 6.0 ]).tobytes()).cast('d'))
+        self.assertEqual(list(column.read_range(0, 2)), [ 5, 6 ])
+
+        with self.assertRaises(ValueError):
+            column.write_range(0, array('i', [ 1 ]))
+        with self.assertRaises(IndexError):
+            column.read_range(9990, 10001)
+
+    def test_range_levels(self):
+        column = self._dataset.append_column('a')
+        column.measure_type = MeasureType.NOMINAL_TEXT
+        for value, label in enumerate([ 'a', 'b', 'c' ]):
+            column.append_level(value, label)
+        self._dataset.set_row_count(9000)
+
+        column.write_range(0, memoryview(bytes(array('i', [ 0, 1, 2 ] * 3000))).cast('i'))
+        self.assertEqual(list(column.read_range(0, 6)), [ 0, 1, 2, 0, 1, 2 ])
+        self.assertEqual(column.level_count, 3)
+
+        # 'b' is no longer used, so is removed, and 'c' is renumbered
+        column.write_range(0, array('i', [ 0, 2, 2 ] * 3000))
+        self.assertEqual(column.levels, [ (0, 'a'), (1, 'c') ])
+        self.assertEqual(list(column)[:3], [ 'a', 'c', 'c' ])
+
+        # a rejected write changes nothing
+        version = column.data_version
+        with self.assertRaises(RuntimeError):
+            column.write_range(0, array('i', [ 0, 5 ]))
+        self.assertEqual(column.data_version, version)
+        self.assertEqual(column.missing_count, 0)
+        self.assertEqual(list(column.read_range(0, 2)), [ 0, 1 ])
+
+    def test_level_lookup(self):
+        column = self._dataset.append_column('a')
+        for value in [ 1, 3, 5 ]:
+            column.append_level(value, str(value))
+        column.insert_level(4, '4')
+        column.insert_level(0, '0')
+
+        self.assertEqual(column.levels, [ (0, '0'), (1, '1'), (3, '3'), (4, '4'), (5, '5') ])
+        for value, label in column.levels:
+            self.assertEqual(column.get_value_for_label(label), value)
+            self.assertTrue(column.has_level(value))
+            self.assertTrue(column.has_level(label))
+        self.assertFalse(column.has_level(2))
+        self.assertFalse(column.has_level('2'))
+
+        # levels changed through another column object are seen
+        self._dataset[0].append_level(7, 'seven')
+        self.assertEqual(column.get_value_for_label('seven'), 7)
+        self._dataset[0].clear_levels()
+        self.assertFalse(column.has_level(7))
+
+        text = self._dataset.append_column('b')
+        text.measure_type = MeasureType.NOMINAL_TEXT
+        for value in range(1000):
+            text.append_level(value, 'id' + str(value))
+        self._dataset.set_row_count(1000)
+        text.write_range(0, array('i', range(1000)))
+
+        text[0] = 1  # removes 'id0', and renumbers the rest
+        self.assertFalse(text.has_level('id0'))
+        self.assertEqual(text.get_value_for_label('id999'), 998)
+        self.assertEqual(text[999], 'id999')
+
+    def test_packing(self):
+        a = self._dataset.append_column('a')
+        a.measure_type = MeasureType.CONTINUOUS
+        b = self._dataset.append_column('b')
+        b.measure_type = MeasureType.NOMINAL_TEXT
+        for value, label in enumerate([ 'x', 'y', 'z' ]):
+            b.append_level(value, label)
+        self._dataset.set_row_count(40)
+        a.write_range(0, array('d', range(40)))
+        b.write_range(0, array('i', [ 2, 0 ] * 20))
+        a[1] = float('nan')
+        a[33] = float('nan')
+        b[0] = -2147483648
+
+        bitmap = a.missing_bitmap(a.read_range(0, 40))
+        self.assertEqual(bitmap.typecode, 'I')
+        self.assertEqual(list(bitmap), [ 1 << 1, 1 << 1 ])
+        self.assertEqual(list(b.missing_bitmap(b.read_range(0, 3))), [ 1 ])
+        self.assertEqual(len(a.missing_bitmap(a.read_range(0, 0))), 0)
+
+        self.assertEqual(b.levels_used(b.read_range(0, 2)), [ (0, 'x') ])
+        self.assertEqual(b.levels_used(b.read_range(0, 40)), [ (0, 'x'), (2, 'z') ])
+
+    def test_stats(self):
+        column = self._dataset.append_column('a')
+        column.measure_type = MeasureType.CONTINUOUS
+        self._dataset.set_row_count(5)
+
+        self.assertEqual(column.missing_count, 5)
+        self.assertTrue(column.integers_only)
+        self.assertTrue(math.isnan(column.min_value))
+
+        column.write_range(0, array('d', [ 3, -1, 2.5, float('nan'), 10 ]))
+        self.assertEqual(column.missing_count, 1)
+        self.assertFalse(column.integers_only)
+        self.assertEqual((column.min_value, column.max_value), (-1, 10))
+
+        column[2] = 2.0000001   # integer, to 6 dps
+        column[1] = 4           # the min is overwritten
+        column.append(float('nan'))
+        self.assertEqual(column.missing_count, 2)
+        self.assertTrue(column.integers_only)
+        self.assertEqual((column.min_value, column.max_value), (2.0000001, 10))
+
+        # the range is kept while another value is at the min or max
+        column.write_range(0, array('d', [ 1, 1, 5, 7, 7, 3 ]))
+        column[0] = 4
+        column[3] = 4
+        self.assertEqual((column.min_value, column.max_value), (1, 7))
+        column[1] = 4
+        column[4] = 6
+        self.assertEqual((column.min_value, column.max_value), (3, 6))
+
+        # the dps match those of how_many_dps() for each value
+        values = [ 0.1, 1.25, -0.0005, 0.0015, 2.675, 1.9996, -1e-20, 12.3450001 ]
+        for value in values:
+            column.write_range(0, array('d', [ value, 0, 0, 0, 0, 0 ]))
+            column.determine_dps()
+            self.assertEqual(column.dps, Column.how_many_dps(value), value)
+
+        column.change(MeasureType.NOMINAL)
+        self.assertEqual(column.missing_count, 0)
+        self.assertTrue(column.integers_only)
+
+    def test_data_version(self):
+        a = self._dataset.append_column('a')
+        b = self._dataset.append_column('b')
+        a.measure_type = MeasureType.CONTINUOUS
+        self._dataset.set_row_count(10)
+
+        version = a.data_version
+        a[0] = 1.5
+        a.dps = 3  # formatting only
+        self.assertEqual(a.data_version, version + 1)
+
+        version = b.data_version
+        a.write_range(0, array('d', [ 2.0 ] * 10))
+        b.append_level(1, '1')
+        b[0] = 1
+        b[0] = 1  # the same value, so no change
+        self.assertEqual(b.data_version, version + 2)
+        b.name = 'c'
+        self.assertEqual(b.data_version, version + 3)
+
+    def test_vacuum(self):
+        a = self._dataset.append_column('a')
+        a.measure_type = MeasureType.CONTINUOUS
+        b = self._dataset.append_column('b')
+        for value in range(100):
+            b.append_level(value, 'level ' + str(value))
+        self._dataset.set_row_count(20000)
+        a.write_range(0, array('d', range(20000)))
+        b.write_range(0, array('i', [ 7 ] * 20000))
+
+        live = self._mm.live_bytes
+        self._dataset.set_row_count(100)
+        b.clear_levels()
+        b.append_level(7, 'seven')
+        a.name = 'renamed'
+        self.assertGreater(self._mm.wasted_bytes, 0)
+
+        # freed space is reused
+        wasted = self._mm.wasted_bytes
+        b.append_level(8, 'eight')
+        self.assertLess(self._mm.wasted_bytes, wasted)
+        self.assertLess(self._mm.live_bytes, live)
+
+        self._dataset.vacuum()
+        self.assertEqual(self._mm.wasted_bytes, 0)
+        self.assertEqual(a.name, 'renamed')
+        self.assertEqual(list(a.read_range(0, 100)), list(range(100)))
+        self.assertEqual(b.levels, [ (7, 'seven'), (8, 'eight') ])
+        self.assertEqual(b[99], 7)
+
+        # the columns are still usable
+        self._dataset.set_row_count(50000)
+        a[49999] = 1.5
+        b.append_level(9, 'nine')
+        self.assertEqual(self._dataset['renamed'][49999], 1.5)
+        self.assertEqual(b.get_value_for_label('nine'), 9)
+
+    def test_layouts(self):
+        for i, layout in enumerate([ { 'contiguous': True }, { 'block_size': 1024 } ]):
+            mm = MemoryMap.create(os.path.join(self._temp_dir.name, str(i)), 65536)
+            dataset = DataSet.create(mm, **layout)
+
+            a = dataset.append_column('a')
+            a.measure_type = MeasureType.CONTINUOUS
+            b = dataset.append_column('b')
+            b.append_level(1, 'one')
+            dataset.reserve(5000)
+            dataset.set_row_count(10000)
+
+            a.write_range(0, array('d', range(10000)))
+            b.write_range(0, array('i', [ 1 ] * 10000))
+            for value in range(100):
+                a.append(float(value))
+            self.assertEqual(list(a.read_range(9998, 10002)), [ 9998, 9999, 0, 1 ])
+            self.assertEqual(a[10099], 99)
+
+            b.change(MeasureType.CONTINUOUS)
+            self.assertEqual(list(b.read_range(0, 3)), [ 1, 1, 1 ])
+
+            # the table of blocks grows
+            dataset.set_row_count(100000)
+            a[99999] = 1.5
+            self.assertEqual(a[99999], 1.5)
+
+            dataset.set_row_count(10)
+            dataset.vacuum()
+            self.assertEqual(list(a.read_range(0, 10)), list(range(10)))
+            self.assertEqual(b[9], 1)
+
+            mm.close()
+
+        with self.assertRaises(RuntimeError):
+            DataSet.create(self._mm, block_size=100)
+
+    def test_insert_delete_rows(self):
+        for i, layout in enumerate([ { 'block_size': 1024 }, { 'contiguous': True } ]):
+            mm = MemoryMap.create(os.path.join(self._temp_dir.name, 'rows' + str(i)), 65536)
+            dataset = DataSet.create(mm, **layout)
+
+            a = dataset.append_column('a')
+            a.measure_type = MeasureType.CONTINUOUS
+            b = dataset.append_column('b')
+            b.measure_type = MeasureType.NOMINAL_TEXT
+            for value, label in enumerate([ 'x', 'y', 'z' ]):
+                b.append_level(value, label)
+            dataset.set_row_count(1000)
+            a.write_range(0, array('d', range(1000)))
+            b.write_range(0, array('i', [ 0 ] * 500 + [ 1 ] * 499 + [ 2 ]))
+
+            # more rows than fit in the block being split
+            dataset.insert_rows(100, 300)
+            self.assertEqual(dataset.row_count, 1300)
+            self.assertEqual(a[99], 99)
+            self.assertTrue(math.isnan(a[100]))
+            self.assertTrue(math.isnan(a[399]))
+            self.assertEqual(a[400], 100)
+            self.assertEqual(b[399], '')
+            self.assertEqual(a.missing_count, 300)
+
+            dataset.insert_rows(1300, 2)  # at the end
+            dataset.insert_rows(0, 1)
+            self.assertEqual(a[1300], 999)
+            self.assertEqual(a[1], 0)
+
+            # overlapping and adjacent ranges are combined
+            dataset.delete_rows([ (101, 400), (0, 0), (350, 360), (1302, 1302) ])
+            self.assertEqual(dataset.row_count, 1001)
+            self.assertEqual(list(a.read_range(0, 1000)), list(range(1000)))
+            self.assertEqual(b.level_count, 3)
+
+            # levels no longer used are removed
+            dataset.delete_rows([ (999, 999) ])
+            self.assertEqual(b.levels, [ (0, 'x'), (1, 'y') ])
+            self.assertEqual(b[998], 'y')
+
+            dataset.vacuum()
+            self.assertEqual(list(a.read_range(996, 999)), [ 996, 997, 998 ])
+            self.assertTrue(math.isnan(a[999]))
+
+            with self.assertRaises(RuntimeError):
+                dataset.insert_rows(1001, 1)
+            with self.assertRaises(RuntimeError):
+                dataset.delete_rows([ (0, 1000) ])
+
+            mm.close()
+
+    def test_wide(self):
+        mm = MemoryMap.create(os.path.join(self._temp_dir.name, 'wide'), 65536)
+        dataset = DataSet.create(mm, contiguous=True)
+        a = dataset.append_column('a')
+        a.measure_type = MeasureType.CONTINUOUS
+        for i in range(20000):
+            dataset.append_column('v' + str(i))
+        dataset.set_row_count(2)
+
+        # columns made before the columns array grew are still usable
+        a[1] = 5
+        self.assertEqual(dataset['a'][1], 5)
+
+        self.assertEqual(dataset['v19999'].id, 20000)
+        self.assertEqual(dataset.get_column_by_id(12345).name, 'v12344')
+
+        dataset.get_column_by_id(3).name = 'renamed'
+        self.assertEqual(dataset['renamed'].id, 3)
+        with self.assertRaises(RuntimeError):
+            dataset['v2']
+
+        retrieved = DataSet.retrieve(mm)
+        self.assertEqual(retrieved.column_count, 20001)
+        self.assertEqual(retrieved['renamed'].id, 3)
+
+        mm.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+
+import unittest
+
+import os.path
+import math
+import tempfile
+
+from jamovi.core import MemoryMap
+from jamovi.core import DataSet
+from jamovi.core import MeasureType
+from jamovi.server.formatio import csv
+
+
+class InstanceData:
+    def __init__(self):
+        self.dataset = None
+
+
+class TestCSV(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._temp_path = self._temp_dir.name
+        self._chunk_size = csv.CHUNK_SIZE
+
+    def tearDown(self):
+        csv.CHUNK_SIZE = self._chunk_size
+        self._mm.close()
+        self._temp_dir.cleanup()
+
+    def _read(self, content, prog_cb=None):
+        data_path = os.path.join(self._temp_path, 'data.csv')
+        with open(data_path, 'w', encoding='utf-8') as file:
+            file.write(content)
+
+        buffer_path = os.path.join(self._temp_path, 'buffer')
+        self._mm = MemoryMap.create(buffer_path, 65536)
+        data = InstanceData()
+        data.dataset = DataSet.create(self._mm)
+
+        csv.read(data, data_path, prog_cb)
+
+        return data.dataset
+
+    def test_types(self):
+        dataset = self._read(
+            'a,b,c,d,e\n'
+            '1,2.5,x,NA,\n'
+            '2,NA,NA,3,\n'
+            '3,4,y,,\n')
+
+        self.assertEqual(dataset.row_count, 3)
+
+        a = dataset['a']
+        self.assertEqual(a.measure_type, MeasureType.NOMINAL)
+        self.assertEqual(a.levels, [ (1, '1'), (2, '2'), (3, '3') ])
+        self.assertEqual(list(a), [ 1, 2, 3 ])
+
+        b = dataset['b']
+        self.assertEqual(b.measure_type, MeasureType.CONTINUOUS)
+        self.assertEqual(b.dps, 1)
+        self.assertEqual(b[0], 2.5)
+        self.assertTrue(math.isnan(b[1]))
+
+        c = dataset['c']
+        self.assertEqual(c.measure_type, MeasureType.NOMINAL_TEXT)
+        self.assertEqual(c.levels, [ (0, 'NA'), (1, 'x'), (2, 'y') ])
+        self.assertEqual(list(c), [ 'x', 'NA', 'y' ])
+
+        d = dataset['d']
+        self.assertEqual(d.measure_type, MeasureType.NOMINAL)
+        self.assertEqual(list(d), [ -2147483648, 3, -2147483648 ])
+
+        e = dataset['e']
+        self.assertEqual(e.measure_type, MeasureType.NOMINAL)
+        self.assertEqual(e.level_count, 0)
+
+    def test_retype_across_chunks(self):
+        csv.CHUNK_SIZE = 4
+
+        rows = [ 'int,float,text' ]
+        for i in range(10):
+            rows.append('{},{},{}'.format(
+                i % 3,
+                '0.5' if i == 6 else i % 3,
+                'NA' if i == 1 else ('z' if i == 9 else i % 2)))
+        dataset = self._read('\n'.join(rows) + '\n')
+
+        column = dataset['int']
+        self.assertEqual(column.measure_type, MeasureType.NOMINAL)
+        self.assertEqual(column.levels, [ (0, '0'), (1, '1'), (2, '2') ])
+
+        column = dataset['float']
+        self.assertEqual(column.measure_type, MeasureType.CONTINUOUS)
+        self.assertEqual(column.dps, 1)
+        self.assertEqual(list(column), [ 0, 1, 2, 0, 1, 2, 0.5, 1, 2, 0 ])
+
+        column = dataset['text']
+        self.assertEqual(column.measure_type, MeasureType.NOMINAL_TEXT)
+        self.assertEqual(column.levels, [ (0, '0'), (1, '1'), (2, 'NA'), (3, 'z') ])
+        self.assertEqual(list(column), [ '0', 'NA', '0', '1', '0', '1', '0', '1', '0', 'z' ])
+
+    def test_retype_to_text(self):
+        csv.CHUNK_SIZE = 3
+
+        # the rows before the column turns out to be text are read as
+        # they appear in the file, wherever the chunks fall
+        cells = [ '2', '3', '4', '2.5', '2', '007', 'abc', 'NA', '3' ]
+        content = 'a\n' + '\n'.join(cells) + '\n'
+        dataset = self._read(content)
+
+        column = dataset['a']
+        self.assertEqual(column.measure_type, MeasureType.NOMINAL_TEXT)
+        self.assertEqual(column.levels, list(enumerate(sorted(set(cells)))))
+        self.assertEqual(list(column), cells)
+
+        levels = column.levels
+        self._mm.close()
+        csv.CHUNK_SIZE = 10000
+        self.assertEqual(self._read(content)['a'].levels, levels)
+
+    def test_many_integers(self):
+        row_count = 10000
+        rows = [ 'id' ] + [ str(i) for i in range(row_count) ]
+        dataset = self._read('\n'.join(rows) + '\n')
+
+        column = dataset['id']
+        self.assertEqual(column.measure_type, MeasureType.CONTINUOUS)
+        self.assertEqual(list(column), list(range(row_count)))
+
+    def test_many_labels(self):
+        csv.CHUNK_SIZE = 4
+
+        labels = [ 'id' + str(i % 9) for i in range(20, 0, -1) ]
+        dataset = self._read('id\n' + '\n'.join(labels) + '\n')
+
+        column = dataset['id']
+        self.assertEqual(column.measure_type, MeasureType.NOMINAL_TEXT)
+        self.assertEqual(column.levels, list(enumerate(sorted(set(labels)))))
+        self.assertEqual(list(column), labels)
+
+    def test_progress(self):
+        csv.CHUNK_SIZE = 1000
+
+        progress = [ ]
+        content = 'id\n' + ''.join([ '{}\n'.format(i) for i in range(5000) ])
+        self._read(content, lambda p, t: progress.append((p, t)))
+
+        self.assertEqual(len(progress), 5)
+        self.assertEqual(progress[-1], (len(content), len(content)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+
+import unittest
+
+import os.path
+import tempfile
+
+from jamovi.server.enginemanager import EnginePool
+from jamovi.server.enginemanager import EngineManager
+from jamovi.server.enginemanager import Engine
+from jamovi.server.analyses import Analyses
+from jamovi.server.analyses import Analysis
+from jamovi.server.options import Options
+from jamovi.server.resultscache import ResultsCache
+from jamovi.server import jamovi_pb2 as jcoms
+
+
+class Manager:
+
+    # an instance's view of the pool, with its queue of analyses
+
+    def __init__(self, instance_id, queue, cache_stats=None):
+        self.instance_id = instance_id
+        self.queue = list(queue)
+        self.runs = 0
+        self.cache_stats = cache_stats
+
+    def next_request(self):
+        if len(self.queue) == 0:
+            return None, False
+        return self.queue[0], True
+
+    @property
+    def queued(self):
+        return len(self.queue)
+
+
+class PoolEngine:
+
+    # records what's sent, in place of an engine process
+
+    def __init__(self, sent):
+        self.status = Engine.Status.WAITING
+        self.manager = None
+        self.analysis = None
+        self._sent = sent
+
+    @property
+    def is_waiting(self):
+        return self.status is Engine.Status.WAITING
+
+    @property
+    def is_busy(self):
+        return self.status is Engine.Status.RUNNING
+
+    def send(self, manager, analysis, run=True):
+        manager.queue.remove(analysis)
+        self.manager = manager
+        self.analysis = analysis
+        self.status = Engine.Status.RUNNING
+        self._sent.append(analysis)
+
+    def finish(self):
+        self.manager = None
+        self.analysis = None
+        self.status = Engine.Status.WAITING
+
+
+class TestEnginePool(unittest.TestCase):
+
+    def setUp(self):
+        self._sent = [ ]
+        self._pool = EnginePool('', 0)
+
+    def _engines(self, count):
+        engines = [ PoolEngine(self._sent) for i in range(count) ]
+        self._pool._engines = engines
+        return engines
+
+    def test_round_robin(self):
+        engines = self._engines(4)
+        for manager in [
+                Manager('a', [ 'a1', 'a2', 'a3' ]),
+                Manager('b', [ 'b1', 'b2' ]),
+                Manager('c', [ 'c1' ]) ]:
+            self._pool._managers.append(manager)
+
+        # each instance with analyses waiting gets an engine in turn
+        self._pool._send_next()
+        self.assertEqual(self._sent, [ 'a1', 'b1', 'c1', 'a2' ])
+
+        # carrying on after the last instance given an engine
+        engines[0].finish()
+        self._pool._send_next()
+        self.assertEqual(self._sent[4:], [ 'b2' ])
+
+        for engine in engines:
+            engine.finish()
+        self._pool._send_next()
+        self.assertEqual(self._sent[5:], [ 'a3' ])
+        self.assertEqual([ m.runs for m in self._pool._managers ], [ 3, 2, 1 ])
+
+    def test_stats(self):
+        self.assertIsNone(EnginePool.current())
+
+        engines = self._engines(3)
+        cache = { 'hits': 2, 'misses': 1, 'entries': 1, 'size': 100 }
+        self._pool._managers.append(Manager('secret1', [ 'a1', 'a2' ], cache))
+        self._pool._managers.append(Manager('secret2', [ 'b1' ], cache))
+        engines[2].status = Engine.Status.STOPPED
+        self._pool._send_next()
+
+        stats = self._pool.stats
+        self.assertEqual((stats['size'], stats['busy'], stats['stopped']), (3, 2, 1))
+        self.assertEqual(stats['instances'], {
+            'count': 2,
+            'running': 2,
+            'queued': 1,
+            'runs': 2,
+            'cache': { 'hits': 4, 'misses': 2, 'entries': 2, 'size': 200 },
+        })
+        # instance ids aren't given out
+        self.assertNotIn('secret1', repr(stats))
+
+
+class TestEngineManager(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._cache = ResultsCache(os.path.join(self._temp_dir.name, 'cache'), 100000)
+        self._keys_made = 0
+        self._data = 'v1'
+
+        self._analyses = Analyses()
+        self._analysis = Analysis(1, 'descriptives', 'jmv', Options(), self._analyses)
+        self._analyses._analyses.append(self._analysis)
+
+        self._em = EngineManager('instance', self._analyses, self._temp_dir.name)
+        self._em.set_results_cache(self._cache, self._results_key)
+        self._analyses.add_options_changed_listener(self._em._on_options_changed)
+        self._em._pool = EnginePool('', 0)
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _results_key(self, analysis):
+        self._keys_made += 1
+        return '{}-{}'.format(analysis.revision, self._data)
+
+    def test_results_key(self):
+        # worked out as the analysis is queued
+        self._analysis.rerun()
+        self.assertEqual(self._keys_made, 1)
+
+        # and the miss is only looked up (and counted) once
+        for i in range(3):
+            self.assertEqual(self._em.next_request(), (self._analysis, False))
+        self.assertEqual(self._keys_made, 1)
+        self.assertEqual(self._cache.misses, 1)
+
+        # the data changing before it's sent gives a new key
+        self._data = 'v2'
+        self._em.data_changed()
+        self.assertEqual(self._em.results_key(self._analysis), '1-v2')
+        self.assertEqual(self._keys_made, 2)
+
+        results = jcoms.AnalysisResponse()
+        results.status = jcoms.AnalysisStatus.Value('ANALYSIS_COMPLETE')
+        self._em.store_results('1-v2', results)
+        self.assertEqual(self._em.next_request(), (None, False))
+        self.assertEqual(self._analysis.status, Analysis.Status.COMPLETE)
+        self.assertEqual((self._cache.hits, self._cache.misses), (1, 1))
+
+        # a new revision, a new key
+        self._analysis.rerun()
+        self.assertEqual(self._em.results_key(self._analysis), '2-v2')
+        self.assertEqual(self._keys_made, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+
+import unittest
+from unittest import mock
+
+import os.path
+import tempfile
+from array import array
+
+from jamovi.core import MemoryMap
+from jamovi.core import DataSet
+from jamovi.core import MeasureType
+from jamovi.server.instance import Instance
+from jamovi.server.instance import InstanceData
+from jamovi.server.analyses import Analysis
+from jamovi.server.options import Options
+from jamovi.server import jamovi_pb2 as jcoms
+
+
+class TestInstance(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._mm = MemoryMap.create(os.path.join(self._temp_dir.name, 'buffer'), 65536)
+
+        # just what building a results key needs
+        self._instance = Instance.__new__(Instance)
+        self._instance._column_digests = { }
+        self._instance._data = InstanceData()
+        self._instance._data.dataset = DataSet.create(self._mm)
+
+    def tearDown(self):
+        self._mm.close()
+        self._temp_dir.cleanup()
+
+    def test_results_key(self):
+        dataset = self._instance._data.dataset
+        column = dataset.append_column('a')
+        column.measure_type = MeasureType.CONTINUOUS
+        dataset.set_row_count(200000)  # read in more than one chunk
+        column.write_range(0, array('d', range(200000)))
+
+        options = Options.create([ { 'name': 'var', 'type': 'Variable', 'default': 'a' } ])
+        analysis = Analysis(1, 'descriptives', 'jmv', options, None)
+
+        with mock.patch('jamovi.server.instance.Modules') as modules:
+            modules.instance().get.return_value = None
+
+            key = self._instance._results_key(analysis)
+            self.assertEqual(self._instance._results_key(analysis), key)
+
+            # a change in the last chunk changes the key
+            column[199999] = -1.0
+            self.assertNotEqual(self._instance._results_key(analysis), key)
+
+    def test_merge_ranges(self):
+        merge = Instance._merge_ranges
+        # (row start, column start, row end, column end)
+        self.assertEqual(merge((2, 2, 3, 3), (0, 0, 9, 9)), (0, 0, 9, 9))  # contained
+        self.assertIsNone(merge((0, 0, 9, 9), (2, 2, 3, 3)))
+        self.assertEqual(merge((0, 0, 9, 9), (5, 0, 19, 9)), (0, 0, 19, 9))  # overlapping
+        self.assertEqual(merge((10, 0, 19, 9), (0, 0, 9, 9)), (0, 0, 19, 9))  # adjacent rows
+        self.assertEqual(merge((0, 0, 9, 4), (0, 5, 9, 9)), (0, 0, 9, 9))  # adjacent columns
+        self.assertIsNone(merge((0, 0, 9, 9), (11, 0, 19, 9)))  # a gap between
+        self.assertIsNone(merge((0, 0, 9, 9), (5, 1, 19, 9)))  # not a rectangle
+        self.assertIsNone(merge((0, 0, 9, 9), (10, 10, 19, 19)))
+
+    def test_cells_requests(self):
+        instance = self._instance
+        instance._instance_id = 'instance'
+        instance._coms = mock.Mock()
+        instance._mm = None
+        instance._vacuums = 0
+        instance._cells_requests = [ ]
+        instance._cells_scheduled = False
+        instance._cells_requested = 0
+        instance._cells_dropped = 0
+
+        answered = [ ]
+        instance._on_dataset = lambda request: answered.append(
+            (request.rowStart, request.columnStart, request.rowEnd, request.columnEnd))
+
+        def cells(row_start, column_start, row_end, column_end):
+            request = jcoms.DataSetRR()
+            request.op = jcoms.GetSet.Value('GET')
+            request.incData = True
+            request.rowStart = row_start
+            request.columnStart = column_start
+            request.rowEnd = row_end
+            request.columnEnd = column_end
+            return request
+
+        requests = [
+            cells(0, 0, 9, 9),
+            cells(5, 0, 19, 9),      # takes on the first
+            cells(2, 2, 3, 3),       # in the one before
+            cells(100, 0, 109, 9),
+            cells(100, 0, 104, 9) ]  # in the one before
+        with mock.patch('jamovi.server.instance.IOLoop'):
+            for request in requests:
+                instance._queue_cells_request(request)
+        instance._process_cells_requests()
+
+        self.assertEqual(answered, [ (0, 0, 19, 9), (100, 0, 109, 9) ])
+
+        # those dropped are answered with no cells
+        sent = [ call[0][0] for call in instance._coms.send.call_args_list ]
+        self.assertEqual(len(sent), 3)
+        for response in sent:
+            self.assertFalse(response.incData)
+            self.assertEqual(len(response.data) + len(response.packedData), 0)
+        self.assertEqual(instance.stats['cells_requests'], 5)
+        self.assertEqual(instance.stats['cells_requests_dropped'], 3)
+
+    def test_packed_column(self):
+        dataset = self._instance._data.dataset
+        column = dataset.append_column('a')
+        column.measure_type = MeasureType.NOMINAL_TEXT
+        for value in range(1000):
+            column.append_level(value, 'id' + str(value))
+        dataset.set_row_count(1000)
+        column.write_range(0, array('i', range(1000)))
+        column[11] = -2147483648  # removes 'id11'
+
+        col_res = jcoms.DataSetRR.PackedColumn()
+        self._instance._populate_packed_column(column, 10, 4, col_res)
+
+        self.assertEqual(list(col_res.i), [ 10, -2147483648, 11, 12 ])
+        self.assertEqual(list(col_res.missing), [ 1 << 1 ])
+        # just the levels of these rows, not all 999
+        levels = [ (level.value, level.label) for level in col_res.levels ]
+        self.assertEqual(levels, [ (10, 'id10'), (11, 'id12'), (12, 'id13') ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+
+import unittest
+from unittest import mock
+
+import os.path
+import tempfile
+from array import array
+
+from jamovi.core import MemoryMap
+from jamovi.core import DataSet
+from jamovi.core import MeasureType
+from jamovi.server.formatio import omv
+
+
+class InstanceData:
+    def __init__(self):
+        self.analyses = [ ]
+        self.dataset = None
+        self.title = None
+        self.path = ''
+        self.instance_path = None
+
+
+class TestOMV(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._temp_path = self._temp_dir.name
+        self._mms = [ ]
+        self._slab_size = omv.SLAB_SIZE
+
+    def tearDown(self):
+        omv.SLAB_SIZE = self._slab_size
+        for mm in self._mms:
+            mm.close()
+        self._temp_dir.cleanup()
+
+    def _create_data(self):
+        buffer_path = os.path.join(self._temp_path, 'buffer' + str(len(self._mms)))
+        mm = MemoryMap.create(buffer_path, 65536)
+        self._mms.append(mm)
+
+        data = InstanceData()
+        data.dataset = DataSet.create(mm)
+        data.instance_path = self._temp_path
+        return data
+
+    def test_round_trip(self):
+        omv.SLAB_SIZE = 1000  # not a multiple of the row count
+
+        row_count = 5000
+
+        data = self._create_data()
+        dataset = data.dataset
+
+        continuous = dataset.append_column('continuous')
+        continuous.measure_type = MeasureType.CONTINUOUS
+        nominal = dataset.append_column('nominal')
+        nominal.append_level(3, '3')
+        nominal.append_level(7, '7')
+        text = dataset.append_column('text')
+        text.measure_type = MeasureType.NOMINAL_TEXT
+        text.append_level(0, 'a')
+        text.append_level(1, 'b')
+
+        dataset.set_row_count(row_count)
+        continuous.write_range(0, array('d', [ i / 4 for i in range(row_count) ]))
+        nominal.write_range(0, array('i', [ 3, 7, -2147483648, 3 ] * (row_count // 4)))
+        text.write_range(0, array('i', [ 0, 1 ] * (row_count // 2)))
+
+        progress = [ ]
+        path = os.path.join(self._temp_path, 'data.omv')
+        omv.write(data, path, prog_cb=lambda p, t: progress.append((p, t)))
+        self._check(path, row_count)
+
+        total = row_count * (8 + 4 + 4)
+        self.assertEqual(progress[-1], (total, total))
+        self.assertEqual(progress, sorted(progress))
+
+        stored_path = os.path.join(self._temp_path, 'stored.omv')
+        omv.write(data, stored_path, compress_level=0)
+        self.assertGreater(os.path.getsize(stored_path), os.path.getsize(path))
+        self._check(stored_path, row_count)
+
+    def test_older_zipfile(self):
+        # before python 3.7 (compresslevel) and 3.6 (ZipFile.open() for
+        # writing), data.bin goes through a temporary file
+
+        row_count = 1000
+
+        data = self._create_data()
+        dataset = data.dataset
+        continuous = dataset.append_column('continuous')
+        continuous.measure_type = MeasureType.CONTINUOUS
+        dataset.append_column('nominal').append_level(3, '3')
+        text = dataset.append_column('text')
+        text.measure_type = MeasureType.NOMINAL_TEXT
+        text.append_level(0, 'a')
+        text.append_level(1, 'b')
+        dataset.set_row_count(row_count)
+        continuous.write_range(0, array('d', [ i / 4 for i in range(row_count) ]))
+        text.write_range(0, array('i', [ 0, 1 ] * (row_count // 2)))
+
+        path = os.path.join(self._temp_path, 'older.omv')
+        with mock.patch.object(omv, 'ZIP_COMPRESSLEVEL', False), \
+                mock.patch.object(omv, 'ZIP_OPEN_WRITE', False):
+            omv.write(data, path, compress_level=1)
+
+        read = self._create_data()
+        omv.read(read, path)
+        self.assertEqual(read.dataset.row_count, row_count)
+        self.assertEqual(list(read.dataset[0]), [ i / 4 for i in range(row_count) ])
+        self.assertEqual(list(read.dataset[2])[:2], [ 'a', 'b' ])
+
+    def _check(self, path, row_count):
+
+        data = self._create_data()
+        omv.read(data, path)
+        dataset = data.dataset
+
+        self.assertEqual(dataset.row_count, row_count)
+        self.assertEqual(dataset.column_count, 3)
+
+        self.assertEqual(dataset[0].measure_type, MeasureType.CONTINUOUS)
+        self.assertEqual(dataset[0].dps, 2)
+        self.assertEqual(list(dataset[0]), [ i / 4 for i in range(row_count) ])
+
+        self.assertEqual(dataset[1].levels, [ (3, '3'), (7, '7') ])
+        self.assertEqual(list(dataset[1])[:4], [ 3, 7, -2147483648, 3 ])
+
+        self.assertEqual(dataset[2].levels, [ (0, 'a'), (1, 'b') ])
+        self.assertEqual(list(dataset[2])[-2:], [ 'a', 'b' ])
+
+
+if __name__ == '__main__':
+    unittest.main()
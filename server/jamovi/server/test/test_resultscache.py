@@ -0,0 +1,67 @@
+
+import unittest
+
+import os
+import os.path
+import tempfile
+
+from jamovi.server.resultscache import ResultsCache
+
+
+class TestResultsCache(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._temp_dir.name, 'results-cache')
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def test_get_put(self):
+        cache = ResultsCache(self._path, 1000)
+        key = ResultsCache.make_key('jmv', 'descriptives', b'\x01\x02')
+
+        self.assertIsNone(cache.get(key))
+        cache.put(key, b'results')
+        self.assertEqual(cache.get(key), b'results')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # the parts are delimited, so can't run together
+        self.assertNotEqual(
+            ResultsCache.make_key('ab', 'c'),
+            ResultsCache.make_key('a', 'bc'))
+
+        cache.discard(key)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(len(os.listdir(self._path)), 0)
+
+    def test_eviction(self):
+        cache = ResultsCache(self._path, 300)
+        for key in [ 'a', 'b', 'c' ]:
+            cache.put(key, b'x' * 100)
+
+        cache.get('a')  # makes 'b' the least recently used
+        cache.put('d', b'x' * 100)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertEqual(cache.size, 300)
+
+        cache.put('e', b'x' * 301)  # too big to cache
+        self.assertIsNone(cache.get('e'))
+
+    def test_persists(self):
+        cache = ResultsCache(self._path, 300)
+        cache.put('a', b'x' * 100)
+        cache.put('b', b'x' * 100)
+        os.utime(os.path.join(self._path, 'a'), (1, 1))
+        os.utime(os.path.join(self._path, 'b'), (2, 2))
+
+        cache = ResultsCache(self._path, 150)  # only room for the newest
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get('b'), b'x' * 100)
+        self.assertIsNone(cache.get('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+
+import unittest
+
+from jamovi.server import jamovi_pb2 as jcoms
+from jamovi.server.resultsdelta import make_delta
+
+
+def apply_delta(old, delta):
+    # what the client does with a delta (see client/main/instance.js);
+    # raises a ValueError if it doesn't apply to old
+    if delta.unchanged:
+        if old is None or old.name != delta.name:
+            raise ValueError('Results delta does not apply')
+        return old
+
+    kind = delta.WhichOneof('type')
+    if kind not in ('group', 'array'):
+        return delta
+
+    old_children = { }
+    if old is not None and old.WhichOneof('type') == kind:
+        for child in getattr(old, kind).elements:
+            old_children[child.name] = child
+
+    results = jcoms.ResultsElement()
+    results.CopyFrom(delta)
+    elements = getattr(results, kind).elements
+    del elements[:]
+    for child in getattr(delta, kind).elements:
+        elements.add().CopyFrom(apply_delta(old_children.get(child.name), child))
+
+    return results
+
+
+def make_results(rows, title='Descriptives'):
+    results = jcoms.ResultsElement()
+    results.name = 'root'
+    results.title = title
+
+    table = results.group.elements.add()
+    table.name = 'table'
+    column = table.table.columns.add()
+    column.name = 'mean'
+    for value in rows:
+        column.cells.add().d = value
+
+    plots = results.group.elements.add()
+    plots.name = 'plots'
+    plots.array.SetInParent()
+    for name in [ 'a', 'b' ]:
+        plot = plots.array.elements.add()
+        plot.name = name
+        plot.image.path = name + '.png'
+
+    return results
+
+
+class TestResultsDelta(unittest.TestCase):
+
+    def test_unchanged_left_out(self):
+        old = make_results([ 1, 2, 3 ])
+        new = make_results([ 1, 2, 4 ], 'Descriptive Statistics')
+
+        delta = make_delta(old, new)
+        self.assertEqual(delta.title, 'Descriptive Statistics')
+        table, plots = delta.group.elements
+        self.assertFalse(table.unchanged)
+        self.assertTrue(plots.unchanged)
+        self.assertEqual(plots.name, 'plots')
+        self.assertFalse(plots.HasField('array'))
+
+        self.assertEqual(apply_delta(old, delta), new)
+
+        delta = make_delta(new, new)
+        self.assertTrue(delta.unchanged)
+        self.assertEqual(apply_delta(new, delta), new)
+
+    def test_elements_added_and_removed(self):
+        old = make_results([ 1 ])
+        new = make_results([ 1 ])
+        del new.group.elements[1].array.elements[0]
+        plot = new.group.elements[1].array.elements.add()
+        plot.name = 'c'
+        plot.image.path = 'c.png'
+
+        delta = make_delta(old, new)
+        plots = delta.group.elements[1].array.elements
+        self.assertEqual([ plot.unchanged for plot in plots ], [ True, False ])
+        self.assertEqual(apply_delta(old, delta), new)
+
+    def test_does_not_apply(self):
+        old = make_results([ 1 ])
+        other = make_results([ 1 ])
+        other.name = 'other'
+
+        self.assertIsNone(make_delta(old, other))
+
+        delta = make_delta(old, make_results([ 2 ]))
+        with self.assertRaises(ValueError):
+            apply_delta(None, delta)
+
+
+if __name__ == '__main__':
+    unittest.main()